@@ -1 +1,2 @@
 __version__ = '0.1.0b'
+default_app_config = 'ej_conversations.apps.EjConversationsConfig'
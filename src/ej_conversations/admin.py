@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.utils.translation import ugettext_lazy as _
 
 from .models import Conversation, Category, Limits, Comment, Vote
+from .models import Stereotype, StereotypeVote
 
 register = (lambda model: lambda cfg: admin.site.register(model, cfg) or cfg)
 
@@ -11,11 +13,53 @@ class VoteInline(admin.TabularInline):
 
 @register(Comment)
 class CommentAdmin(admin.ModelAdmin):
-    fields = ['conversation', 'author', 'content', 'status', 'rejection_reason']
-    list_display = ['id', 'content', 'conversation', 'created', 'status']
+    fields = ['conversation', 'author', 'content', 'status', 'rejection_reason',
+              'similar_pending']
+    readonly_fields = ['similar_pending']
+    list_display = ['id', 'content', 'conversation', 'created', 'status',
+                    'similar_pending']
     list_editable = ['status', ]
     list_filter = ['conversation', 'status']
+    list_select_related = ['conversation']
     inlines = [VoteInline]
+    actions = ['approve_comments', 'reject_comments']
+
+    def similar_pending(self, obj):
+        if obj.id is None or not obj.minhash:
+            return ''
+        similar = obj.conversation.get_similar_comments(
+            obj, status=Comment.STATUS.PENDING, exclude={obj.id},
+        )
+        return ', '.join(str(pk) for pk, _ in similar)
+
+    similar_pending.short_description = _('Similar pending comments')
+
+    def approve_comments(self, request, queryset):
+        ids = queryset.values_list('id', flat=True)
+        updated = Comment.objects.moderate(ids, Comment.STATUS.APPROVED)
+        self.message_user(request, _('%s comments approved') % updated)
+
+    approve_comments.short_description = _('Approve selected comments')
+
+    def reject_comments(self, request, queryset):
+        ids = queryset.values_list('id', flat=True)
+        updated = Comment.objects.moderate(ids, Comment.STATUS.REJECTED)
+        self.message_user(request, _('%s comments rejected') % updated)
+
+    reject_comments.short_description = _('Reject selected comments')
+
+
+class StereotypeVoteInline(admin.TabularInline):
+    model = StereotypeVote
+    raw_id_fields = ['comment']
+
+
+@register(Stereotype)
+class StereotypeAdmin(admin.ModelAdmin):
+    fields = ['name', 'description', 'conversations']
+    list_display = ['id', 'name', 'description']
+    filter_horizontal = ['conversations']
+    inlines = [StereotypeVoteInline]
 
 
 @register(Limits)
@@ -0,0 +1,206 @@
+"""
+Recompute analytics of many conversations in parallel (requires numpy).
+
+Conversations are split into batches and each batch is analyzed by a worker
+process of a ProcessPoolExecutor, so the total runtime scales with the number
+of cores. For each conversation, workers sync its vote matrix, which loads all
+new votes in a single query, publish the matrix file shared by other analysis
+processes, and compute its statistics and comment scores. Workers return the
+results, which are cached by the parent process: values written to a
+process-local cache (e.g., LocMemCache) by workers would be lost.
+
+Completed conversations can be appended to a checkpoint file, so an
+interrupted run resumes where it stopped.
+"""
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging import getLogger
+
+import django
+from django.apps import apps
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+
+from . import caching
+from . import config
+from . import matrix
+from . import scores
+
+log = getLogger('ej-conversations.analysis')
+
+Result = namedtuple('Result', ['conversation_id', 'votes', 'error', 'data'])
+
+
+def analyze(conversation):
+    """
+    Recompute and cache the analytics of a conversation.
+
+    Return the number of votes in the vote matrix.
+    """
+    votes, data = compute_analysis(conversation)
+    cache.set(caching.analysis_key(conversation.id), data, config.ANALYSIS_CACHE_TIME)
+    return votes
+
+
+def compute_analysis(conversation):
+    """
+    Recompute the analytics of a conversation without caching them.
+
+    Return a tuple with the number of votes in the vote matrix and the
+    analytics, as returned by get_analysis().
+    """
+    vote_matrix = matrix.sync_matrix(conversation)
+    matrix.write_file(vote_matrix)
+    _, _, codes = matrix.arrays(vote_matrix)
+
+    ids, agree, disagree, skip = scores.vote_counts(conversation)
+    data = {
+        'statistics': conversation.get_statistics(),
+        'scores': {
+            name: dict(zip(ids.tolist(), values.tolist()))
+            for name, values in scores.get_scores(agree, disagree, skip).items()
+        },
+    }
+    return int((codes != matrix.NO_VOTE).sum()), data
+
+
+def get_analysis(conversation):
+    """
+    Return the cached analytics of a conversation, or None if they were not
+    computed yet.
+
+    The result is a dictionary with the output of Conversation.get_statistics()
+    under "statistics" and, under "scores", a dictionary that maps each score
+    name to a dictionary of {comment_id: score} for approved comments.
+    """
+    return cache.get(caching.analysis_key(conversation.id))
+
+
+def analyze_batch(conversation_ids):
+    """
+    Analyze the given conversations and return a list of Results.
+
+    Analytics are returned in the results and not cached. Errors are logged
+    and reported in the results, so a single broken conversation does not
+    abort the batch.
+    """
+    from .models import Conversation
+
+    close_old_connections()
+    results = []
+    try:
+        conversations = Conversation.objects.filter(id__in=conversation_ids).order_by('id')
+        for conversation in conversations:
+            try:
+                votes, data = compute_analysis(conversation)
+                results.append(Result(conversation.id, votes, None, data))
+            except Exception as exc:
+                log.exception(f'error analyzing conversation {conversation.id}')
+                results.append(Result(conversation.id, 0, repr(exc), None))
+    finally:
+        close_old_connections()
+    return results
+
+
+def store_results(results):
+    """
+    Cache the analytics of successful results.
+    """
+    cache.set_many({caching.analysis_key(result.conversation_id): result.data
+                    for result in results if not result.error},
+                   config.ANALYSIS_CACHE_TIME)
+
+
+def init_worker():
+    # Workers started with the "spawn" method must configure Django
+    # themselves. Forked workers inherit the connections of the parent, which
+    # must not be shared, so they are discarded before the first query.
+    if not apps.ready:
+        django.setup()
+    for connection in connections.all():
+        connection.close()
+
+
+def batches(ids, size):
+    for idx in range(0, len(ids), size):
+        yield ids[idx:idx + size]
+
+
+def run(conversation_ids, workers=None, batch_size=10):
+    """
+    Analyze conversations in a pool of worker processes.
+
+    Yield the list of Results of each batch as soon as it completes, after
+    caching its analytics. Batches are analyzed in the current process if
+    workers is 0.
+    """
+    matrix.require_numpy()
+    conversation_ids = list(conversation_ids)
+    if workers == 0:
+        for batch in batches(conversation_ids, batch_size):
+            results = analyze_batch(batch)
+            store_results(results)
+            yield results
+        return
+
+    # Close connections of the parent, so forked workers do not inherit them.
+    connections.close_all()
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        futures = [executor.submit(analyze_batch, batch)
+                   for batch in batches(conversation_ids, batch_size)]
+        for future in as_completed(futures):
+            results = future.result()
+            store_results(results)
+            yield results
+
+
+#
+# Checkpoints
+#
+def read_checkpoint(path):
+    """
+    Return the set of conversation ids stored in a checkpoint file.
+    """
+    try:
+        with open(path) as file:
+            return {int(line) for line in file if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def write_checkpoint(path, conversation_ids):
+    """
+    Append conversation ids to a checkpoint file.
+    """
+    with open(path, 'a') as file:
+        file.writelines(f'{pk}\n' for pk in conversation_ids)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+class Throughput:
+    """
+    Track the number of analyzed conversations and votes per second.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.conversations = 0
+        self.votes = 0
+
+    def add(self, results):
+        self.conversations += len(results)
+        self.votes += sum(result.votes for result in results)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def __str__(self):
+        elapsed = max(self.elapsed, 1e-9)
+        return (f'{self.conversations} conversations, {self.votes} votes in '
+                f'{self.elapsed:.1f}s ({self.conversations / elapsed:.1f} '
+                f'conversations/s, {self.votes / elapsed:.0f} votes/s)')
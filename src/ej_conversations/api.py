@@ -7,6 +7,7 @@ def register_routes(router, register_user=False):
     register(r'conversations', viewsets.ConversationViewSet, base_name='conversation')
     register(r'comments', viewsets.CommentViewSet, base_name='comment')
     register(r'votes', viewsets.VoteViewSet, base_name='vote')
+    register(r'stereotypes', viewsets.StereotypeViewSet, base_name='stereotype')
 
     if register_user:
         register(r'users', viewsets.UserViewSet, base_name='user')
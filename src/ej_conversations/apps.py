@@ -7,6 +7,12 @@ class EjConversationsConfig(AppConfig):
     verbose_name = "EJ Conversations"
 
     def ready(self):
+        from . import config, signals  # noqa: F401
+
+        if config.INSTRUMENTATION_SINK:
+            from . import instrumentation
+
+            instrumentation.install()
 
         if getattr(settings, 'EJ_CONVERSATIONS_ACTSTREAM', False):
             from actstream import registry
@@ -0,0 +1,357 @@
+"""
+Archive the votes of inactive conversations.
+
+Archiving moves all votes of a conversation from the vote table into a
+single zlib-compressed blob stored in VoteArchive. The hot vote table and its
+indexes then hold only the votes of active conversations.
+
+Votes are stored in blocks of up to BLOCK_SIZE rows, each holding one array
+per column, so the blob is decompressed incrementally and readers only keep
+one block in memory. Blobs of the older single-block format are still read.
+
+The votes of each participant are also stored in an ArchivedParticipant, so
+the votes of a single user are read without decoding the whole archive.
+Statistics read vote counts from the archive and from denormalized counters
+on comments. Exports decode the blob. Code that reads the votes of a user must
+include the votes returned by :func:`archived_votes`.
+
+Archived conversations keep accepting votes. Votes for comments without
+archived votes are stored in the vote table next to the archive, and the
+first vote for a comment with archived votes restores the archive.
+"""
+import datetime
+import struct
+import sys
+import zlib
+from array import array
+from itertools import chain, groupby, islice
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from .models import ArchivedParticipant, Comment, Conversation, Vote, VoteArchive
+
+MAGIC = b'EJV2'
+BLOCK = struct.Struct('<I')
+BLOCK_SIZE = 4096
+COLUMNS = (('id', 'q'), ('author', 'q'), ('comment', 'q'), ('value', 'b'),
+           ('created', 'd'))
+ROW_SIZE = sum(array(code).itemsize for _, code in COLUMNS)
+
+# Size of the compressed pieces fed to the decompressor
+CHUNK_SIZE = 64 * 1024
+
+# Format of archives created before votes were split in blocks
+LEGACY_MAGIC = b'EJV1'
+LEGACY_HEADER = struct.Struct('<4sI')
+
+
+#
+# Encoding
+#
+def encode(rows):
+    """
+    Encode an iterable of (id, author_id, comment_id, value, created) tuples
+    as a compressed blob.
+    """
+    compressor = zlib.compressobj()
+    chunks = [compressor.compress(MAGIC)]
+    rows = iter(rows)
+    while True:
+        block = list(islice(rows, BLOCK_SIZE))
+        if not block:
+            break
+        chunks.append(compressor.compress(encode_block(block)))
+    chunks.append(compressor.flush())
+    return b''.join(chunks)
+
+
+def encode_block(rows):
+    columns = [array(code) for _, code in COLUMNS]
+    for pk, author, comment, value, created in rows:
+        columns[0].append(pk)
+        columns[1].append(author)
+        columns[2].append(comment)
+        columns[3].append(value)
+        columns[4].append(created.timestamp())
+
+    chunks = [BLOCK.pack(len(rows))]
+    for column in columns:
+        if sys.byteorder == 'big':
+            column.byteswap()
+        chunks.append(column.tobytes())
+    return b''.join(chunks)
+
+
+def decode(data):
+    """
+    Decode a blob created by encode() into a list of (id, author_id,
+    comment_id, value, created) tuples.
+    """
+    return list(iter_decode(data))
+
+
+def iter_decode(data):
+    """
+    Iterate over the rows stored in a blob created by encode().
+
+    The blob is decompressed in pieces of CHUNK_SIZE bytes and rows are
+    yielded one block at a time.
+    """
+    pieces = decompress(data)
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= len(MAGIC):
+            break
+
+    magic = bytes(buffer[:len(MAGIC)])
+    if magic == LEGACY_MAGIC:
+        buffer += b''.join(pieces)
+        _, size = LEGACY_HEADER.unpack_from(buffer)
+        yield from decode_block(buffer, LEGACY_HEADER.size, size)
+        return
+    if magic != MAGIC:
+        raise ValueError('invalid vote archive')
+
+    offset = len(MAGIC)
+    for piece in chain([b''], pieces):
+        buffer += piece
+        while len(buffer) - offset >= BLOCK.size:
+            (size,) = BLOCK.unpack_from(buffer, offset)
+            end = offset + BLOCK.size + size * ROW_SIZE
+            if len(buffer) < end:
+                break
+            yield from decode_block(buffer, offset + BLOCK.size, size)
+            offset = end
+        del buffer[:offset]
+        offset = 0
+    if buffer:
+        raise ValueError('truncated vote archive')
+
+
+def decompress(data):
+    """
+    Iterate over the decompressed pieces of a zlib-compressed blob.
+    """
+    decompressor = zlib.decompressobj()
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        piece = decompressor.decompress(view[start:start + CHUNK_SIZE])
+        if piece:
+            yield piece
+    piece = decompressor.flush()
+    if piece:
+        yield piece
+
+
+def decode_block(data, offset, size):
+    """
+    Return the list of rows of a block with the given number of rows that
+    starts at offset.
+    """
+    columns = []
+    for _, code in COLUMNS:
+        column = array(code)
+        end = offset + size * column.itemsize
+        column.frombytes(data[offset:end])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns.append(column)
+        offset = end
+
+    utc = datetime.timezone.utc
+    fromtimestamp = datetime.datetime.fromtimestamp
+    return [(pk, author, comment, value, fromtimestamp(created, utc))
+            for pk, author, comment, value, created in zip(*columns)]
+
+
+#
+# Archival
+#
+def inactive_conversations(days):
+    """
+    Return a queryset with conversations that have votes in the vote table,
+    but received no votes nor comments in the given number of days.
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    return (
+        Conversation.objects
+            .annotate(last_vote=Max('comments__votes__created'),
+                      last_comment=Max('comments__created'))
+            .filter(last_vote__lt=cutoff, last_comment__lt=cutoff)
+    )
+
+
+def get_archive(conversation):
+    """
+    Return the VoteArchive of conversation, or None.
+    """
+    return VoteArchive.objects.filter(conversation_id=conversation.id).first()
+
+
+def archive_conversation(conversation):
+    """
+    Move all votes of the conversation to its archive.
+
+    Votes are read and encoded in blocks, so memory usage does not depend on
+    the number of votes. Votes archived before are restored and archived
+    again with the new ones. Return the number of archived votes.
+    """
+    with transaction.atomic():
+        restore_conversation(conversation)
+        votes = Vote.objects.filter(comment__conversation_id=conversation.id)
+        last_id = votes.aggregate(last_id=Max('id'))['last_id']
+        if last_id is None:
+            return 0
+        votes = votes.filter(id__lte=last_id)
+        rows = (
+            votes
+                .select_for_update()
+                .order_by('author_id', 'id')
+                .values_list('id', 'author_id', 'comment_id', 'value', 'created')
+                .iterator(chunk_size=BLOCK_SIZE)
+        )
+        archive = VoteArchive(conversation=conversation)
+        archive.data = encode(index_rows(rows, archive))
+        archive.save()
+
+        add_comment_counters(votes)
+        delete_votes(conversation, last_id)
+    return archive.total
+
+
+def index_rows(rows, archive):
+    """
+    Yield the given vote rows, sorted by author, while counting them in
+    archive and storing the votes of each author in ArchivedParticipant
+    instances.
+    """
+    participants = []
+    for author, group in groupby(rows, key=lambda row: row[1]):
+        votes = []
+        for row in group:
+            name = Vote.VOTE_NAMES[row[3]]
+            setattr(archive, name, getattr(archive, name) + 1)
+            votes.append(row)
+            yield row
+        archive.participants += 1
+        participants.append(ArchivedParticipant(
+            conversation_id=archive.conversation_id, author_id=author,
+            votes=len(votes), data=encode(votes),
+        ))
+        if len(participants) >= BLOCK_SIZE:
+            ArchivedParticipant.objects.bulk_create(participants)
+            participants = []
+    ArchivedParticipant.objects.bulk_create(participants)
+
+
+def delete_votes(conversation, last_id):
+    """
+    Delete the votes of a conversation up to the given id.
+
+    A plain DELETE statement is used on purpose: votes deleted with the ORM
+    send post_delete signals, which would report the archived votes as
+    removed to live streams and invalidate caches whose values did not
+    change.
+    """
+    ops = connection.ops
+    vote_table = ops.quote_name(Vote._meta.db_table)
+    comment_table = ops.quote_name(Comment._meta.db_table)
+    vote_id = ops.quote_name(Vote._meta.pk.column)
+    comment_id = ops.quote_name(Comment._meta.pk.column)
+    comment_column = ops.quote_name(Vote._meta.get_field('comment').column)
+    conversation_column = ops.quote_name(Comment._meta.get_field('conversation').column)
+    sql = (
+        f'DELETE FROM {vote_table} '
+        f'WHERE {comment_column} IN ('
+        f'SELECT {comment_id} FROM {comment_table} WHERE {conversation_column} = %s'
+        f') AND {vote_id} <= %s'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [conversation.id, last_id])
+
+
+def restore_conversation(conversation):
+    """
+    Move archived votes back to the vote table and delete the archive.
+
+    Votes are decoded and inserted in blocks. Return the number of restored
+    votes.
+    """
+    with transaction.atomic():
+        archive = get_archive(conversation)
+        if archive is None:
+            return 0
+        rows = iter_decode(archive.data)
+        restored = 0
+        while True:
+            block = list(islice(rows, BLOCK_SIZE))
+            if not block:
+                break
+            Vote.objects.bulk_create(
+                [Vote(id=pk, author_id=author, comment_id=comment, value=value,
+                      created=created)
+                 for pk, author, comment, value, created in block],
+                ignore_conflicts=True,
+            )
+            restored += len(block)
+        Comment.objects.filter(conversation_id=conversation.id).update(
+            archived_agree=0, archived_disagree=0, archived_skip=0,
+        )
+        ArchivedParticipant.objects.filter(conversation_id=conversation.id).delete()
+        archive.delete()
+    return restored
+
+
+def add_comment_counters(votes):
+    """
+    Add the counts of the given votes to the archived vote counters of their
+    comments.
+    """
+    counts = (
+        votes
+            .order_by()
+            .values('comment_id')
+            .annotate(agree=Count('id', filter=Q(value=Vote.AGREE)),
+                      disagree=Count('id', filter=Q(value=Vote.DISAGREE)),
+                      skip=Count('id', filter=Q(value=Vote.SKIP)))
+    )
+    for row in counts:
+        Comment.objects.filter(id=row['comment_id']).update(
+            archived_agree=F('archived_agree') + row['agree'],
+            archived_disagree=F('archived_disagree') + row['disagree'],
+            archived_skip=F('archived_skip') + row['skip'],
+        )
+
+
+#
+# Reading
+#
+def archived_rows(conversation):
+    """
+    Return an iterator over the (id, author_id, comment_id, value, created)
+    tuples of archived votes in the conversation.
+
+    The archive is decoded incrementally while the iterator is consumed.
+    """
+    archive = get_archive(conversation)
+    return iter_decode(archive.data) if archive is not None else iter(())
+
+
+def archived_votes(user, conversation_ids=None):
+    """
+    Return a dictionary mapping conversation ids to lists of (id, author_id,
+    comment_id, value, created) tuples with the archived votes of user.
+
+    Conversation_ids may be a list or a queryset of ids. Only the votes of
+    the user are decoded, in a single query.
+    """
+    participants = ArchivedParticipant.objects.filter(author_id=user.id)
+    if conversation_ids is not None:
+        participants = participants.filter(conversation_id__in=conversation_ids)
+    return {
+        conversation_id: decode(data)
+        for conversation_id, data in participants.values_list('conversation_id', 'data')
+    }
@@ -0,0 +1,75 @@
+"""
+Cache keys and invalidation of cached values.
+"""
+from django.core.cache import cache
+
+
+def participation_key(user_id):
+    return f'ej_conversations:participation:{user_id}'
+
+
+def progress_key(user_id):
+    return f'ej_conversations:progress:{user_id}'
+
+
+def analysis_key(conversation_id):
+    return f'ej_conversations:analysis:{conversation_id}'
+
+
+def conversation_key(slug):
+    return f'ej_conversations:conversation:{slug}'
+
+
+def statistics_key(conversation_id):
+    return f'ej_conversations:statistics:{conversation_id}'
+
+
+def category_statistics_key():
+    return 'ej_conversations:category-statistics'
+
+
+def category_names_key():
+    return 'ej_conversations:category-names'
+
+
+def invalidate_user(user_id):
+    """
+    Discard all cached values computed for the given user.
+    """
+    invalidate_users([user_id])
+
+
+def invalidate_users(user_ids):
+    """
+    Discard all cached values computed for the given users.
+    """
+    keys = []
+    for user_id in user_ids:
+        keys.extend([participation_key(user_id), progress_key(user_id)])
+    cache.delete_many(keys)
+
+
+def invalidate_conversations(slugs):
+    """
+    Discard the cached representations of the conversations with the given
+    slugs.
+    """
+    cache.delete_many([conversation_key(slug) for slug in slugs])
+
+
+def invalidate_statistics(conversation_id):
+    """
+    Discard the cached statistics of a conversation.
+    """
+    cache.delete(statistics_key(conversation_id))
+
+
+def invalidate_categories(names=False):
+    """
+    Discard the cached conversation counts of categories and, if names is
+    True, the cached category names.
+    """
+    keys = [category_statistics_key()]
+    if names:
+        keys.append(category_names_key())
+    cache.delete_many(keys)
@@ -0,0 +1,90 @@
+"""
+Run independent database queries concurrently.
+
+Django 2.2 has no async views nor an async ORM, so queries are offloaded to
+a thread pool instead. Each worker thread holds its own database connection,
+and a request waits only as long as its slowest query instead of the sum of
+all of them.
+
+Concurrency is disabled unless CONVERSATION_QUERY_WORKERS is set. It is also
+skipped inside transactions, because worker connections would not see
+uncommitted changes, and when the database has CONN_MAX_AGE = 0, because
+workers would open a new connection for every query. Both are checked on the
+database the queries are routed to, which may be a replica (see
+:mod:`ej_conversations.routers`).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+from . import config
+from . import instrumentation
+from . import routers
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the shared thread pool, creating it on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=config.QUERY_WORKERS,
+                thread_name_prefix='ej-conversations-query',
+            )
+        return _executor
+
+
+def shutdown():
+    """
+    Wait for running queries and discard the thread pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def is_enabled(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if not config.QUERY_WORKERS or connection.in_atomic_block:
+        return False
+    return connection.settings_dict['CONN_MAX_AGE'] != 0
+
+
+def run_concurrently(*funcs, using=DEFAULT_DB_ALIAS):
+    """
+    Call each function in a worker thread and return the list of results.
+
+    Functions are called sequentially in the current thread if concurrency is
+    disabled, connections to the given database alias are not persistent or
+    a transaction is open on it. Using must be the alias the router picks for
+    the queries, e.g., ``router.db_for_read(Vote, replica=True)`` for queries
+    on replica querysets.
+    """
+    if not is_enabled(using) or len(funcs) < 2:
+        return [func() for func in funcs]
+    executor = get_executor()
+    state = routers.get_state()
+    trackers = instrumentation.get_trackers()
+    futures = [executor.submit(call_in_worker, func, state, trackers) for func in funcs]
+    return [future.result() for future in futures]
+
+
+def call_in_worker(func, state, trackers=()):
+    # Worker connections persist between tasks, so they are subject to the
+    # same CONN_MAX_AGE and error handling as connections of request threads.
+    # Workers also follow the replica routing state of the calling thread and
+    # report queries to its instrumentation trackers.
+    close_old_connections()
+    try:
+        with routers.restore_state(state), instrumentation.track_queries(*trackers):
+            return func()
+    finally:
+        close_old_connections()
@@ -1,7 +1,142 @@
 from django.conf import settings
 
 # Statistics configuration
-# you can override this variable in django settings variable MATH_REFRESH_TIME
-# passing a integer value in seconds
+# Number of seconds between full recomputations of the statistics snapshot of
+# live streams (CONVERSATION_STATISTICS_REFRESH_TIME). Between refreshes, the
+# snapshot is updated with deltas, which miss writes made by other processes,
+# bulk imports and archiving. Set to 0 to never refresh.
 STATISTICS_REFRESH_TIME = \
-    getattr(settings, 'CONVERSATION_STATISTICS_REFRESH_TIME', 0)
+    getattr(settings, 'CONVERSATION_STATISTICS_REFRESH_TIME', 60)
+
+# Participation ratios
+# Number of seconds the participation ratios of a user are cached. The cache is
+# invalidated when the user votes or comments, so this only limits how long
+# changes made by moderators and other users take to show up.
+PARTICIPATION_CACHE_TIME = \
+    getattr(settings, 'CONVERSATION_PARTICIPATION_CACHE_TIME', 5 * 60)
+
+# Categories
+# Number of seconds the conversation counts and names of categories are
+# cached (CONVERSATION_CATEGORY_CACHE_TIME). The cache is invalidated when
+# categories or conversations change, so this only limits how long vote counts
+# take to show up.
+CATEGORY_CACHE_TIME = \
+    getattr(settings, 'CONVERSATION_CATEGORY_CACHE_TIME', 5 * 60)
+
+# Conversation details
+# Number of seconds the representation of a conversation in the API
+# (CONVERSATION_DETAIL_CACHE_TIME) and its statistics
+# (CONVERSATION_STATISTICS_CACHE_TIME) are cached. Both are invalidated when
+# the conversation, its category, comments or votes change, so these only
+# limit how long changes to authors take to show up.
+DETAIL_CACHE_TIME = \
+    getattr(settings, 'CONVERSATION_DETAIL_CACHE_TIME', 60 * 60)
+STATISTICS_CACHE_TIME = \
+    getattr(settings, 'CONVERSATION_STATISTICS_CACHE_TIME', 10 * 60)
+
+# Comment routing
+# Strategy used by get_next_comment() to choose the next comment shown to a
+# participant: 'uniform', 'fewest_votes', 'divisiveness' or 'recency'
+# (CONVERSATION_ROUTING_STRATEGY). Comment weights are recomputed in the
+# background every CONVERSATION_ROUTING_REFRESH_TIME seconds. The 'recency'
+# strategy halves the weight of a comment every
+# CONVERSATION_ROUTING_HALF_LIFE seconds after its approval.
+ROUTING_STRATEGY = \
+    getattr(settings, 'CONVERSATION_ROUTING_STRATEGY', 'uniform')
+ROUTING_REFRESH_TIME = \
+    getattr(settings, 'CONVERSATION_ROUTING_REFRESH_TIME', 60)
+ROUTING_HALF_LIFE = \
+    getattr(settings, 'CONVERSATION_ROUTING_HALF_LIFE', 24 * 60 * 60)
+
+# Trending conversations
+# Weights of each vote (CONVERSATION_TRENDING_VOTE_WEIGHT) and comment
+# (CONVERSATION_TRENDING_COMMENT_WEIGHT) in the trending score of a
+# conversation, which are halved every CONVERSATION_TRENDING_HALF_LIFE seconds.
+# Run "manage.py recomputetrending" after changing any of these values.
+TRENDING_VOTE_WEIGHT = \
+    getattr(settings, 'CONVERSATION_TRENDING_VOTE_WEIGHT', 1.0)
+TRENDING_COMMENT_WEIGHT = \
+    getattr(settings, 'CONVERSATION_TRENDING_COMMENT_WEIGHT', 5.0)
+TRENDING_HALF_LIFE = \
+    getattr(settings, 'CONVERSATION_TRENDING_HALF_LIFE', 24 * 60 * 60)
+
+# Concurrent queries
+# Number of worker threads used to run independent queries of a request
+# (e.g., the counts in get_statistics()) concurrently. Each worker keeps its
+# own database connection, which requires persistent connections: queries
+# run in the request thread when CONN_MAX_AGE is 0, since opening a new
+# connection for each query costs more than it saves. Set
+# CONVERSATION_QUERY_WORKERS to 0 to run all queries in the request thread.
+QUERY_WORKERS = \
+    getattr(settings, 'CONVERSATION_QUERY_WORKERS', 0)
+
+# Read replica
+# Alias of a read-only replica database that receives statistics, listing and
+# export queries (CONVERSATION_REPLICA_DATABASE). Requires
+# 'ej_conversations.routers.ReplicaRouter' in DATABASE_ROUTERS.
+REPLICA_DATABASE = \
+    getattr(settings, 'CONVERSATION_REPLICA_DATABASE', None)
+
+# Live statistics streams
+# Seconds between keepalive comments sent to idle event-stream subscribers
+# (CONVERSATION_STREAM_KEEPALIVE) and the maximum number of pending events
+# buffered for each subscriber (CONVERSATION_STREAM_QUEUE_SIZE).
+STREAM_KEEPALIVE = \
+    getattr(settings, 'CONVERSATION_STREAM_KEEPALIVE', 15)
+STREAM_QUEUE_SIZE = \
+    getattr(settings, 'CONVERSATION_STREAM_QUEUE_SIZE', 100)
+
+# Near-duplicate detection
+# Minimum estimated Jaccard similarity between two comments for them to be
+# considered near-duplicates (CONVERSATION_SIMILARITY_THRESHOLD), the number
+# of seconds before an in-memory similarity index is rebuilt to pick up
+# changes made by other processes (CONVERSATION_SIMILARITY_REFRESH_TIME) and
+# the maximum number of indexes kept in memory
+# (CONVERSATION_SIMILARITY_MAX_INDEXES).
+SIMILARITY_THRESHOLD = \
+    getattr(settings, 'CONVERSATION_SIMILARITY_THRESHOLD', 0.5)
+SIMILARITY_REFRESH_TIME = \
+    getattr(settings, 'CONVERSATION_SIMILARITY_REFRESH_TIME', 60)
+SIMILARITY_MAX_INDEXES = \
+    getattr(settings, 'CONVERSATION_SIMILARITY_MAX_INDEXES', 200)
+
+# Moderation queue
+# Number of seconds a moderator holds a claimed batch of pending comments
+# before other moderators can claim them (CONVERSATION_MODERATION_LEASE_TIME).
+MODERATION_LEASE_TIME = \
+    getattr(settings, 'CONVERSATION_MODERATION_LEASE_TIME', 5 * 60)
+
+# Exports
+# Number of rows fetched from the database server-side cursor in each round
+# trip when exporting votes and comments (CONVERSATION_EXPORT_CHUNK_SIZE).
+EXPORT_CHUNK_SIZE = \
+    getattr(settings, 'CONVERSATION_EXPORT_CHUNK_SIZE', 2000)
+
+# Instrumentation
+# Record query count, database time and wall time of model methods and
+# viewset actions. Set CONVERSATION_INSTRUMENTATION_SINK to 'logging',
+# 'memory', 'prometheus' or the dotted path of a sink class to enable it.
+# CONVERSATION_INSTRUMENTATION_BUFFER_SIZE controls how many measurements the
+# 'memory' sink keeps. The Prometheus metrics view only serves staff users
+# unless CONVERSATION_INSTRUMENTATION_PUBLIC_METRICS is True, e.g., when the
+# URL is only reachable from the scraper's network.
+INSTRUMENTATION_SINK = \
+    getattr(settings, 'CONVERSATION_INSTRUMENTATION_SINK', None)
+INSTRUMENTATION_BUFFER_SIZE = \
+    getattr(settings, 'CONVERSATION_INSTRUMENTATION_BUFFER_SIZE', 1000)
+INSTRUMENTATION_PUBLIC_METRICS = \
+    getattr(settings, 'CONVERSATION_INSTRUMENTATION_PUBLIC_METRICS', False)
+
+# Vote matrices
+# Directory that holds the memory-mapped vote matrix files shared by analysis
+# workers (CONVERSATION_MATRIX_DIR). Defaults to "vote-matrices" inside
+# MEDIA_ROOT.
+MATRIX_DIR = \
+    getattr(settings, 'CONVERSATION_MATRIX_DIR', None)
+
+# Analysis
+# Number of seconds the analytics computed by the "analyzeconversations"
+# command are cached (CONVERSATION_ANALYSIS_CACHE_TIME). The default keeps
+# results of a nightly run until the next one finishes.
+ANALYSIS_CACHE_TIME = \
+    getattr(settings, 'CONVERSATION_ANALYSIS_CACHE_TIME', 2 * 24 * 60 * 60)
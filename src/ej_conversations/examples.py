@@ -1,15 +1,30 @@
 """
 A few functions for creating plausible synthetic data.
 """
-from django.contrib.auth import get_user_model
-from random import choice
+import time
+from random import Random, choice
 
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import Model
+from django.utils import timezone
 
-from .models import Category
+from .importers import insert_votes
+from .models import Category, Comment, Conversation, Vote
+from .utils import content_hash
 
 User = get_user_model()
 
+WORDS = (
+    'school', 'health', 'park', 'bus', 'library', 'street', 'tax', 'market',
+    'water', 'police', 'bike', 'garden', 'hospital', 'job', 'housing', 'art',
+    'museum', 'river', 'safety', 'light', 'noise', 'trash', 'internet', 'rent',
+)
+VERBS = (
+    'needs more', 'should have less', 'deserves better', 'must improve',
+    'should be free for', 'needs to listen to', 'must be closer to',
+)
+
 
 class ExampleData:
     def __init__(self, users, verbose):
@@ -17,7 +32,7 @@ class ExampleData:
         self.staff_users = [x for x in self.users if x.is_staff]
         self.verbose = verbose
         if verbose:
-            self.log = (lambda x: 'Created: %s' % x)
+            self.log = (lambda x: print('Created: %s' % x))
         else:
             self.log = (lambda x: None)
 
@@ -50,6 +65,157 @@ class ExampleData:
         return choice(self.staff_users)
 
 
+class SyntheticData:
+    """
+    Generate large synthetic datasets for load testing.
+
+    Users are split into opinion groups. Each comment is favored by one group,
+    whose members tend to agree with it, while other groups tend to disagree.
+    The generated content only depends on the arguments, including the seed.
+
+    Args:
+        conversations: number of conversations.
+        comments: number of approved comments per conversation.
+        users: number of participants.
+        density: probability that a user votes on any given comment.
+        groups: number of opinion groups.
+        seed: random seed.
+        signatures: compute the MinHash signatures of comments. Disable it to
+            speed up generation when near-duplicate detection is not needed.
+        verbose: print progress information.
+    """
+
+    def __init__(self, conversations=10, comments=100, users=1000,
+                 density=0.5, groups=3, seed=0, signatures=True,
+                 verbose=False, batch_size=10000):
+        self.n_conversations = conversations
+        self.n_comments = comments
+        self.n_users = users
+        self.density = density
+        self.n_groups = max(groups, 1)
+        self.seed = seed
+        self.signatures = signatures
+        self.verbose = verbose
+        self.batch_size = batch_size
+        self.random = Random(seed)
+
+    def log(self, msg):
+        if self.verbose:
+            print(msg)
+
+    def make_all(self):
+        """
+        Create all objects and return a list of conversations.
+        """
+        start = time.time()
+        with transaction.atomic():
+            users = self.make_users()
+            groups = [self.random.randrange(self.n_groups) for _ in users]
+            category, _ = Category.objects.get_or_create(name='Synthetic')
+            conversations = self.make_conversations(category, users)
+            n_votes = 0
+            for conversation in conversations:
+                comments = self.make_comments(conversation, users)
+                n_votes += self.make_votes(conversation, comments, users, groups)
+        self.log(f'Created {len(users)} users, {len(conversations)} conversations, '
+                 f'{len(conversations) * self.n_comments} comments and '
+                 f'{n_votes} votes in {time.time() - start:.1f}s')
+        return conversations
+
+    def make_users(self):
+        """
+        Create users and return a list with their ids.
+        """
+        prefix = f'synthetic-{self.seed}-'
+        users = []
+        for i in range(self.n_users):
+            user = User(username=f'{prefix}{i}')
+            user.set_unusable_password()
+            users.append(user)
+        User.objects.bulk_create(users, ignore_conflicts=True)
+        ids = dict(User.objects
+                   .filter(username__startswith=prefix)
+                   .values_list('username', 'id'))
+        return [ids[user.username] for user in users]
+
+    def make_conversations(self, category, users):
+        conversations = [
+            Conversation(
+                title=f'Synthetic conversation {self.seed}-{i}',
+                question=self.make_sentence() + '?',
+                author_id=self.random.choice(users),
+                category=category,
+            )
+            for i in range(self.n_conversations)
+        ]
+        # Auto slug fields are only filled on save()
+        for conversation in conversations:
+            conversation.save()
+            self.log(f'Created: {conversation}')
+        return conversations
+
+    def make_comments(self, conversation, users):
+        """
+        Create comments and return a list of (id, author_id, favored_group)
+        tuples.
+        """
+        comments = []
+        for i in range(self.n_comments):
+            comment = Comment(
+                conversation=conversation,
+                author_id=self.random.choice(users),
+                content=f'{self.make_sentence()} (#{i})',
+                status=Comment.STATUS.APPROVED,
+            )
+            if self.signatures:
+                comment.update_fingerprints()
+            else:
+                comment.content_hash = content_hash(comment.content)
+            comments.append(comment)
+        Comment.objects.bulk_create(comments)
+
+        ids = dict(Comment.objects
+                   .filter(conversation=conversation)
+                   .values_list('content', 'id'))
+        return [(ids[c.content], c.author_id, self.random.randrange(self.n_groups))
+                for c in comments]
+
+    def make_votes(self, conversation, comments, users, groups):
+        """
+        Cast votes from users to comments according to their opinion groups.
+        """
+        rand = self.random.random
+        now = timezone.now()
+        batch = []
+        n_votes = 0
+        for user, group in zip(users, groups):
+            for comment, author, favored in comments:
+                if author == user or rand() >= self.density:
+                    continue
+                batch.append((user, comment, self.make_vote(group == favored), now))
+                if len(batch) >= self.batch_size:
+                    insert_votes(batch, conversation.id)
+                    n_votes += len(batch)
+                    batch = []
+        if batch:
+            insert_votes(batch, conversation.id)
+        return n_votes + len(batch)
+
+    def make_vote(self, is_favored):
+        x = self.random.random()
+        if x < 0.1:
+            return Vote.SKIP
+        elif (x < 0.8) == is_favored:
+            return Vote.AGREE
+        else:
+            return Vote.DISAGREE
+
+    def make_sentence(self):
+        subject, complement = self.random.sample(WORDS, 2)
+        verb = self.random.choice(VERBS)
+        return f'The {subject} {verb} {complement}'.capitalize()
+
+
 def make_examples(users=None, verbose=False):
     """
     Takes a list of users and creates plausible synthetic data.
@@ -59,3 +225,11 @@ def make_examples(users=None, verbose=False):
 
     data = ExampleData(users, verbose)
     data.make_all()
+
+
+def make_synthetic_data(verbose=False, **kwargs):
+    """
+    Create a large synthetic dataset. Accepts the same arguments as
+    :class:`SyntheticData`.
+    """
+    return SyntheticData(verbose=verbose, **kwargs).make_all()
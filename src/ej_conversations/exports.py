@@ -0,0 +1,177 @@
+"""
+Streaming exports of the votes and comments of a conversation.
+
+Rows are read through server-side cursors and encoded chunk by chunk, so
+memory usage does not depend on the size of the conversation. Supported
+formats are CSV, JSON Lines and Parquet (requires pyarrow).
+"""
+import csv
+import io
+import json
+from itertools import chain, islice
+
+from . import config
+from .archive import archived_rows
+from .models import Comment, Vote
+from .routers import on_replica
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+VOTE_FIELDS = ('id', 'author', 'comment', 'value', 'created')
+COMMENT_FIELDS = ('id', 'author', 'content', 'status', 'rejection_reason',
+                  'created')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+FORMATS = tuple(CONTENT_TYPES)
+KINDS = ('votes', 'comments')
+
+
+def vote_rows(conversation, chunk_size=None):
+    """
+    Iterate over (id, author, comment, value, created) tuples for all votes
+    in the conversation, starting with archived votes.
+    """
+    queryset = (
+        Vote.objects
+            .filter(comment__conversation_id=conversation.id)
+            .order_by()
+            .values_list('id', 'author_id', 'comment_id', 'value', 'created')
+    )
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    live = on_replica(queryset).iterator(chunk_size=chunk_size)
+    return chain(archived_rows(conversation), live)
+
+
+def comment_rows(conversation, chunk_size=None):
+    """
+    Iterate over (id, author, content, status, rejection_reason, created)
+    tuples for all comments in the conversation.
+    """
+    queryset = (
+        Comment.objects
+            .filter(conversation_id=conversation.id)
+            .order_by()
+            .values_list('id', 'author_id', 'content', 'status',
+                         'rejection_reason', 'created')
+    )
+    return on_replica(queryset).iterator(chunk_size=chunk_size or config.EXPORT_CHUNK_SIZE)
+
+
+def export(conversation, kind='votes', format='csv', chunk_size=None):
+    """
+    Return an iterator over the encoded chunks of an export of the votes or
+    comments of conversation.
+
+    Text formats yield strings, Parquet yields bytes.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'invalid kind of data: {kind!r}')
+    if format not in FORMATS:
+        raise ValueError(f'invalid export format: {format!r}')
+    if format == 'parquet' and pyarrow is None:
+        raise ImportError('pyarrow must be installed to export Parquet files')
+
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+    if kind == 'votes':
+        fields, rows = VOTE_FIELDS, vote_rows(conversation, chunk_size)
+    else:
+        fields, rows = COMMENT_FIELDS, comment_rows(conversation, chunk_size)
+
+    if format == 'csv':
+        return csv_chunks(fields, rows, chunk_size)
+    elif format == 'jsonl':
+        return jsonl_chunks(fields, rows, chunk_size)
+    else:
+        return parquet_chunks(fields, rows, chunk_size)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def csv_chunks(fields, rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in chunked(rows, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def jsonl_chunks(fields, rows, chunk_size):
+    for chunk in chunked(rows, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(fields, row)), default=str) + '\n'
+            for row in chunk
+        )
+
+
+def parquet_chunks(fields, rows, chunk_size):
+    """
+    Encode rows as a Parquet file with one row group per chunk.
+    """
+    schema = pyarrow.schema([(name, parquet_type(name)) for name in fields])
+    sink = ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    for chunk in chunked(rows, chunk_size):
+        columns = [pyarrow.array(column, type=type)
+                   for column, type in zip(zip(*chunk), schema.types)]
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def parquet_type(field):
+    if field in ('id', 'author', 'comment'):
+        return pyarrow.int64()
+    elif field == 'value':
+        return pyarrow.int8()
+    elif field == 'created':
+        return pyarrow.timestamp('us', tz='UTC')
+    else:
+        return pyarrow.string()
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write-only file that hands written data back through drain().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
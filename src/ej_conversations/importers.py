@@ -0,0 +1,394 @@
+"""
+Bulk import of comments and votes into a conversation.
+
+Rows are read from CSV or JSON Lines files, users and comments are resolved
+in batches and rows are inserted in bulk in chunked transactions. Column
+names follow the format produced by :mod:`ej_conversations.exports`, and the
+column names of Polis exports are also understood.
+
+Foreign keys created by Django on PostgreSQL and SQLite are already
+``DEFERRABLE INITIALLY DEFERRED``, so they are checked once at the end of each
+batch transaction without any extra setup.
+
+Bulk inserts do not send model signals, so the importer discards the cached
+values that signals would update once the rows are stored.
+"""
+import csv
+import datetime
+import json
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching
+from . import matrix
+from . import streams
+from . import trending
+from .archive import restore_conversation
+from .models import Comment, Conversation, Vote
+
+COMMENT_COLUMNS = {
+    'id': ('id', 'comment-id'),
+    'author': ('author', 'author-id'),
+    'content': ('content', 'comment-body'),
+    'status': ('status', 'moderated'),
+    'rejection_reason': ('rejection_reason',),
+    'created': ('created', 'timestamp'),
+}
+VOTE_COLUMNS = {
+    'author': ('author', 'voter-id'),
+    'comment': ('comment', 'comment-id'),
+    'value': ('value', 'vote'),
+    'created': ('created', 'timestamp'),
+}
+POLIS_STATUS = {
+    '1': Comment.STATUS.APPROVED,
+    '0': Comment.STATUS.PENDING,
+    '-1': Comment.STATUS.REJECTED,
+}
+VOTE_VALUES = set(Vote.VOTE_NAMES)
+
+
+class RowError(ValueError):
+    """
+    Invalid row in an import file.
+    """
+
+
+def read_rows(path):
+    """
+    Iterate over the rows of a CSV or JSON Lines file as dictionaries.
+    """
+    with open(path, newline='') as fd:
+        if path.endswith(('.jsonl', '.json')):
+            for line in fd:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(fd)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def column(row, names, default=None):
+    for name in names:
+        value = row.get(name)
+        if value not in (None, ''):
+            return value
+    return default
+
+
+def parse_timestamp(value):
+    """
+    Parse an ISO datetime or a Unix timestamp in seconds or milliseconds.
+    """
+    if value in (None, ''):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        result = parse_datetime(str(value))
+        if result is None:
+            raise RowError(f'invalid timestamp: {value}')
+        if timezone.is_naive(result):
+            result = timezone.make_aware(result, datetime.timezone.utc)
+        return result
+    if number > 1e11:
+        number /= 1000
+    return datetime.datetime.fromtimestamp(number, datetime.timezone.utc)
+
+
+class Importer:
+    """
+    Import comments and votes into conversation.
+
+    Authors are identified by usernames built from ``user_prefix`` and the
+    author column. Missing users are created with unusable passwords.
+
+    With ``dry_run=True`` rows are only validated and nothing is written to
+    the database.
+    """
+
+    def __init__(self, conversation, batch_size=5000, user_prefix='',
+                 invert_votes=False, dry_run=False):
+        self.conversation = conversation
+        self.batch_size = batch_size
+        self.user_prefix = user_prefix
+        self.invert_votes = invert_votes
+        self.dry_run = dry_run
+        self.users = {}
+        self.comments = {}
+        self.approved = set()
+        self.errors = []
+        self.created = {'users': 0, 'comments': 0, 'votes': 0}
+
+    def error(self, line, ex):
+        self.errors.append((line, str(ex)))
+
+    def invalidate_caches(self, user_ids):
+        """
+        Discard the cached values that signals would update for the imported
+        rows.
+        """
+        conversation_id = self.conversation.id
+        caching.invalidate_users(user_ids)
+        caching.invalidate_statistics(conversation_id)
+        matrix.mark_stale(conversation_id)
+        trending.recompute_scores([self.conversation])
+        transaction.on_commit(lambda: streams.refresh(conversation_id))
+
+    #
+    # Users
+    #
+    def resolve_users(self, authors):
+        """
+        Fill the user cache with ids of the given external author ids.
+        """
+        User = get_user_model()
+        missing = {self.user_prefix + str(a) for a in authors} - set(self.users)
+        if not missing:
+            return
+
+        existing = dict(
+            User.objects
+                .filter(username__in=missing)
+                .values_list('username', 'id')
+        )
+        self.users.update(existing)
+        missing -= set(existing)
+        if not missing:
+            return
+        if self.dry_run:
+            self.users.update((username, None) for username in missing)
+            self.created['users'] += len(missing)
+            return
+
+        new_users = []
+        for username in missing:
+            user = User(username=username)
+            user.set_unusable_password()
+            new_users.append(user)
+        User.objects.bulk_create(new_users)
+        self.users.update(
+            User.objects
+                .filter(username__in=missing)
+                .values_list('username', 'id')
+        )
+        self.created['users'] += len(missing)
+
+    def user_id(self, author):
+        return self.users[self.user_prefix + str(author)]
+
+    #
+    # Comments
+    #
+    def parse_comment(self, row):
+        external_id = column(row, COMMENT_COLUMNS['id'])
+        author = column(row, COMMENT_COLUMNS['author'])
+        content = column(row, COMMENT_COLUMNS['content'], '').strip()
+        status = str(column(row, COMMENT_COLUMNS['status'], Comment.STATUS.APPROVED))
+        status = POLIS_STATUS.get(status, status).upper()
+
+        if external_id is None:
+            raise RowError('missing comment id')
+        if author is None:
+            raise RowError('missing comment author')
+        if not content:
+            raise RowError('empty comment')
+        if len(content) > 140:
+            raise RowError('comment is longer than 140 characters')
+        if status not in Comment.STATUS:
+            raise RowError(f'invalid status: {status}')
+
+        comment = Comment(
+            conversation_id=self.conversation.id,
+            content=content,
+            status=status,
+            rejection_reason=column(row, COMMENT_COLUMNS['rejection_reason'], ''),
+        )
+        created = parse_timestamp(column(row, COMMENT_COLUMNS['created']))
+        if created:
+            comment.created = comment.modified = comment.status_changed = created
+        comment.update_fingerprints()
+        return str(external_id), author, comment
+
+    def import_comments(self, rows):
+        """
+        Import comments from an iterable of dictionaries.
+
+        Comments equivalent to existing comments in the conversation are
+        mapped to the existing comment instead of being duplicated.
+        """
+        authors = set()
+        for chunk in chunked(enumerate(rows, 1), self.batch_size):
+            parsed = []
+            for line, row in chunk:
+                try:
+                    parsed.append(self.parse_comment(row))
+                except RowError as ex:
+                    self.error(line, ex)
+
+            self.resolve_users(author for _, author, _ in parsed)
+            if self.dry_run:
+                self.created['comments'] += len(parsed)
+            else:
+                authors.update(self.insert_comments(parsed))
+
+            stored = self.comment_hashes(c for _, _, c in parsed)
+            for ext, _, comment in parsed:
+                pk, status = stored.get(comment.content_hash, (None, comment.status))
+                self.add_comment(ext, pk, status)
+
+        if authors:
+            self.invalidate_caches(authors)
+
+    def insert_comments(self, parsed):
+        """
+        Insert parsed comments that are not in the conversation yet and
+        return the ids of their authors.
+        """
+        with transaction.atomic():
+            hashes = self.comment_hashes(c for _, _, c in parsed)
+            new_comments = {}
+            for _, author, comment in parsed:
+                if comment.content_hash not in hashes:
+                    comment.author_id = self.user_id(author)
+                    new_comments.setdefault(comment.content_hash, comment)
+            Comment.objects.bulk_create(new_comments.values(),
+                                        ignore_conflicts=True)
+            self.created['comments'] += len(new_comments)
+        return {c.author_id for c in new_comments.values()}
+
+    def add_comment(self, external_id, comment_id, status):
+        self.comments[external_id] = comment_id
+        if status == Comment.STATUS.APPROVED:
+            self.approved.add(external_id)
+
+    def comment_hashes(self, comments):
+        """
+        Map content hashes of the given comments to the (id, status) of the
+        equivalent comments stored in the conversation.
+        """
+        return {
+            content_hash: (pk, status)
+            for content_hash, pk, status in (
+                Comment.objects
+                    .filter(conversation_id=self.conversation.id,
+                            content_hash__in={c.content_hash for c in comments})
+                    .values_list('content_hash', 'id', 'status')
+            )
+        }
+
+    #
+    # Votes
+    #
+    def load_comments(self):
+        """
+        Map ids of approved comments already in the conversation to
+        themselves, so vote files can reference them directly.
+        """
+        ids = Comment.objects.filter(conversation_id=self.conversation.id,
+                                     status=Comment.STATUS.APPROVED)
+        for pk in ids.values_list('id', flat=True).iterator():
+            if str(pk) not in self.comments:
+                self.add_comment(str(pk), pk, Comment.STATUS.APPROVED)
+
+    def parse_vote(self, row):
+        author = column(row, VOTE_COLUMNS['author'])
+        comment = column(row, VOTE_COLUMNS['comment'])
+        value = column(row, VOTE_COLUMNS['value'])
+
+        if author is None:
+            raise RowError('missing vote author')
+        if comment is None or str(comment) not in self.comments:
+            raise RowError(f'unknown comment: {comment}')
+        if str(comment) not in self.approved:
+            raise RowError(f'comment must be approved to receive votes: {comment}')
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise RowError(f'invalid vote value: {value}')
+        if value not in VOTE_VALUES:
+            raise RowError(f'invalid vote value: {value}')
+        if self.invert_votes:
+            value = -value
+
+        created = parse_timestamp(column(row, VOTE_COLUMNS['created']))
+        return author, str(comment), value, created
+
+    def import_votes(self, rows):
+        """
+        Import votes from an iterable of dictionaries.
+
+        Votes that conflict with existing votes are ignored, but still
+        counted in the ``created`` statistics. Archived votes are restored
+        before the first insert.
+        """
+        self.load_comments()
+        now = timezone.now()
+        voters = set()
+        for chunk in chunked(enumerate(rows, 1), self.batch_size):
+            parsed = []
+            for line, row in chunk:
+                try:
+                    parsed.append(self.parse_vote(row))
+                except RowError as ex:
+                    self.error(line, ex)
+
+            self.resolve_users(author for author, *_ in parsed)
+            if self.dry_run:
+                self.created['votes'] += len(parsed)
+                continue
+
+            values = [
+                (self.user_id(author), self.comments[comment], value,
+                 created or now)
+                for author, comment, value, created in parsed
+            ]
+            with transaction.atomic():
+                insert_votes(values, self.conversation.id)
+            self.created['votes'] += len(values)
+            voters.update(author_id for author_id, *_ in values)
+
+        if voters:
+            self.invalidate_caches(voters)
+
+
+def insert_votes(values, conversation_id):
+    """
+    Insert (author_id, comment_id, value, created) tuples in the vote table,
+    ignoring conflicts with existing votes.
+
+    All comments must be approved comments of the given conversation. Its
+    archived votes are restored first, as Comment.vote() does, so inserted
+    votes conflict with them.
+
+    Bypasses the model layer: building a Vote instance for each row costs more
+    than the insert itself when loading millions of votes.
+    """
+    restore_conversation(Conversation(id=conversation_id))
+    ops = connection.ops
+    adapt = ops.adapt_datetimefield_value
+    values = [(*row[:3], adapt(row[3])) for row in values]
+    table = ops.quote_name(Vote._meta.db_table)
+    columns = ', '.join(
+        ops.quote_name(Vote._meta.get_field(name).column)
+        for name in ('author', 'comment', 'value', 'created')
+    )
+    sql = ' '.join([
+        ops.insert_statement(ignore_conflicts=True),
+        f'{table} ({columns}) VALUES (%s, %s, %s, %s)',
+        ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+    ])
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, values)
@@ -0,0 +1,278 @@
+"""
+Optional instrumentation of model methods and viewset actions.
+
+When CONVERSATION_INSTRUMENTATION_SINK is set, the public methods of
+Conversation, Comment and Limits and every extra action of the viewsets are
+wrapped at startup to record wall time, database time and number of queries.
+Nothing is wrapped when instrumentation is disabled, so it has no overhead.
+
+Queries that :mod:`ej_conversations.concurrency` runs in worker threads are
+counted by the trackers of the calling thread.
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from contextlib import ExitStack, contextmanager
+from logging import getLogger
+from types import FunctionType
+
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.module_loading import import_string
+
+from . import config
+
+log = getLogger('ej-conversations.instrumentation')
+
+Measurement = namedtuple('Measurement', ['name', 'wall_time', 'db_time', 'queries'])
+
+_sink = None
+_local = threading.local()
+
+
+class QueryTracker:
+    """
+    Database execute wrapper that counts queries and their duration.
+
+    A single tracker can wrap several connections, also from different
+    threads.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.time += elapsed
+                self.queries += 1
+
+
+def instrument(name, func, sink):
+    """
+    Wrap func to send a Measurement to sink on each call.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        try:
+            with track_queries(tracker):
+                return func(*args, **kwargs)
+        finally:
+            wall_time = time.perf_counter() - start
+            sink.record(Measurement(name, wall_time, tracker.time, tracker.queries))
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+@contextmanager
+def track_queries(*trackers):
+    """
+    Install trackers in the connections of all databases of the current
+    thread inside the block, so queries routed to replicas are also counted.
+    """
+    previous = get_trackers()
+    with ExitStack() as stack:
+        for tracker in trackers:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(tracker))
+        _local.trackers = previous + trackers
+        try:
+            yield
+        finally:
+            _local.trackers = previous
+
+
+def get_trackers():
+    """
+    Return a tuple with the trackers installed in the current thread.
+    """
+    return getattr(_local, 'trackers', ())
+
+
+def public_methods(cls):
+    """
+    Iterate over the (name, function) pairs of public methods defined in cls.
+    """
+    for name, attr in vars(cls).items():
+        if isinstance(attr, FunctionType) and not name.startswith('_'):
+            yield name, attr
+
+
+def extra_actions(cls):
+    """
+    Iterate over the (name, function) pairs of @action methods defined in cls.
+    """
+    for name, attr in public_methods(cls):
+        if hasattr(attr, 'mapping'):
+            yield name, attr
+
+
+def instrument_class(cls, methods, sink):
+    for name, func in list(methods):
+        if not getattr(func, 'instrumented', False):
+            setattr(cls, name, instrument(f'{cls.__name__}.{name}', func, sink))
+
+
+def instrumented_classes():
+    from . import viewsets
+    from .models import Comment, Conversation, Limits
+
+    models = [Conversation, Comment, Limits]
+    views = [cls for cls in vars(viewsets).values()
+             if isinstance(cls, type) and cls.__module__ == viewsets.__name__]
+    return models, views
+
+
+def install(sink=None):
+    """
+    Instrument models and viewsets, sending measurements to the given sink.
+
+    Sink can be a sink instance, one of 'logging', 'memory' or 'prometheus',
+    or the dotted path to a sink class. If not given, it is read from
+    settings.
+    """
+    global _sink
+    models, views = instrumented_classes()
+    sink = make_sink(config.INSTRUMENTATION_SINK if sink is None else sink)
+    for model in models:
+        instrument_class(model, public_methods(model), sink)
+    for viewset in views:
+        instrument_class(viewset, extra_actions(viewset), sink)
+    _sink = sink
+    return sink
+
+
+def uninstall():
+    """
+    Restore the original methods of instrumented classes.
+    """
+    global _sink
+    models, views = instrumented_classes()
+    for cls in models + views:
+        for name, func in list(public_methods(cls)):
+            if getattr(func, 'instrumented', False):
+                setattr(cls, name, func.__wrapped__)
+    _sink = None
+
+
+def get_sink():
+    """
+    Return the installed sink or None if instrumentation is disabled.
+    """
+    return _sink
+
+
+def make_sink(sink):
+    if isinstance(sink, str):
+        sink = SINKS.get(sink) or import_string(sink)
+    if isinstance(sink, type):
+        sink = sink()
+    return sink
+
+
+#
+# Sinks
+#
+class LoggingSink:
+    """
+    Log each measurement at the DEBUG level.
+    """
+
+    def record(self, measurement):
+        name, wall_time, db_time, queries = measurement
+        log.debug(f'{name}: {wall_time * 1000:.2f}ms, {queries} queries '
+                  f'({db_time * 1000:.2f}ms)')
+
+
+class MemorySink:
+    """
+    Keep the most recent measurements in a ring buffer.
+    """
+
+    def __init__(self, size=None):
+        self.buffer = deque(maxlen=size or config.INSTRUMENTATION_BUFFER_SIZE)
+
+    def record(self, measurement):
+        self.buffer.append(measurement)
+
+    def records(self, name=None):
+        """
+        Return a list of stored measurements, optionally filtered by name.
+        """
+        return [m for m in list(self.buffer) if name is None or m.name == name]
+
+
+class PrometheusSink:
+    """
+    Aggregate measurements into counters exposed in Prometheus' text format.
+    """
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record(self, measurement):
+        name, wall_time, db_time, queries = measurement
+        with self.lock:
+            calls, wall, db, n_queries = self.metrics.get(name, (0, 0.0, 0.0, 0))
+            self.metrics[name] = (calls + 1, wall + wall_time, db + db_time,
+                                  n_queries + queries)
+
+    def render(self):
+        """
+        Return metrics in Prometheus' text exposition format.
+        """
+        with self.lock:
+            metrics = list(self.metrics.items())
+
+        lines = []
+        series = [
+            ('calls_total', 'Number of calls', 0),
+            ('wall_seconds_total', 'Total wall time', 1),
+            ('db_seconds_total', 'Total time spent in database queries', 2),
+            ('queries_total', 'Total number of database queries', 3),
+        ]
+        for suffix, description, idx in series:
+            metric = f'ej_conversations_{suffix}'
+            lines.append(f'# HELP {metric} {description}.')
+            lines.append(f'# TYPE {metric} counter')
+            for name, values in metrics:
+                lines.append(f'{metric}{{method="{name}"}} {values[idx]}')
+        return '\n'.join(lines) + '\n'
+
+
+SINKS = {
+    'logging': LoggingSink,
+    'memory': MemorySink,
+    'prometheus': PrometheusSink,
+}
+
+
+def metrics_view(request):
+    """
+    Django view that exposes the metrics collected by a PrometheusSink.
+
+    It is routed to metrics/ by ``ej_conversations.urls``.
+
+    Only staff users can read the metrics, unless
+    CONVERSATION_INSTRUMENTATION_PUBLIC_METRICS is True.
+    """
+    if not config.INSTRUMENTATION_PUBLIC_METRICS and not request.user.is_staff:
+        return HttpResponseForbidden('Metrics are only available to staff users\n',
+                                     content_type='text/plain')
+    if not isinstance(_sink, PrometheusSink):
+        return HttpResponse('Prometheus instrumentation is disabled\n',
+                            status=404, content_type='text/plain')
+    return HttpResponse(_sink.render(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
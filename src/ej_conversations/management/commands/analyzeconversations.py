@@ -0,0 +1,78 @@
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from ej_conversations import analysis
+from ej_conversations.models import Conversation
+
+
+class Command(BaseCommand):
+    help = 'Recompute statistics, scores and vote matrices of conversations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'conversations',
+            nargs='*',
+            help='Slugs of conversations to analyze (default: all)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of worker processes (default: number of cores). '
+                 'Use 0 to analyze in the current process',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Number of conversations sent to a worker at once (default: 10)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='File that stores analyzed conversations. Conversations '
+                 'already in this file are skipped',
+        )
+
+    def handle(self, *args, conversations, workers=None, batch_size=10,
+               checkpoint=None, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+        queryset = Conversation.objects.all()
+        if conversations:
+            queryset = queryset.filter(slug__in=conversations)
+            missing = set(conversations) - set(queryset.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f'conversations do not exist: {", ".join(sorted(missing))}')
+
+        self.check_cache()
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        if checkpoint:
+            done = analysis.read_checkpoint(checkpoint)
+            if done:
+                self.stdout.write(f'skipping {len(done & set(ids))} analyzed conversations')
+            ids = [pk for pk in ids if pk not in done]
+
+        throughput = analysis.Throughput()
+        errors = []
+        for results in analysis.run(ids, workers=workers, batch_size=batch_size):
+            throughput.add(results)
+            errors.extend(result for result in results if result.error)
+            if checkpoint:
+                analysis.write_checkpoint(
+                    checkpoint, [r.conversation_id for r in results if not r.error])
+            self.stdout.write(f'{throughput.conversations}/{len(ids)}: {throughput}')
+
+        for result in errors:
+            self.stderr.write(f'conversation {result.conversation_id}: {result.error}')
+        if errors:
+            raise CommandError(f'{len(errors)} conversations failed')
+        self.stdout.write(self.style.SUCCESS(f'analyzed {throughput}'))
+
+    def check_cache(self):
+        # Vote matrices are still stored, but analytics cached by this
+        # process are not visible to the web server.
+        if isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache)):
+            self.stderr.write('warning: the default cache is local to this process, so '
+                              'cached analytics are lost when the command exits')
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ej_conversations import archive
+from ej_conversations.models import Conversation
+
+
+class Command(BaseCommand):
+    help = 'Move votes of inactive conversations to compressed archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'conversations',
+            nargs='*',
+            help='Slugs of conversations to archive regardless of activity',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=180,
+            help='Archive conversations without votes or comments in this '
+                 'number of days (default: 180)',
+        )
+        parser.add_argument(
+            '--restore',
+            action='store_true',
+            help='Move archived votes of the given conversations back to the '
+                 'vote table',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List conversations that would be archived',
+        )
+
+    def handle(self, *args, conversations, days, restore=False, dry_run=False,
+               **options):
+        if conversations:
+            queryset = Conversation.objects.filter(slug__in=conversations)
+            missing = set(conversations) - set(queryset.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f'conversations do not exist: {", ".join(sorted(missing))}')
+        elif restore:
+            raise CommandError('give the slugs of conversations to restore')
+        else:
+            queryset = archive.inactive_conversations(days)
+
+        action = archive.restore_conversation if restore else archive.archive_conversation
+        verb = 'restored' if restore else 'archived'
+        total = 0
+        for conversation in queryset.order_by('id'):
+            if dry_run:
+                self.stdout.write(f'{conversation.slug}')
+                continue
+            n_votes = action(conversation)
+            total += n_votes
+            self.stdout.write(f'{conversation.slug}: {n_votes} votes {verb}')
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f'{total} votes {verb}'))
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 
-from ej_conversations.examples import make_examples
+from ej_conversations.examples import make_examples, make_synthetic_data
 
 
 class Command(BaseCommand):
@@ -12,6 +12,62 @@ class Command(BaseCommand):
             action='store_true',
             help='Prevents showing debug info',
         )
+        parser.add_argument(
+            '--conversations',
+            type=int,
+            default=0,
+            help='Generate a large dataset with the given number of '
+                 'conversations instead of the handcrafted examples',
+        )
+        parser.add_argument(
+            '--comments',
+            type=int,
+            default=100,
+            help='Number of comments per conversation',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=1000,
+            help='Number of participants',
+        )
+        parser.add_argument(
+            '--density',
+            type=float,
+            default=0.5,
+            help='Probability that a user votes in a comment',
+        )
+        parser.add_argument(
+            '--groups',
+            type=int,
+            default=3,
+            help='Number of opinion groups',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed',
+        )
+        parser.add_argument(
+            '--no-signatures',
+            action='store_true',
+            help='Skip the MinHash signatures used by near-duplicate detection',
+        )
 
-    def handle(self, *args, silent=False, **options):
-        make_examples(verbose=not silent)
+    def handle(self, *args, silent=False, conversations=0, comments=100,
+               users=1000, density=0.5, groups=3, seed=0, no_signatures=False,
+               **options):
+        if conversations:
+            make_synthetic_data(
+                conversations=conversations,
+                comments=comments,
+                users=users,
+                density=density,
+                groups=groups,
+                seed=seed,
+                signatures=not no_signatures,
+                verbose=not silent,
+            )
+        else:
+            make_examples(verbose=not silent)
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ej_conversations import exports
+from ej_conversations.models import Conversation
+
+
+class Command(BaseCommand):
+    help = 'Export all votes or comments of a conversation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'conversation',
+            help='Slug of the exported conversation',
+        )
+        parser.add_argument(
+            '--kind',
+            choices=exports.KINDS,
+            default='votes',
+            help='Export votes (default) or comments',
+        )
+        parser.add_argument(
+            '--format',
+            choices=exports.FORMATS,
+            default='csv',
+            help='Output format (default: csv)',
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='Output file (default: stdout)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Number of rows fetched from the database at once',
+        )
+
+    def handle(self, *args, conversation, kind, format, output=None,
+               chunk_size=None, **options):
+        try:
+            conversation = Conversation.objects.get(slug=conversation)
+        except Conversation.DoesNotExist:
+            raise CommandError(f'conversation does not exist: {conversation}')
+        try:
+            chunks = exports.export(conversation, kind, format, chunk_size)
+        except ImportError as ex:
+            raise CommandError(str(ex))
+
+        binary = format == 'parquet'
+        if output is None:
+            if binary:
+                write_chunks(self.stdout.buffer, chunks)
+            else:
+                for chunk in chunks:
+                    self.stdout.write(chunk, ending='')
+                self.stdout.flush()
+        else:
+            # Csv rows end with \r\n, which must not be translated
+            with open(output, 'wb' if binary else 'w', newline=None if binary else '') as stream:
+                write_chunks(stream, chunks)
+
+
+def write_chunks(stream, chunks):
+    for chunk in chunks:
+        stream.write(chunk)
+    stream.flush()
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ej_conversations.importers import Importer, read_rows
+from ej_conversations.models import Conversation
+
+
+class Command(BaseCommand):
+    help = 'Import comments and votes into a conversation from CSV/JSONL files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'conversation',
+            help='Slug of the target conversation',
+        )
+        parser.add_argument(
+            '--comments',
+            help='CSV or JSON Lines file with comments',
+        )
+        parser.add_argument(
+            '--votes',
+            help='CSV or JSON Lines file with votes',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of rows inserted in each transaction',
+        )
+        parser.add_argument(
+            '--user-prefix',
+            default='',
+            help='Prefix added to author ids to create usernames',
+        )
+        parser.add_argument(
+            '--polis',
+            action='store_true',
+            help='Input files come from Polis (agree is -1)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate input files without touching the database',
+        )
+
+    def handle(self, *args, conversation, comments=None, votes=None,
+               batch_size=5000, user_prefix='', polis=False,
+               dry_run=False, **options):
+        try:
+            conversation = Conversation.objects.get(slug=conversation)
+        except Conversation.DoesNotExist:
+            raise CommandError(f'conversation does not exist: {conversation}')
+
+        importer = Importer(
+            conversation,
+            batch_size=batch_size,
+            user_prefix=user_prefix,
+            invert_votes=polis,
+            dry_run=dry_run,
+        )
+        start = time.time()
+        if comments:
+            importer.import_comments(read_rows(comments))
+        if votes:
+            importer.import_votes(read_rows(votes))
+        elapsed = time.time() - start
+
+        for line, error in importer.errors[:20]:
+            self.stderr.write(f'line {line}: {error}')
+        if len(importer.errors) > 20:
+            self.stderr.write(f'... and {len(importer.errors) - 20} more errors')
+
+        created = importer.created
+        verb = 'Validated' if dry_run else 'Imported'
+        rate = created['votes'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{verb} {created["comments"]} comments, {created["votes"]} votes '
+            f'and {created["users"]} new users in {elapsed:.1f}s '
+            f'({rate:.0f} votes/s)'
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ej_conversations import trending
+from ej_conversations.models import Conversation
+
+
+class Command(BaseCommand):
+    help = 'Recompute trending scores of conversations from their votes and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'conversations',
+            nargs='*',
+            help='Slugs of conversations to recompute (default: all)',
+        )
+
+    def handle(self, *args, conversations, **options):
+        queryset = Conversation.objects.all()
+        if conversations:
+            queryset = queryset.filter(slug__in=conversations)
+            missing = set(conversations) - set(queryset.values_list('slug', flat=True))
+            if missing:
+                raise CommandError(f'conversations do not exist: {", ".join(sorted(missing))}')
+
+        queryset = queryset.order_by('id').only('id')
+        trending.recompute_scores(queryset.iterator())
+        self.stdout.write(self.style.SUCCESS(f'{queryset.count()} scores recomputed'))
@@ -0,0 +1,366 @@
+"""
+Compact vote matrices for analysis (requires numpy).
+
+All votes of a conversation are stored in a VoteMatrix as a matrix with one
+row per participant and one column per voted comment, plus two int64 arrays
+with the ids of users and comments. Rows and columns are sorted by id. Cells
+hold a vote value shifted by :data:`OFFSET`, so 0 means no vote, and are
+packed four to a byte.
+
+Matrices are synced incrementally: only votes with ids greater than the last
+synced vote are read from the database, and they are appended to a list of
+(user, comment, code) triples stored next to the matrix, so a sync does not
+rewrite the matrix. The list is merged into the matrix once it grows larger
+than the packed matrix. Changing or deleting votes marks the matrix as stale
+and the next sync rebuilds it from scratch, including votes in the
+conversation's archive. Transactions may commit votes out of id order, so
+each sync also counts the votes up to the last synced id and rebuilds the
+matrix if a vote appeared below it.
+
+Matrices can also be written to files with one int8 cell per vote that
+analysis workers open with numpy.memmap, so processes on the same node share pages through the OS cache.
+Each file holds a single version of the matrix and is never modified after
+it is created: new versions are written to a temporary file and atomically
+renamed, so readers never see a half-written matrix.
+"""
+import glob
+import os
+import struct
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+
+from . import config
+from .models import Vote, VoteMatrix
+from .utils import require_numpy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NO_VOTE = 0
+OFFSET = 2
+ID_DTYPE = '<i8'
+
+#: Votes not merged into the matrix are kept until their list takes more
+#: bytes than the packed matrix, or than this size for small matrices.
+MIN_MERGE_SIZE = 64 * 1024
+
+
+def get_matrix(conversation, sync=True):
+    """
+    Return a tuple (user_ids, comment_ids, codes) with the vote matrix of
+    the conversation.
+
+    Codes is a read-only int8 matrix with encoded votes. Use :func:`decode`
+    to convert it to vote values.
+    """
+    require_numpy()
+    if sync:
+        matrix = sync_matrix(conversation)
+    else:
+        matrix = VoteMatrix.objects.filter(conversation_id=conversation.id).first()
+        if matrix is None:
+            return empty_arrays()
+    return arrays(matrix)
+
+
+def decode(codes):
+    """
+    Return a tuple (values, voted) from a matrix of encoded votes.
+
+    Values is an int8 matrix with the vote values (0 where there is no vote)
+    and voted is a boolean matrix that tells which entries hold a vote.
+    """
+    require_numpy()
+    voted = codes != NO_VOTE
+    values = np.where(voted, codes - OFFSET, 0).astype(np.int8)
+    return values, voted
+
+
+def arrays(matrix):
+    """
+    Return the (user_ids, comment_ids, codes) arrays stored in a VoteMatrix,
+    including votes not merged into the matrix yet.
+    """
+    user_ids = np.frombuffer(matrix.users, dtype=ID_DTYPE)
+    comment_ids = np.frombuffer(matrix.comments, dtype=ID_DTYPE)
+    codes = unpack(matrix.data, (len(user_ids), len(comment_ids)))
+    delta = np.frombuffer(matrix.delta, dtype=ID_DTYPE).reshape(-1, 3)
+    if len(delta):
+        user_ids, comment_ids, codes = add_codes(user_ids, comment_ids, codes, delta)
+    codes.flags.writeable = False
+    return user_ids, comment_ids, codes
+
+
+def pack(codes):
+    """
+    Return the bytes of a matrix of codes with four cells per byte.
+    """
+    cells = codes.astype(np.uint8).ravel()
+    quads = np.zeros((len(cells) + 3) // 4 * 4, dtype=np.uint8)
+    quads[:len(cells)] = cells
+    quads = quads.reshape(-1, 4)
+    return (quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | quads[:, 3] << 6).tobytes()
+
+
+def unpack(data, shape):
+    """
+    Inverse of pack(): return a new int8 matrix of codes with the given shape.
+    """
+    packed = np.frombuffer(data, dtype=np.uint8)
+    codes = np.empty((len(packed), 4), dtype=np.int8)
+    for i in range(4):
+        codes[:, i] = (packed >> 2 * i) & 3
+    return codes.ravel()[:shape[0] * shape[1]].reshape(shape)
+
+
+def empty_arrays():
+    return (np.zeros(0, dtype=ID_DTYPE), np.zeros(0, dtype=ID_DTYPE),
+            np.zeros((0, 0), dtype=np.int8))
+
+
+def sync_matrix(conversation, rebuild=False):
+    """
+    Add new votes of the conversation to its VoteMatrix and return it.
+
+    The matrix is rebuilt from all votes if it is stale, votes were committed
+    below the last synced id or rebuild is True.
+    """
+    from .archive import archived_rows
+
+    require_numpy()
+    queryset = Vote.objects.filter(comment__conversation_id=conversation.id)
+    with transaction.atomic():
+        matrix, created = (
+            VoteMatrix.objects
+                .select_for_update()
+                .get_or_create(conversation_id=conversation.id,
+                               defaults={'users': b'', 'comments': b'', 'data': b''})
+        )
+        rebuild = rebuild or created or matrix.is_stale
+        if not rebuild:
+            synced_votes = queryset.filter(id__lte=matrix.last_vote_id).count()
+            rebuild = synced_votes != matrix.synced_votes
+        if rebuild:
+            rows = [(pk, author, comment, value)
+                    for pk, author, comment, value, _ in archived_rows(conversation)]
+            last_vote_id = synced_votes = 0
+        else:
+            rows = []
+            last_vote_id = matrix.last_vote_id
+
+        new_rows = list(
+            queryset
+                .filter(id__gt=last_vote_id)
+                .order_by('id')
+                .values_list('id', 'author_id', 'comment_id', 'value')
+        )
+        if not new_rows and not rebuild:
+            return matrix
+        rows.extend(new_rows)
+
+        votes = np.array(rows, dtype=np.int64).reshape(-1, 4)
+        delta = np.column_stack([votes[:, 1:3], votes[:, 3] + OFFSET]).astype(ID_DTYPE)
+        matrix.last_vote_id = int(votes[:, 0].max(initial=last_vote_id))
+        matrix.synced_votes = synced_votes + len(new_rows)
+        matrix.is_stale = False
+        if rebuild:
+            merge(matrix, empty_arrays(), delta)
+            matrix.save()
+        elif len(matrix.delta) + delta.nbytes > max(len(matrix.data), MIN_MERGE_SIZE):
+            merge(matrix, arrays(matrix), delta)
+            matrix.save()
+        else:
+            matrix.delta = bytes(matrix.delta) + delta.tobytes()
+            matrix.save(update_fields=['delta', 'last_vote_id', 'synced_votes',
+                                       'is_stale', 'modified'])
+    return matrix
+
+
+def merge(matrix, arrays, delta):
+    """
+    Store the given (user_ids, comment_ids, codes) arrays updated with delta
+    in matrix, leaving no unmerged votes.
+    """
+    user_ids, comment_ids, codes = add_codes(*arrays, delta)
+    matrix.users = user_ids.astype(ID_DTYPE).tobytes()
+    matrix.comments = comment_ids.astype(ID_DTYPE).tobytes()
+    matrix.data = pack(codes)
+    matrix.delta = b''
+
+
+def add_codes(user_ids, comment_ids, codes, delta):
+    """
+    Return new (user_ids, comment_ids, codes) arrays with the votes in delta.
+
+    Delta is an array of (author_id, comment_id, code) rows in the order the
+    votes were cast. Rows and columns are added for new users and comments.
+    """
+    new_user_ids = np.union1d(user_ids, delta[:, 0])
+    new_comment_ids = np.union1d(comment_ids, delta[:, 1])
+    if len(new_user_ids) == len(user_ids) and len(new_comment_ids) == len(comment_ids):
+        codes = codes.copy()
+    else:
+        old = codes
+        codes = np.zeros((len(new_user_ids), len(new_comment_ids)), dtype=np.int8)
+        rows = np.searchsorted(new_user_ids, user_ids)
+        columns = np.searchsorted(new_comment_ids, comment_ids)
+        codes[np.ix_(rows, columns)] = old
+
+    rows = np.searchsorted(new_user_ids, delta[:, 0])
+    columns = np.searchsorted(new_comment_ids, delta[:, 1])
+    codes[rows, columns] = delta[:, 2]
+    return new_user_ids, new_comment_ids, codes
+
+
+def mark_stale(conversation_id):
+    """
+    Force the next sync of the conversation's matrix to rebuild it.
+    """
+    (VoteMatrix.objects
+        .filter(conversation_id=conversation_id, is_stale=False)
+        .update(is_stale=True))
+
+
+#
+# Files
+#
+MAGIC = b'EJM1'
+HEADER = struct.Struct('<4s4xqq')
+SUFFIX = '.ejm'
+OPEN_TRIES = 3
+
+
+def matrix_dir():
+    """
+    Return the directory that stores vote matrix files.
+    """
+    return config.MATRIX_DIR or os.path.join(settings.MEDIA_ROOT, 'vote-matrices')
+
+
+def file_version(matrix):
+    """
+    Return the version of a VoteMatrix, which changes on every save.
+    """
+    return int(matrix.modified.timestamp() * 1_000_000)
+
+
+def file_path(conversation_id, version):
+    return os.path.join(matrix_dir(), f'{conversation_id}.{version}{SUFFIX}')
+
+
+def file_versions(conversation_id):
+    """
+    Return the sorted list of versions stored in files for the conversation.
+    """
+    pattern = os.path.join(matrix_dir(), f'{conversation_id}.*{SUFFIX}')
+    versions = []
+    for path in glob.glob(pattern):
+        version = os.path.basename(path)[:-len(SUFFIX)].partition('.')[2]
+        if version.isdigit():
+            versions.append(int(version))
+    return sorted(versions)
+
+
+def write_file(matrix):
+    """
+    Write a VoteMatrix to its versioned file and remove older versions.
+
+    Return the path of the file. Nothing is written if the file already
+    exists.
+    """
+    require_numpy()
+    conversation_id = matrix.conversation_id
+    version = file_version(matrix)
+    path = file_path(conversation_id, version)
+    if not os.path.exists(path):
+        directory = matrix_dir()
+        os.makedirs(directory, exist_ok=True)
+        user_ids, comment_ids, codes = arrays(matrix)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(HEADER.pack(MAGIC, len(user_ids), len(comment_ids)))
+                file.write(user_ids.tobytes())
+                file.write(comment_ids.tobytes())
+                file.write(codes.tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    remove_files(conversation_id, keep=version)
+    return path
+
+
+def open_file(path):
+    """
+    Return read-only memory-mapped (user_ids, comment_ids, codes) arrays
+    stored in the given file.
+    """
+    require_numpy()
+    # Arrays are mapped from the open file, so they stay valid if the file is
+    # removed by a new version in the meantime.
+    with open(path, 'rb') as file:
+        magic, n_users, n_comments = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f'invalid vote matrix file: {path}')
+
+        offset = HEADER.size
+        shapes = [(ID_DTYPE, (n_users,)), (ID_DTYPE, (n_comments,)),
+                  (np.int8, (n_users, n_comments))]
+        result = []
+        for dtype, shape in shapes:
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            if size:
+                result.append(np.memmap(file, dtype=dtype, mode='r', offset=offset,
+                                        shape=shape))
+            else:
+                result.append(np.zeros(shape, dtype=dtype))
+            offset += size
+    return tuple(result)
+
+
+def get_shared_matrix(conversation, sync=True):
+    """
+    Like get_matrix(), but return arrays memory-mapped from the matrix file,
+    writing it first if the current version is not on disk.
+
+    If sync is False, the latest file is opened without querying the
+    database, or None is returned if there is no file.
+    """
+    require_numpy()
+    if sync:
+        return open_file(write_file(sync_matrix(conversation)))
+
+    # The latest file is removed as soon as a newer version is written, so
+    # look for the newer version if it disappears before it is opened.
+    for _ in range(OPEN_TRIES):
+        versions = file_versions(conversation.id)
+        if not versions:
+            return None
+        try:
+            return open_file(file_path(conversation.id, versions[-1]))
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def remove_files(conversation_id, keep=None):
+    """
+    Remove the matrix files of a conversation, except for the given version.
+
+    Processes that already mapped a removed file keep reading it until they
+    close it.
+    """
+    for version in file_versions(conversation_id):
+        if version != keep:
+            try:
+                os.remove(file_path(conversation_id, version))
+            except FileNotFoundError:
+                pass
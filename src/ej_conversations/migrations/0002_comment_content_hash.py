@@ -0,0 +1,54 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:15
+
+import hashlib
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def content_hash(text):
+    # Same as ej_conversations.utils.content_hash at the time of this migration
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = WHITESPACE_RE.sub(' ', text.casefold()).strip()
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+def fill_content_hash(apps, schema_editor):
+    """
+    Compute hashes of existing comments.
+
+    Legacy comments that are equivalent to an older comment in the same
+    conversation keep a NULL hash so the new unique constraint holds.
+    """
+    Comment = apps.get_model('ej_conversations', 'Comment')
+    seen = set()
+    comments = Comment.objects.order_by('id').values_list('id', 'conversation_id', 'content')
+    for pk, conversation_id, content in comments.iterator():
+        key = (conversation_id, content_hash(content))
+        if key not in seen:
+            seen.add(key)
+            Comment.objects.filter(id=pk).update(content_hash=key[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ej_conversations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='content_hash',
+            field=models.CharField(editable=False, help_text='Hash of the normalized content, used to detect duplicates.', max_length=40, null=True, verbose_name='Content hash'),
+        ),
+        migrations.RunPython(fill_content_hash, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='comment',
+            unique_together={('conversation', 'content_hash')},
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:17
+
+from django.db import migrations, models
+
+from ej_conversations.similarity import minhash, dump_signature
+
+
+def fill_minhash(apps, schema_editor):
+    Comment = apps.get_model('ej_conversations', 'Comment')
+    comments = Comment.objects.values_list('id', 'content')
+    for pk, content in comments.iterator():
+        signature = dump_signature(minhash(content))
+        Comment.objects.filter(id=pk).update(minhash=signature)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ej_conversations', '0002_comment_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='minhash',
+            field=models.BinaryField(help_text='Signature used to detect near-duplicate comments.', null=True, verbose_name='MinHash signature'),
+        ),
+        migrations.RunPython(fill_minhash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:19
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+EPOCH = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def set_moderation_priority(apps, schema_editor):
+    """
+    Order existing pending comments by age.
+
+    Keys follow ej_conversations.moderation.priorities(), without the author
+    history and duplicates components.
+    """
+    Comment = apps.get_model('ej_conversations', 'Comment')
+    comments = Comment.objects.filter(status='PENDING').only('id', 'created')
+    for comment in comments.iterator():
+        days = (comment.created - EPOCH).total_seconds() / 86400
+        comment.moderation_priority = -days
+        comment.save(update_fields=['moderation_priority'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ej_conversations', '0003_comment_minhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Moderator currently reviewing this comment.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_comments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Claimed until'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='moderation_priority',
+            field=models.FloatField(default=0, editable=False, help_text='Pending comments with higher values are moderated first.', verbose_name='Moderation priority'),
+        ),
+        migrations.RunPython(set_moderation_priority, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(status='PENDING'), fields=['-moderation_priority', 'created'], name='ej_comment_pending'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """
+    Keep only the most recent vote of each stereotype on each comment.
+    """
+    StereotypeVote = apps.get_model('ej_conversations', 'StereotypeVote')
+    seen = set()
+    duplicates = []
+    votes = StereotypeVote.objects.order_by('-id').values_list('id', 'stereotype_id', 'comment_id')
+    for pk, stereotype_id, comment_id in votes.iterator():
+        key = (stereotype_id, comment_id)
+        if key in seen:
+            duplicates.append(pk)
+        seen.add(key)
+    StereotypeVote.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ej_conversations', '0004_comment_moderation_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='stereotypevote',
+            unique_together={('stereotype', 'comment')},
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ej_conversations', '0005_stereotypevote_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='archived_agree',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='archived_disagree',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='archived_skip',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='VoteArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField(verbose_name='Compressed votes')),
+                ('agree', models.PositiveIntegerField(default=0)),
+                ('disagree', models.PositiveIntegerField(default=0)),
+                ('skip', models.PositiveIntegerField(default=0)),
+                ('participants', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now=True, verbose_name='Archived at')),
+                ('conversation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='vote_archive', to='ej_conversations.Conversation')),
+            ],
+            options={
+                'verbose_name': 'Vote archive',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ej_conversations', '0006_vote_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteMatrix',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('users', models.BinaryField(help_text='Little-endian int64 ids of the users in each row.', verbose_name='User ids')),
+                ('comments', models.BinaryField(help_text='Little-endian int64 ids of the comments in each column.', verbose_name='Comment ids')),
+                ('data', models.BinaryField(help_text='Row-major int8 matrix with one encoded vote per cell.', verbose_name='Votes')),
+                ('last_vote_id', models.BigIntegerField(default=0)),
+                ('is_stale', models.BooleanField(default=False, help_text='Votes were changed or removed and the matrix must be rebuilt.')),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('conversation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='vote_matrix', to='ej_conversations.Conversation')),
+            ],
+            options={
+                'verbose_name': 'Vote matrix',
+            },
+        ),
+    ]
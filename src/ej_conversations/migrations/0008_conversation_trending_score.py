@@ -0,0 +1,64 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:48
+
+import datetime
+import math
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Same as ej_conversations.trending at the time of this migration
+EPOCH = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+NO_SCORE = 0.0
+
+
+def event_score(weight, time):
+    half_life = getattr(settings, 'CONVERSATION_TRENDING_HALF_LIFE', 24 * 60 * 60)
+    return math.log(weight) + (time - EPOCH).total_seconds() * math.log(2) / half_life
+
+
+def add_scores(a, b):
+    if a == NO_SCORE:
+        return b
+    if b == NO_SCORE:
+        return a
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+def compute_trending_scores(apps, schema_editor):
+    """
+    Compute the initial trending scores from existing votes and comments.
+    """
+    Conversation = apps.get_model('ej_conversations', 'Conversation')
+    Comment = apps.get_model('ej_conversations', 'Comment')
+    Vote = apps.get_model('ej_conversations', 'Vote')
+    scores = {}
+    events = [
+        (getattr(settings, 'CONVERSATION_TRENDING_VOTE_WEIGHT', 1.0),
+         Vote.objects.values_list('comment__conversation_id', 'created')),
+        (getattr(settings, 'CONVERSATION_TRENDING_COMMENT_WEIGHT', 5.0),
+         Comment.objects.values_list('conversation_id', 'created')),
+    ]
+    for weight, rows in events:
+        if weight <= 0:
+            continue
+        for conversation_id, created in rows.iterator():
+            score = scores.get(conversation_id, NO_SCORE)
+            scores[conversation_id] = add_scores(score, event_score(weight, created))
+    for conversation_id, score in scores.items():
+        Conversation.objects.filter(id=conversation_id).update(trending_score=score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ej_conversations', '0007_vote_matrix'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='trending_score',
+            field=models.FloatField(db_index=True, default=0.0, editable=False, help_text='Time-decayed activity of the conversation. See ej_conversations.trending.', verbose_name='Trending score'),
+        ),
+        migrations.RunPython(compute_trending_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ej_conversations', '0008_conversation_trending_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='votematrix',
+            name='synced_votes',
+            field=models.PositiveIntegerField(default=0, help_text='Number of votes in the vote table with ids up to last_vote_id.'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+def delete_matrices(apps, schema_editor):
+    """
+    Matrices stored with one byte per cell are rebuilt in the new format.
+    """
+    VoteMatrix = apps.get_model('ej_conversations', 'VoteMatrix')
+    VoteMatrix.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ej_conversations', '0010_votematrix_synced_votes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_matrices, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='votematrix',
+            name='delta',
+            field=models.BinaryField(default=b'', help_text='Little-endian int64 (user, comment, code) triples of votes not merged into the matrix yet.', verbose_name='New votes'),
+        ),
+        migrations.AlterField(
+            model_name='votematrix',
+            name='data',
+            field=models.BinaryField(help_text='Row-major matrix with one 2-bit encoded vote per cell.', verbose_name='Votes'),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:31
+
+import struct
+import sys
+import zlib
+from array import array
+from itertools import groupby
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Archive format, as in ej_conversations.archive at the time of this migration
+COLUMNS = 'qqqbd'
+COUNT = struct.Struct('<I')
+ROW_SIZE = sum(array(code).itemsize for code in COLUMNS)
+
+
+def decode_block(data, offset, size):
+    columns = []
+    for code in COLUMNS:
+        column = array(code)
+        end = offset + size * column.itemsize
+        column.frombytes(data[offset:end])
+        if sys.byteorder == 'big':
+            column.byteswap()
+        columns.append(column)
+        offset = end
+    return list(zip(*columns))
+
+
+def decode(data):
+    data = zlib.decompress(data)
+    if data[:4] == b'EJV1':
+        (size,) = COUNT.unpack_from(data, 4)
+        return decode_block(data, 8, size)
+    rows = []
+    offset = 4
+    while offset < len(data):
+        (size,) = COUNT.unpack_from(data, offset)
+        rows.extend(decode_block(data, offset + COUNT.size, size))
+        offset += COUNT.size + size * ROW_SIZE
+    return rows
+
+
+def encode(rows):
+    columns = [array(code, column) for code, column in zip(COLUMNS, zip(*rows))]
+    chunks = [b'EJV2', COUNT.pack(len(rows))]
+    for column in columns:
+        if sys.byteorder == 'big':
+            column.byteswap()
+        chunks.append(column.tobytes())
+    return zlib.compress(b''.join(chunks))
+
+
+def create_participants(apps, schema_editor):
+    VoteArchive = apps.get_model('ej_conversations', 'VoteArchive')
+    ArchivedParticipant = apps.get_model('ej_conversations', 'ArchivedParticipant')
+    for archive in VoteArchive.objects.iterator():
+        rows = sorted(decode(archive.data), key=lambda row: (row[1], row[0]))
+        ArchivedParticipant.objects.bulk_create(
+            ArchivedParticipant(conversation_id=archive.conversation_id,
+                                author_id=author, votes=len(votes),
+                                data=encode(votes))
+            for author, votes in ((author, list(group))
+                                  for author, group in groupby(rows, key=lambda row: row[1]))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ej_conversations', '0011_votematrix_delta'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedParticipant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('votes', models.PositiveIntegerField(default=0, verbose_name='Number of votes')),
+                ('data', models.BinaryField(help_text='Archived votes of the participant, in the format of the conversation archive.', verbose_name='Compressed votes')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_participations', to=settings.AUTH_USER_MODEL)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_participants', to='ej_conversations.Conversation')),
+            ],
+            options={
+                'verbose_name': 'Archived participant',
+                'unique_together': {('conversation', 'author')},
+            },
+        ),
+        migrations.RunPython(create_participants, migrations.RunPython.noop),
+    ]
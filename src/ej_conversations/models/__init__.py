@@ -1,3 +1,4 @@
+from .archive import VoteArchive
 from .category import Category
 from .comment import Comment
 from .conversation import Conversation
@@ -5,3 +6,5 @@ from .conversation_extra import ConversationPhases, ConversationStyle
 from .stereotype import Stereotype, StereotypeVote
 from .vote import Vote
 from .limits import Limits
+from .matrix import VoteMatrix
+from .participant import ArchivedParticipant
@@ -0,0 +1,50 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class VoteArchive(models.Model):
+    """
+    Compressed votes of an inactive conversation.
+
+    Votes are removed from the vote table and stored as a single compressed
+    blob (see :mod:`ej_conversations.archive`). Vote counts are kept in plain
+    columns, so statistics do not need to decode the blob.
+    """
+
+    conversation = models.OneToOneField(
+        'Conversation',
+        related_name='vote_archive',
+        on_delete=models.CASCADE,
+    )
+    data = models.BinaryField(
+        _('Compressed votes'),
+    )
+    agree = models.PositiveIntegerField(default=0)
+    disagree = models.PositiveIntegerField(default=0)
+    skip = models.PositiveIntegerField(default=0)
+    participants = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(
+        _('Archived at'),
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = _('Vote archive')
+
+    def __str__(self):
+        return f'{self.conversation} ({self.total} votes)'
+
+    @property
+    def total(self):
+        return self.agree + self.disagree + self.skip
+
+    def get_statistics(self):
+        """
+        Return a dictionary with the number of archived votes of each kind.
+        """
+        return dict(
+            agree=self.agree,
+            disagree=self.disagree,
+            skip=self.skip,
+            total=self.total,
+        )
@@ -4,6 +4,7 @@ from model_utils.models import TimeStampedModel
 
 from ..fields import AutoSlugField
 from ..utils import custom_slugify
+from .managers import CategoryManager
 
 
 class Category(TimeStampedModel):
@@ -35,6 +36,8 @@ class Category(TimeStampedModel):
         blank=True,
     )
 
+    objects = CategoryManager()
+
     class Meta:
         verbose_name_plural = 'categories'
 
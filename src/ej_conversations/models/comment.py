@@ -3,11 +3,16 @@ from logging import getLogger
 from django.conf import settings
 from django.core.validators import MaxLengthValidator
 from django.db import models
+from django.db.models import Count, Q
 from django.utils.translation import ugettext_lazy as _
 from model_utils.choices import Choices
 from model_utils.models import TimeStampedModel, StatusModel
+from model_utils.tracker import FieldTracker
 
+from .managers import CommentManager
 from .vote import Vote
+from ..similarity import minhash, dump_signature
+from ..utils import content_hash
 
 log = getLogger('ej-conversations')
 
@@ -42,40 +47,154 @@ class Comment(StatusModel, TimeStampedModel):
         _('Rejection reason'),
         blank=True,
     )
+    content_hash = models.CharField(
+        _('Content hash'),
+        max_length=40,
+        null=True,
+        editable=False,
+        help_text=_('Hash of the normalized content, used to detect duplicates.'),
+    )
+    minhash = models.BinaryField(
+        _('MinHash signature'),
+        null=True,
+        editable=False,
+        help_text=_('Signature used to detect near-duplicate comments.'),
+    )
+    claimed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='claimed_comments',
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        editable=False,
+        help_text=_('Moderator currently reviewing this comment.'),
+    )
+    claimed_until = models.DateTimeField(
+        _('Claimed until'),
+        null=True, blank=True,
+        editable=False,
+    )
+    moderation_priority = models.FloatField(
+        _('Moderation priority'),
+        default=0,
+        editable=False,
+        help_text=_('Pending comments with higher values are moderated first.'),
+    )
+    archived_agree = models.PositiveIntegerField(default=0, editable=False)
+    archived_disagree = models.PositiveIntegerField(default=0, editable=False)
+    archived_skip = models.PositiveIntegerField(default=0, editable=False)
     is_approved = property(lambda self: self.status == self.STATUS.APPROVED)
+    tracker = FieldTracker(fields=['status', 'content'])
+    objects = CommentManager()
 
     class Meta:
-        unique_together = ('conversation', 'content')
+        unique_together = ('conversation', 'content_hash')
+        indexes = [
+            # Moderation queue: only pending comments are indexed on
+            # databases that support partial indexes.
+            models.Index(
+                fields=['-moderation_priority', 'created'],
+                name='ej_comment_pending',
+                condition=Q(status='PENDING'),
+            ),
+        ]
 
     def __str__(self):
         return self.content
 
+    def clean(self):
+        self.update_fingerprints()
+
+    def save(self, *args, **kwargs):
+        self.update_fingerprints()
+        super().save(*args, **kwargs)
+
+    def update_fingerprints(self):
+        """
+        Recompute content_hash and the MinHash signature for new comments or if
+        the content has changed.
+        """
+        if self._state.adding or self.tracker.has_changed('content'):
+            self.content_hash = content_hash(self.content)
+            self.minhash = dump_signature(minhash(self.content))
+
     def vote(self, author, value, commit=True):
         """
         Cast a vote for the current comment.
+
+        The archive of the conversation is restored if the comment has
+        archived votes.
         """
         log.debug(f'Vote: {author} - {value}')
+        if commit and self.get_archived_statistics()['total']:
+            self.restore_votes()
         vote = Vote(author=author, comment=self, value=value)
         vote.full_clean()
         if commit:
             vote.save()
         return vote
 
+    def restore_votes(self):
+        """
+        Move the archived votes of the conversation back to the vote table, so
+        new votes for this comment are checked against them.
+        """
+        from ..archive import restore_conversation
+
+        restore_conversation(self.conversation)
+        self.archived_agree = self.archived_disagree = self.archived_skip = 0
+
     def get_statistics(self):
         """
         Return full voting statistics for given comment.
+
+        Uses the counts annotated by Comment.objects.annotate_statistics(), if
+        present. Otherwise, counts votes in a single query. Archived votes are
+        included in both cases.
         """
+        try:
+            return {name: getattr(self, 'n_' + name) for name in STATISTICS}
+        except AttributeError:
+            stats = self.votes.aggregate(**vote_counts())
+            for name, value in self.get_archived_statistics().items():
+                stats[name] += value
+            return stats
 
+    def get_archived_statistics(self):
+        """
+        Return the number of archived votes of each kind.
+        """
         return dict(
-            agree=votes_counter(self, Vote.AGREE),
-            disagree=votes_counter(self, Vote.DISAGREE),
-            skip=votes_counter(self, Vote.SKIP),
-            total=votes_counter(self),
+            agree=self.archived_agree,
+            disagree=self.archived_disagree,
+            skip=self.archived_skip,
+            total=self.archived_agree + self.archived_disagree + self.archived_skip,
         )
 
 
+STATISTICS = ('agree', 'disagree', 'skip', 'total')
+
+
+def vote_counts(prefix=''):
+    """
+    Return a dictionary with aggregate expressions that count agree,
+    disagree, skip and total votes.
+
+    Prefix is the path from the queried model to votes (e.g., 'votes__').
+    """
+    def count(value=None):
+        condition = None if value is None else Q(**{prefix + 'value': value})
+        return Count(prefix + 'id', filter=condition)
+
+    return dict(
+        agree=count(Vote.AGREE),
+        disagree=count(Vote.DISAGREE),
+        skip=count(Vote.SKIP),
+        total=count(),
+    )
+
+
 def votes_counter(comment, value=None):
     if value is None:
-        return comment.votes.filter(value=value).count()
-    else:
         return comment.votes.count()
+    else:
+        return comment.votes.filter(value=value).count()
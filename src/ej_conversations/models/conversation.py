@@ -3,17 +3,27 @@ from random import randrange
 from autoslug import AutoSlugField
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import models, router
+from django.db.models import Count, OuterRef, Q, QuerySet
 from django.utils.translation import ugettext_lazy as _
 from model_utils.models import TimeStampedModel
 
-from .comment import Comment
+from .archive import VoteArchive
+from .participant import ArchivedParticipant
+from .category import Category
+from .comment import Comment, vote_counts
 from .limits import Limits
 from .vote import Vote
+from .. import caching
+from .. import concurrency
+from .. import config
+from .. import routing
+from .. import similarity
+from ..routers import on_replica
 from ..utils import CommentLimitStatus
-from ..utils import custom_slugify
-from .managers import ConversationManager
+from ..utils import custom_slugify, ratio
+from .managers import ConversationManager, count_subquery, sum_subquery
 
 NOT_GIVEN = object()
 
@@ -62,6 +72,14 @@ class Conversation(TimeStampedModel):
         _('Promoted'),
         default=False,
     )
+    trending_score = models.FloatField(
+        _('Trending score'),
+        default=0.0,
+        db_index=True,
+        editable=False,
+        help_text=_('Time-decayed activity of the conversation. See '
+                    'ej_conversations.trending.'),
+    )
     limits = models.ForeignKey(
         'Limits',
         related_name='conversations',
@@ -75,7 +93,6 @@ class Conversation(TimeStampedModel):
         blank=True, null=True,
     )
 
-    category_name = property(lambda self: self.category.name)
     objects = ConversationManager()
     votes = property(lambda self:
                      Vote.objects.filter(comment__conversation_id=self.id))
@@ -86,6 +103,14 @@ class Conversation(TimeStampedModel):
     def __str__(self):
         return self.title
 
+    @property
+    def category_name(self):
+        # Avoid a query per conversation when the category is not loaded
+        if Conversation.category.is_cached(self):
+            return self.category.name
+        name = Category.objects.cached_names().get(self.category_id)
+        return self.category.name if name is None else name
+
     def get_absolute_url(self):
         # TODO: make this configurable!
         return '/conversations/' + self.slug
@@ -101,45 +126,87 @@ class Conversation(TimeStampedModel):
         By default, this method check if the user can post according to the
         limits imposed by the conversation. It also normalizes duplicate
         comments and reuse duplicates from the database.
+
+        Persisted comments have a ``near_duplicates`` attribute with the ids
+        of similar comments in the conversation.
         """
         if check_limits:
             limit = self.get_limit_status(author)
             if limit in BAD_LIMIT_STATUS:
                 raise PermissionError(CommentLimitStatus.MESSAGES[limit])
 
-        make_comment = Comment.objects.create_or_update if commit else Comment
-        return make_comment(author=author, content=content, **kwargs)
+        if not commit:
+            return Comment(conversation=self, author=author, content=content,
+                           **kwargs)
+
+        comment = Comment.objects.create_or_update(
+            conversation=self, author=author, content=content, **kwargs
+        )
+        similar = self.get_similar_comments(comment, exclude={comment.id})
+        comment.near_duplicates = [pk for pk, _ in similar]
+        return comment
+
+    def get_similar_comments(self, content, threshold=None, status=None,
+                             exclude=()):
+        """
+        Return a list of (comment_id, similarity) pairs for the comments in
+        the conversation that are near-duplicates of the given content.
+
+        Content can be a string or a Comment instance.
+        """
+        if isinstance(content, Comment):
+            signature = similarity.load_signature(content.minhash)
+        else:
+            signature = similarity.minhash(content)
+        index = similarity.get_index(self.id)
+        return index.query(signature, threshold, status=status, exclude=exclude)
+
+    def get_similar_comment_clusters(self, status=Comment.STATUS.PENDING):
+        """
+        Return a list of sets of ids of similar comments with the given status.
+        """
+        return similarity.get_index(self.id).clusters(status=status)
 
     def get_statistics(self):
         """
         Return a dictionary with basic statistics about conversation.
-        """
 
-        # Fixme: this takes several SQL queries. Maybe we can optimize later
+        Vote counts, comment counts and the number of participants are
+        independent queries and run concurrently if CONVERSATION_QUERY_WORKERS
+        is set. Archived votes are included.
+        """
+        votes, comments, participants, archive = concurrency.run_concurrently(
+            lambda: vote_statistics(self),
+            lambda: comment_statistics(self),
+            lambda: participant_count(self),
+            lambda: on_replica(VoteArchive.objects.filter(conversation_id=self.id)).first(),
+            using=router.db_for_read(Vote, replica=True),
+        )
+        if archive is not None:
+            for name, value in archive.get_statistics().items():
+                votes[name] += value
+            # participant_count() skips users with archived votes
+            participants += archive.participants
         return dict(
-            # Vote counts
-            votes=dict(
-                agree=vote_count(self, Vote.AGREE),
-                disagree=vote_count(self, Vote.DISAGREE),
-                skip=vote_count(self, Vote.SKIP),
-                total=vote_count(self),
-            ),
-
-            # Comment counts
-            comments=dict(
-                approved=comment_count(self, Comment.STATUS.APPROVED),
-                rejected=comment_count(self, Comment.STATUS.REJECTED),
-                pending=comment_count(self, Comment.STATUS.PENDING),
-                total=comment_count(self),
-            ),
-
-            # Participants count
-            participants=get_user_model().objects
-                .filter(votes__comment__conversation_id=self.id)
-                .distinct()
-                .count(),
+            votes=votes,
+            comments=comments,
+            participants=participants,
         )
 
+    def get_cached_statistics(self):
+        """
+        Like get_statistics(), but cached.
+
+        The cache is invalidated when comments or votes of the conversation
+        change and expires after CONVERSATION_STATISTICS_CACHE_TIME seconds.
+        """
+        key = caching.statistics_key(self.id)
+        statistics = cache.get(key)
+        if statistics is None:
+            statistics = self.get_statistics()
+            cache.set(key, statistics, config.STATISTICS_CACHE_TIME)
+        return statistics
+
     def get_user_data(self, user):
         """
         Get information about user.
@@ -150,12 +217,31 @@ class Conversation(TimeStampedModel):
 
     def get_votes(self, user=None):
         """
-        Get all votes for the conversation.
+        Get a list of all votes for the conversation, including archived
+        votes, which are unsaved Vote instances.
 
         If a user is supplied, filter votes for the given user.
         """
+        from ..archive import archived_rows, archived_votes
+
         kwargs = {'author_id': user.id} if user else {}
-        return Vote.objects.filter(comment__conversation_id=self.id, **kwargs)
+        votes = list(
+            Vote.objects
+                .filter(comment__conversation_id=self.id, **kwargs)
+                .select_related('comment')
+        )
+        if user:
+            rows = archived_votes(user, [self.id]).get(self.id, ())
+        else:
+            rows = archived_rows(self)
+        archived = [Vote(id=pk, author_id=author, comment_id=comment, value=value,
+                         created=created)
+                    for pk, author, comment, value, created in rows]
+        if archived:
+            comments = Comment.objects.in_bulk({vote.comment_id for vote in archived})
+            for vote in archived:
+                vote.comment = comments[vote.comment_id]
+        return votes + archived
 
     def get_comments(self):
         """
@@ -167,34 +253,67 @@ class Conversation(TimeStampedModel):
         """
         Ratio between "given votes" / "possible votes" for an specific user.
         """
-        max_votes = (
-            self.comments
-                .filter(status=Comment.APPROVED)
-                .exclude(author=user)
-                .count()
-        )
-        if not max_votes:
-            return 0
+        ratios = Conversation.objects.filter(id=self.id).participation_ratios(user)
+        return ratios.get(self.id, 0)
+
+    def participation_ratios(self, users):
+        """
+        Return a dictionary mapping user ids to their participation ratio in
+        the conversation.
+
+        Users can be a queryset or a sequence of users. All ratios are
+        computed in a single query. Archived votes count as votes.
+        """
+        if isinstance(users, QuerySet):
+            users = users.values('pk')
         else:
-            votes = (
-                Vote.objects
-                    .filter(comment__conversation_id=self.id, author=user)
-                    .count()
-            )
-            return votes / max_votes
+            users = [user.pk for user in users]
+
+        approved = self.comments.filter(status=Comment.STATUS.APPROVED)
+        own_comments = approved.filter(author=OuterRef('pk'))
+        votes = Vote.objects.filter(comment__conversation_id=self.id,
+                                    author=OuterRef('pk'))
+        archived = ArchivedParticipant.objects.filter(conversation_id=self.id,
+                                                      author=OuterRef('pk'))
+        rows = (
+            get_user_model().objects
+                .filter(pk__in=users)
+                .order_by()
+                .annotate(n_approved=count_subquery(approved, 'conversation'),
+                          n_own=count_subquery(own_comments, 'author'),
+                          n_votes=count_subquery(votes, 'author'),
+                          n_archived=sum_subquery(archived, 'author', 'votes'))
+                .values_list('pk', 'n_votes', 'n_archived', 'n_approved', 'n_own')
+        )
+        return {pk: ratio(votes + archived, approved - own)
+                for pk, votes, archived, approved, own in rows}
 
-    def get_next_comment(self, user, default=NOT_GIVEN):
+    def get_next_comment(self, user, default=NOT_GIVEN, strategy=None):
         """
         Returns a random comment that user didn't vote yet.
 
+        Comments are drawn according to the given routing strategy (see
+        :mod:`ej_conversations.routing`), which defaults to the
+        CONVERSATION_ROUTING_STRATEGY setting. The 'uniform' strategy gives
+        all comments the same chance.
+
         If default value is not given, raises a Comment.DoesNotExit exception
         if no comments are available for user.
         """
+        from ..archive import archived_votes
+
+        strategy = strategy or config.ROUTING_STRATEGY
+        archived = {row[2] for row in archived_votes(user, [self.id]).get(self.id, ())}
+        if strategy != 'uniform':
+            comment = routing.next_comment(self, user, strategy, archived)
+            if comment is not None:
+                return comment
+
         unvoted_comments = self.comments.filter(
             ~Q(author_id=user.id),
             ~Q(votes__author_id=user.id),
             status=Comment.STATUS.APPROVED,
-        )
+        ).exclude(id__in=archived)
         size = unvoted_comments.count()
         if size:
             return unvoted_comments[randrange(0, size)]
@@ -219,27 +338,40 @@ class Conversation(TimeStampedModel):
         return list(self.get_votes(user))
 
 
-def vote_count(conversation, type=None):
+def vote_statistics(conversation):
     """
-    Return the number of votes of a given type
-
-    ``type=None`` for all votes.
+    Return a dictionary with the number of agree, disagree, skip and total
+    votes in a conversation.
     """
+    votes = Vote.objects.filter(comment__conversation_id=conversation.id)
+    return on_replica(votes).aggregate(**vote_counts())
 
-    kwargs = {'value': type} if type is not None else {}
-    return (
-        Vote.objects
-            .filter(comment__conversation_id=conversation.id, **kwargs)
-            .count()
+
+def comment_statistics(conversation):
+    """
+    Return a dictionary with the number of approved, rejected, pending and
+    total comments in a conversation.
+    """
+    def count(status=None):
+        return Count('id', filter=None if status is None else Q(status=status))
+
+    return on_replica(conversation.comments).aggregate(
+        approved=count(Comment.STATUS.APPROVED),
+        rejected=count(Comment.STATUS.REJECTED),
+        pending=count(Comment.STATUS.PENDING),
+        total=count(),
     )
 
 
-def comment_count(conversation, type=None):
+def participant_count(conversation):
     """
-    Return the number of comments of a given type.
-
-    ``type=None`` for all comments.
+    Return the number of users that voted in a conversation and have no
+    archived votes in it.
     """
-
-    kwargs = {'status': type} if type is not None else {}
-    return conversation.comments.filter(**kwargs).count()
+    archived = ArchivedParticipant.objects.filter(conversation_id=conversation.id)
+    votes = (
+        Vote.objects
+            .filter(comment__conversation_id=conversation.id)
+            .exclude(author_id__in=archived.values('author_id'))
+    )
+    return on_replica(votes).values('author_id').distinct().count()
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
@@ -45,11 +46,24 @@ class Limits(models.Model):
         """
         Verify specific user nudge status in a conversation
         """
-        n_total = self.remaining_comments(user, conversation)
+        counts = (
+            user.comments
+                .filter(conversation_id=conversation.id)
+                .aggregate(total=Count('id'),
+                           interval=Count('id', filter=Q(created__gte=self.interval_start())))
+        )
+        return self.comment_status(counts['total'], counts['interval'])
+
+    def comment_status(self, n_comments, n_interval_comments):
+        """
+        Return the nudge status of a user that posted n_comments in a
+        conversation, n_interval_comments of them in the reference interval.
+        """
+        n_total = max(self.max_comments_per_conversation - n_comments, 0)
         if n_total == 0:
             return CommentLimitStatus.BLOCKED
 
-        n_interval = self.remaining_interval_comments(user, conversation)
+        n_interval = max(self.max_comments_in_interval - n_interval_comments, 0)
         if n_interval == 0:
             return CommentLimitStatus.TEMPORARILY_BLOCKED
         elif n_interval == 1 or n_total == 1:
@@ -57,6 +71,13 @@ class Limits(models.Model):
         else:
             return CommentLimitStatus.OK
 
+    def interval_start(self, now=None):
+        """
+        Return the start time of the reference interval ending now.
+        """
+        now = timezone.now() if now is None else now
+        return now - timezone.timedelta(seconds=self.interval)
+
     def remaining_comments(self, user, conversation):
         """
         Return the number of comments a user can still post in a conversation.
@@ -69,11 +90,10 @@ class Limits(models.Model):
         Return the number of comments a user can still post in a conversation
         in the reference interval.
         """
-        start_time = timezone.now() - timezone.timedelta(seconds=self.interval)
         comments = (
             user.comments
                 .filter(conversation_id=conversation.id)
-                .filter(created__gte=start_time)
+                .filter(created__gte=self.interval_start())
                 .count()
         )
-        return max(self.max_comments_in_interval - comments)
+        return max(self.max_comments_in_interval - comments, 0)
@@ -1,6 +1,86 @@
 from random import randrange
 
-from django.db.models import QuerySet, Manager
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Manager
+from django.db.models import OuterRef, QuerySet, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .. import caching, config
+from ..utils import content_hash, ratio
+
+
+class CategoryQuerySet(QuerySet):
+    def annotate_statistics(self):
+        """
+        Annotate categories with the number of conversations (n_conversations),
+        promoted conversations (n_promoted), active conversations whose votes
+        were not archived (n_active) and votes, including archived votes
+        (n_votes).
+
+        Counts are computed in the same query that loads categories.
+        """
+        from .archive import VoteArchive
+        from .conversation import Conversation
+        from .vote import Vote
+
+        conversations = Conversation.objects.filter(category=OuterRef('pk'))
+        votes = Vote.objects.filter(comment__conversation__category=OuterRef('pk'))
+        archives = VoteArchive.objects.filter(conversation__category=OuterRef('pk'))
+        live_votes = count_subquery(votes, 'comment__conversation__category')
+        archived_votes = sum_subquery(archives, 'conversation__category',
+                                      F('agree') + F('disagree') + F('skip'))
+        return self.annotate(
+            n_conversations=count_subquery(conversations, 'category'),
+            n_promoted=count_subquery(conversations.filter(is_promoted=True), 'category'),
+            n_active=count_subquery(conversations.filter(vote_archive=None), 'category'),
+            n_votes=ExpressionWrapper(live_votes + archived_votes,
+                                      output_field=IntegerField()),
+        )
+
+    def statistics(self):
+        """
+        Return a dictionary mapping the ids of categories in the queryset to
+        their conversation and vote counts.
+        """
+        rows = (
+            self.order_by()
+                .annotate_statistics()
+                .values_list('id', 'n_conversations', 'n_active', 'n_promoted', 'n_votes')
+        )
+        return {
+            pk: {
+                'conversations': {'total': total, 'active': active, 'promoted': promoted},
+                'votes': votes,
+            }
+            for pk, total, active, promoted, votes in rows
+        }
+
+    def cached_statistics(self):
+        """
+        Like statistics(), but for all categories and cached.
+
+        The cache is invalidated when categories or conversations change and
+        expires after CONVERSATION_CATEGORY_CACHE_TIME seconds.
+        """
+        statistics = cache.get(caching.category_statistics_key())
+        if statistics is None:
+            statistics = self.model.objects.all().statistics()
+            cache.set(caching.category_statistics_key(), statistics,
+                      config.CATEGORY_CACHE_TIME)
+        return statistics
+
+    def cached_names(self):
+        """
+        Return a cached dictionary mapping the ids of all categories to their
+        names.
+        """
+        names = cache.get(caching.category_names_key())
+        if names is None:
+            names = dict(self.model.objects.values_list('id', 'name'))
+            cache.set(caching.category_names_key(), names, config.CATEGORY_CACHE_TIME)
+        return names
 
 
 class ConversationQuerySet(QuerySet):
@@ -22,5 +102,317 @@ class ConversationQuerySet(QuerySet):
         print(size, self.all())
         return self.all()[randrange(size)]
 
+    def participation_ratios(self, user):
+        """
+        Return a dictionary mapping the ids of conversations in the queryset
+        to the participation ratio of the given user.
+
+        All ratios are computed in a single query. Archived votes count as
+        votes.
+        """
+        from .comment import Comment
+        from .participant import ArchivedParticipant
+        from .vote import Vote
+
+        approved = (
+            Comment.objects
+                .filter(conversation=OuterRef('pk'), status=Comment.STATUS.APPROVED)
+                .exclude(author_id=user.id)
+        )
+        votes = Vote.objects.filter(comment__conversation=OuterRef('pk'),
+                                    author_id=user.id)
+        archived = ArchivedParticipant.objects.filter(conversation=OuterRef('pk'),
+                                                      author_id=user.id)
+        rows = (
+            self.order_by()
+                .annotate(n_approved=count_subquery(approved, 'conversation'),
+                          n_votes=count_subquery(votes, 'comment__conversation'),
+                          n_archived=sum_subquery(archived, 'conversation', 'votes'))
+                .values_list('id', 'n_votes', 'n_archived', 'n_approved')
+        )
+        return {pk: ratio(votes + archived, max_votes)
+                for pk, votes, archived, max_votes in rows}
+
+    def cached_participation_ratios(self, user):
+        """
+        Like participation_ratios(), but for all conversations and cached.
+
+        The cache is invalidated when the user votes or posts a comment and
+        expires after CONVERSATION_PARTICIPATION_CACHE_TIME seconds.
+        """
+        key = caching.participation_key(user.id)
+        ratios = cache.get(key)
+        if ratios is None:
+            ratios = self.model.objects.all().participation_ratios(user)
+            cache.set(key, ratios, config.PARTICIPATION_CACHE_TIME)
+        return ratios
+
+    def progress(self, user):
+        """
+        Return a dictionary mapping the ids of conversations in the queryset
+        to the progress of the given user in each conversation.
+
+        Progress is a dictionary with the number of votes cast, the number of
+        approved comments the user did not vote yet, the participation ratio
+        and the comment limit status. Archived votes count as votes. It takes
+        two queries regardless of the number of conversations, and two more if
+        the user has archived votes in any of them.
+        """
+        return self._progress(user)[0]
+
+    def cached_progress(self, user):
+        """
+        Like progress(), but for all conversations and cached.
+
+        The cache is invalidated when the user votes or posts a comment and
+        expires when the limit status of any conversation would change.
+        """
+        key = caching.progress_key(user.id)
+        progress = cache.get(key)
+        if progress is None:
+            progress, expires = self.model.objects.all()._progress(user)
+            timeout = config.PARTICIPATION_CACHE_TIME
+            if expires is not None:
+                timeout = min(timeout, max(expires, 1))
+            cache.set(key, progress, timeout)
+        return progress
+
+    def _progress(self, user):
+        # Return the progress dictionary and the number of seconds until the
+        # limit status of some conversation changes (or None).
+        from .comment import Comment
+        from .limits import Limits
+        from .participant import ArchivedParticipant
+        from .vote import Vote
+
+        approved = (
+            Comment.objects
+                .filter(conversation=OuterRef('pk'), status=Comment.STATUS.APPROVED)
+                .exclude(author_id=user.id)
+        )
+        unvoted = approved.exclude(votes__author_id=user.id)
+        votes = Vote.objects.filter(comment__conversation=OuterRef('pk'),
+                                    author_id=user.id)
+        archived = ArchivedParticipant.objects.filter(conversation=OuterRef('pk'),
+                                                      author_id=user.id)
+        conversations = (
+            self.order_by()
+                .select_related('limits')
+                .annotate(n_approved=count_subquery(approved, 'conversation'),
+                          n_unvoted=count_subquery(unvoted, 'conversation'),
+                          n_votes=count_subquery(votes, 'comment__conversation'),
+                          n_archived=sum_subquery(archived, 'conversation', 'votes'))
+        )
+        conversations = list(conversations)
+        archived_unvoted = {}
+        if any(conversation.n_archived for conversation in conversations):
+            archived_unvoted = archived_comment_counts(self, user)
+        comments = {}
+        for conversation_id, created in (
+                Comment.objects
+                    .filter(author_id=user.id, conversation__in=self.values('pk'))
+                    .values_list('conversation_id', 'created')):
+            comments.setdefault(conversation_id, []).append(created)
+
+        now = timezone.now()
+        default_limits = Limits()
+        progress = {}
+        expires = None
+        for conversation in conversations:
+            limits = conversation.limits or default_limits
+            start = limits.interval_start(now)
+            created = comments.get(conversation.id, ())
+            recent = [t for t in created if t >= start]
+            status = limits.comment_status(len(created), len(recent))
+            n_votes = conversation.n_votes + conversation.n_archived
+            n_archived = archived_unvoted.get(conversation.id, 0)
+            progress[conversation.id] = {
+                'votes': n_votes,
+                'remaining_comments': conversation.n_unvoted - n_archived,
+                'participation_ratio': ratio(n_votes, conversation.n_approved),
+                'limit_status': status.value,
+            }
+            for t in recent:
+                seconds = (t - start).total_seconds()
+                expires = seconds if expires is None else min(expires, seconds)
+        return progress, expires
+
+
+class CommentQuerySet(QuerySet):
+    def annotate_statistics(self):
+        """
+        Annotate comments with their number of agree, disagree, skip and total
+        votes as n_agree, n_disagree, n_skip and n_total. Counts include
+        archived votes.
+
+        Comment.get_statistics() uses these annotations instead of querying
+        the database for each comment.
+        """
+        from .comment import vote_counts
+
+        archived = {
+            'agree': F('archived_agree'),
+            'disagree': F('archived_disagree'),
+            'skip': F('archived_skip'),
+            'total': F('archived_agree') + F('archived_disagree') + F('archived_skip'),
+        }
+        counts = vote_counts('votes__')
+        return self.annotate(**{
+            'n_' + name: ExpressionWrapper(expr + archived[name],
+                                           output_field=IntegerField())
+            for name, expr in counts.items()
+        })
+
+    def duplicates(self, conversation, content):
+        """
+        Return comments in conversation whose normalized content matches the
+        given content.
+        """
+        return self.filter(conversation_id=conversation.id,
+                           content_hash=content_hash(content))
+
+    def create_or_update(self, conversation, content, **kwargs):
+        """
+        Create a new comment unless an equivalent comment already exists in the
+        conversation, in which case the existing comment is returned.
+
+        Comments are equivalent if they only differ by case, accents or
+        whitespace.
+        """
+        comment = self.duplicates(conversation, content).first()
+        if comment is not None:
+            return comment
+        try:
+            with transaction.atomic():
+                return self.create(conversation=conversation, content=content,
+                                   **kwargs)
+        except IntegrityError:
+            # Lost a race against a concurrent insert of the same comment
+            return self.duplicates(conversation, content).get()
+
+    def moderate(self, ids, status, reason=''):
+        """
+        Change the status of all comments with the given ids in a single
+        UPDATE statement.
+
+        The rejection reason is only stored for rejected comments and is
+        cleared otherwise. Comments that already have the requested status
+        are left untouched. Save signals are not sent: listeners receive a
+        single comments_moderated signal for the whole batch.
+
+        Moderated comments are released from any moderation lease.
+
+        Return the number of modified comments.
+        """
+        from ..signals import comments_moderated
+
+        if status not in self.model.STATUS:
+            raise ValueError(f'invalid status: {status!r}')
+        reason = reason if status == self.model.STATUS.REJECTED else ''
+
+        with transaction.atomic():
+            queryset = self.filter(id__in=ids).exclude(status=status)
+            changes = list(
+                queryset
+                    .select_for_update()
+                    .values_list('id', 'conversation_id', 'status')
+            )
+            if not changes:
+                return 0
+
+            now = timezone.now()
+            self.filter(id__in=[pk for pk, *_ in changes]).update(
+                status=status,
+                status_changed=now,
+                modified=now,
+                rejection_reason=reason,
+                claimed_by=None,
+                claimed_until=None,
+            )
+            comments_moderated.send(self.model, changes=changes, status=status)
+        return len(changes)
+
+
+class StereotypeVoteQuerySet(QuerySet):
+    def upsert(self, stereotype, values):
+        """
+        Set the votes of a stereotype from a mapping of comment ids to vote
+        values.
+
+        New votes are inserted and changed votes are updated in bulk, taking
+        a constant number of queries. Return a tuple with the number of
+        created and updated votes.
+        """
+        with transaction.atomic():
+            existing = {
+                comment_id: (pk, value)
+                for pk, comment_id, value in (
+                    self.filter(stereotype=stereotype)
+                        .select_for_update()
+                        .values_list('id', 'comment_id', 'value')
+                )
+            }
+            new, changed = [], []
+            for comment_id, value in values.items():
+                vote = self.model(stereotype=stereotype, comment_id=comment_id,
+                                  value=value)
+                if comment_id not in existing:
+                    new.append(vote)
+                elif existing[comment_id][1] != value:
+                    vote.id = existing[comment_id][0]
+                    changed.append(vote)
+            self.bulk_create(new)
+            if changed:
+                self.bulk_update(changed, ['value'])
+        return len(new), len(changed)
+
+
+def archived_comment_counts(conversations, user):
+    """
+    Return a dictionary mapping the ids of conversations to the number of
+    approved comments, not written by user, that received archived votes
+    from user.
+    """
+    from ..archive import archived_votes
+    from .comment import Comment
+
+    comment_ids = {
+        row[2]
+        for rows in archived_votes(user, conversations.values('pk')).values()
+        for row in rows
+    }
+    if not comment_ids:
+        return {}
+    return dict(
+        Comment.objects
+            .filter(id__in=comment_ids, status=Comment.STATUS.APPROVED)
+            .exclude(author_id=user.id)
+            .order_by()
+            .values('conversation_id')
+            .annotate(n=Count('id'))
+            .values_list('conversation_id', 'n')
+    )
+
+
+def count_subquery(queryset, field):
+    """
+    Return an expression that counts the rows of a queryset correlated with
+    an OuterRef() through the given field, or 0 if there are no rows.
+    """
+    queryset = queryset.order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
+
+
+def sum_subquery(queryset, field, expression):
+    """
+    Like count_subquery(), but sums the given expression over the rows.
+    """
+    queryset = queryset.order_by().values(field).annotate(n=Sum(expression)).values('n')
+    return Coalesce(Subquery(queryset, output_field=IntegerField()), 0)
+
 
+CategoryManager = Manager.from_queryset(CategoryQuerySet, 'CategoryManager')
 ConversationManager = Manager.from_queryset(ConversationQuerySet, 'ConversationManager')
+CommentManager = Manager.from_queryset(CommentQuerySet, 'CommentManager')
+StereotypeVoteManager = Manager.from_queryset(StereotypeVoteQuerySet,
+                                              'StereotypeVoteManager')
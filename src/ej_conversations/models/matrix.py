@@ -0,0 +1,54 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class VoteMatrix(models.Model):
+    """
+    Compact users x comments matrix with all votes of a conversation.
+
+    See :mod:`ej_conversations.matrix`.
+    """
+
+    conversation = models.OneToOneField(
+        'Conversation',
+        related_name='vote_matrix',
+        on_delete=models.CASCADE,
+    )
+    users = models.BinaryField(
+        _('User ids'),
+        help_text=_('Little-endian int64 ids of the users in each row.'),
+    )
+    comments = models.BinaryField(
+        _('Comment ids'),
+        help_text=_('Little-endian int64 ids of the comments in each column.'),
+    )
+    data = models.BinaryField(
+        _('Votes'),
+        help_text=_('Row-major matrix with one 2-bit encoded vote per cell.'),
+    )
+    delta = models.BinaryField(
+        _('New votes'),
+        default=b'',
+        help_text=_('Little-endian int64 (user, comment, code) triples of votes '
+                    'not merged into the matrix yet.'),
+    )
+    last_vote_id = models.BigIntegerField(
+        default=0,
+    )
+    synced_votes = models.PositiveIntegerField(
+        default=0,
+        help_text=_('Number of votes in the vote table with ids up to last_vote_id.'),
+    )
+    is_stale = models.BooleanField(
+        default=False,
+        help_text=_('Votes were changed or removed and the matrix must be rebuilt.'),
+    )
+    modified = models.DateTimeField(
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = _('Vote matrix')
+
+    def __str__(self):
+        return f'{self.conversation} ({len(self.users) // 8} x {len(self.comments) // 8})'
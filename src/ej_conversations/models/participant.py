@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class ArchivedParticipant(models.Model):
+    """
+    Archived votes of a single participant of a conversation.
+
+    Complements the VoteArchive of the conversation, so the votes of one user
+    are read without decoding the whole archive (see
+    :mod:`ej_conversations.archive`).
+    """
+
+    conversation = models.ForeignKey(
+        'Conversation',
+        related_name='archived_participants',
+        on_delete=models.CASCADE,
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='archived_participations',
+        on_delete=models.PROTECT,
+    )
+    votes = models.PositiveIntegerField(
+        _('Number of votes'),
+        default=0,
+    )
+    data = models.BinaryField(
+        _('Compressed votes'),
+        help_text=_('Archived votes of the participant, in the format of the '
+                    'conversation archive.'),
+    )
+
+    class Meta:
+        unique_together = ('conversation', 'author')
+        verbose_name = _('Archived participant')
+
+    def __str__(self):
+        return f'{self.author} in {self.conversation} ({self.votes} votes)'
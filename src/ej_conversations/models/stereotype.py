@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
+from .managers import StereotypeVoteManager
 from .vote import Vote
 
 
@@ -22,6 +23,9 @@ class Stereotype(models.Model):
         related_name='conversations',
     )
 
+    def __str__(self):
+        return self.name
+
 
 class StereotypeVote(models.Model):
     """
@@ -43,3 +47,7 @@ class StereotypeVote(models.Model):
         _('Value'),
         choices=Vote.VOTE_CHOICES,
     )
+    objects = StereotypeVoteManager()
+
+    class Meta:
+        unique_together = ('stereotype', 'comment')
@@ -0,0 +1,193 @@
+"""
+A queue of comments awaiting moderation.
+
+Moderators claim batches of pending comments and hold a time-limited lease on
+them, so moderators working in parallel receive disjoint batches. Batches are
+ordered by priority: old comments, comments by authors with a good track
+record and comments with many pending near-duplicates come first.
+
+The priority of a comment grows linearly with its age, so comments can be
+ordered by a key stored with each comment: sorting by the key sorts by the
+priority at any instant. Keys are computed when comments are created and
+refreshed when comments of the same author are moderated, which lets the
+database select the batch from the whole queue using an index.
+"""
+import datetime
+import math
+
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import config
+from . import similarity
+from .models import Comment
+
+#: Weights of each component of the priority score. The age component is
+#: measured in days.
+AGE_WEIGHT = 1.0
+HISTORY_WEIGHT = 1.0
+DUPLICATES_WEIGHT = 0.5
+
+
+def available_comments(conversation=None, now=None):
+    """
+    Return a queryset with pending comments that are not leased to any
+    moderator.
+    """
+    now = now or timezone.now()
+    queryset = Comment.objects.filter(
+        Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+        status=Comment.STATUS.PENDING,
+    )
+    if conversation is not None:
+        queryset = queryset.filter(conversation_id=conversation.id)
+    return queryset
+
+
+def author_history(author_ids):
+    """
+    Return a map from author ids to (approved, rejected) comment counts.
+    """
+    counts = (
+        Comment.objects
+            .filter(author_id__in=set(author_ids))
+            .exclude(status=Comment.STATUS.PENDING)
+            .values_list('author_id', 'status')
+            .annotate(count=Count('id'))
+            .order_by()
+    )
+    history = {}
+    for author_id, status, count in counts:
+        approved, rejected = history.get(author_id, (0, 0))
+        if status == Comment.STATUS.APPROVED:
+            approved += count
+        else:
+            rejected += count
+        history[author_id] = (approved, rejected)
+    return history
+
+
+def pending_duplicates(comment):
+    """
+    Number of pending near-duplicates of comment in the similarity index.
+    """
+    if not comment.minhash:
+        return 0
+    index = similarity.get_index(comment.conversation_id)
+    signature = similarity.load_signature(comment.minhash)
+    matches = index.query(signature, status=Comment.STATUS.PENDING,
+                          exclude={comment.id})
+    return len(matches)
+
+
+#: Reference time of the age component of priority keys
+EPOCH = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def priorities(comments):
+    """
+    Return a map from comment ids to their priority key.
+
+    Higher keys should be moderated first. The priority score of a comment
+    at a given time is its key plus ``AGE_WEIGHT`` times the number of days
+    since :data:`EPOCH`.
+    """
+    history = author_history(c.author_id for c in comments)
+    keys = {}
+    for comment in comments:
+        created = (comment.created - EPOCH).total_seconds() / 86400
+        approved, rejected = history.get(comment.author_id, (0, 0))
+        track_record = (approved - rejected) / (approved + rejected + 1)
+        duplicates = pending_duplicates(comment)
+        keys[comment.id] = sum([
+            -AGE_WEIGHT * created,
+            HISTORY_WEIGHT * track_record,
+            DUPLICATES_WEIGHT * math.log1p(duplicates),
+        ])
+    return keys
+
+
+def update_priorities(queryset):
+    """
+    Store the priority keys of the pending comments in queryset.
+    """
+    comments = list(queryset.filter(status=Comment.STATUS.PENDING))
+    keys = priorities(comments)
+    for comment in comments:
+        comment.moderation_priority = keys[comment.id]
+    Comment.objects.bulk_update(comments, ['moderation_priority'])
+
+
+def comment_created(comment):
+    """
+    Store the priority key of a new pending comment and of its pending
+    near-duplicates, which gained one duplicate.
+    """
+    ids = {comment.id}
+    if comment.minhash:
+        index = similarity.get_index(comment.conversation_id)
+        signature = similarity.load_signature(comment.minhash)
+        matches = index.query(signature, status=Comment.STATUS.PENDING)
+        ids.update(comment_id for comment_id, _ in matches)
+    update_priorities(Comment.objects.filter(id__in=ids))
+
+
+def comments_moderated(comment_ids):
+    """
+    Refresh the priority keys of pending comments whose authors' track record
+    changed because the given comments were moderated.
+    """
+    authors = Comment.objects.filter(id__in=comment_ids).values('author_id')
+    update_priorities(Comment.objects.filter(author_id__in=authors))
+
+
+def claim(moderator, size=20, conversation=None, lease_time=None):
+    """
+    Lease a batch of up to ``size`` pending comments to moderator.
+
+    Return a list of claimed comments ordered by priority. The number of
+    queries does not depend on the size of the queue, and the batch is
+    selected by the database from all available comments.
+    """
+    now = timezone.now()
+    lease_time = config.MODERATION_LEASE_TIME if lease_time is None else lease_time
+    until = now + timezone.timedelta(seconds=lease_time)
+    available = available_comments(conversation, now)
+
+    with transaction.atomic():
+        candidates = available.order_by('-moderation_priority', 'created')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        candidates = list(candidates[:size])
+        ids = [c.id for c in candidates]
+
+        # The conditional update guarantees disjoint batches in databases
+        # without SKIP LOCKED support: rows taken by a concurrent moderator
+        # are no longer available and are simply skipped.
+        available.filter(id__in=ids).update(claimed_by=moderator,
+                                            claimed_until=until)
+        claimed = set(
+            Comment.objects
+                .filter(id__in=ids, claimed_by=moderator, claimed_until=until)
+                .values_list('id', flat=True)
+        )
+
+    result = [c for c in candidates if c.id in claimed]
+    for comment in result:
+        comment.claimed_by = moderator
+        comment.claimed_until = until
+    return result
+
+
+def release(moderator, ids=None):
+    """
+    Release comments leased to moderator.
+
+    If ids is not given, release all comments held by the moderator. Return
+    the number of released comments.
+    """
+    queryset = Comment.objects.filter(claimed_by=moderator)
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    return queryset.update(claimed_by=None, claimed_until=None)
@@ -1,6 +1,6 @@
 import pytest
 from django.contrib.auth import get_user_model
-from model_mommy.recipe import Recipe
+from model_mommy.recipe import Recipe, foreign_key
 
 from .models import Comment, Conversation, Category
 
@@ -13,8 +13,9 @@ conversation = Recipe(
     Conversation,
     title='Conversation',
     slug='conversation',
-    author=user.make,
-    description='description'
+    author=foreign_key(user),
+    category=foreign_key(category),
+    question='question',
 )
 
 
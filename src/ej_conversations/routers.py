@@ -0,0 +1,130 @@
+"""
+Database router that sends read-only queries to a replica.
+
+Add ``ej_conversations.routers.ReplicaRouter`` to DATABASE_ROUTERS and set
+CONVERSATION_REPLICA_DATABASE to the alias of the replica. Reads only go to
+the replica inside a :func:`replica` block or for querysets marked with
+:func:`on_replica`. Everything else, including all writes, uses the primary
+database.
+
+A thread that writes to the database is pinned to the primary until the end
+of the current request, so it reads its own writes even from code that
+prefers the replica.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS
+
+from . import config
+
+_state = threading.local()
+
+
+class ReplicaRouter:
+    """
+    Route reads to the replica when requested and writes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = config.REPLICA_DATABASE
+        if not alias:
+            return None
+        if not is_pinned() and (hints.get('replica') or in_replica()):
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not config.REPLICA_DATABASE:
+            return None
+        pin()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, config.REPLICA_DATABASE}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def in_replica():
+    return getattr(_state, 'replica', 0) > 0
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def pin():
+    """
+    Send all reads of the current thread to the primary database until the
+    end of the request.
+    """
+    _state.pinned = True
+
+
+def unpin(**kwargs):
+    _state.pinned = False
+
+
+request_started.connect(unpin, dispatch_uid='ej_conversations.routers.unpin')
+
+
+@contextmanager
+def replica():
+    """
+    Send reads inside the block to the replica, unless the thread is pinned
+    to the primary.
+    """
+    _state.replica = getattr(_state, 'replica', 0) + 1
+    try:
+        yield
+    finally:
+        _state.replica -= 1
+
+
+@contextmanager
+def primary():
+    """
+    Send all reads inside the block to the primary database.
+    """
+    pinned = is_pinned()
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = pinned
+
+
+def on_replica(queryset):
+    """
+    Return a copy of queryset that reads from the replica unless the thread
+    is pinned to the primary.
+
+    Unlike replica(), the preference is kept by the queryset, so it also works
+    for querysets evaluated lazily (e.g., in streaming responses).
+    """
+    queryset = queryset.all()
+    queryset._add_hints(replica=True)
+    return queryset
+
+
+def get_state():
+    """
+    Return the routing state of the current thread.
+    """
+    return getattr(_state, 'replica', 0), is_pinned()
+
+
+@contextmanager
+def restore_state(state):
+    """
+    Apply the routing state of another thread inside the block.
+    """
+    previous = get_state()
+    _state.replica, _state.pinned = state
+    try:
+        yield
+    finally:
+        _state.replica, _state.pinned = previous
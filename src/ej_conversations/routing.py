@@ -0,0 +1,250 @@
+"""
+Weighted selection of the next comment shown to a participant.
+
+A routing strategy assigns a weight to each approved comment of a
+conversation. Weights are computed from vote counts in a single query and
+kept in memory as cumulative sums, so drawing a comment takes a binary search.
+Stale tables are rebuilt in a background thread while the old table keeps
+serving requests.
+
+Register new strategies with the :func:`strategy` decorator.
+"""
+import math
+import threading
+import time
+from bisect import bisect_right
+from itertools import accumulate
+from random import Random
+
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import config
+
+# Minimum weight of a comment, so no approved comment is ever starved
+MIN_WEIGHT = 0.01
+
+# Number of drawn comments checked against the votes of the user before
+# loading the ids of all comments the user did not vote
+SAMPLE_TRIES = 3
+
+STRATEGIES = {}
+
+_tables = {}
+_tables_lock = threading.Lock()
+_loading_locks = {}
+_random = Random()
+
+
+def strategy(name):
+    """
+    Register a weight function under the given name.
+
+    Weight functions receive the numbers of agree, disagree and skip votes of
+    a comment and its age in seconds since approval, and return a
+    non-negative weight.
+    """
+
+    def decorator(func):
+        STRATEGIES[name] = func
+        return func
+
+    return decorator
+
+
+@strategy('uniform')
+def uniform(agree, disagree, skip, age):
+    return 1.0
+
+
+@strategy('fewest_votes')
+def fewest_votes(agree, disagree, skip, age):
+    return 1.0 / (1 + agree + disagree + skip)
+
+
+@strategy('divisiveness')
+def divisiveness(agree, disagree, skip, age):
+    total = agree + disagree + skip
+    if not total:
+        return 1.0
+    entropy = -sum(n / total * math.log(n / total)
+                   for n in (agree, disagree, skip) if n)
+    return entropy / math.log(3)
+
+
+@strategy('recency')
+def recency(agree, disagree, skip, age):
+    return 0.5 ** (age / config.ROUTING_HALF_LIFE)
+
+
+class WeightTable:
+    """
+    Cumulative weights of approved comments in a conversation.
+    """
+
+    def __init__(self, ids, authors, weights):
+        self.ids = ids
+        self.authors = authors
+        self.weights = [max(w, MIN_WEIGHT) for w in weights]
+        self.cumulative = list(accumulate(self.weights))
+        self.total = self.cumulative[-1] if self.cumulative else 0.0
+        self.created = time.monotonic()
+        self.refreshing = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def sample(self, user_id, exclude=(), random=_random, tries=16):
+        """
+        Draw the id of a comment that was not written by the given user and is
+        not in the exclude set, or None if there is no such comment.
+
+        Rejection sampling keeps draws O(log n) while most comments are still
+        available. A linear pass over the remaining comments is only made if
+        repeated draws fail.
+        """
+        for _ in range(tries if self.total else 0):
+            idx = bisect_right(self.cumulative, random.random() * self.total)
+            idx = min(idx, len(self.ids) - 1)
+            if self.authors[idx] != user_id and self.ids[idx] not in exclude:
+                return self.ids[idx]
+
+        candidates = [
+            (pk, weight)
+            for pk, author, weight in zip(self.ids, self.authors, self.weights)
+            if author != user_id and pk not in exclude
+        ]
+        if not candidates:
+            return None
+        ids, weights = zip(*candidates)
+        return random.choices(ids, weights)[0]
+
+
+def build_table(conversation_id, strategy):
+    """
+    Compute the weight table of a conversation from the database.
+    """
+    from .models import Comment
+
+    weight = STRATEGIES[strategy]
+    rows = (
+        Comment.objects
+            .filter(conversation_id=conversation_id, status=Comment.STATUS.APPROVED)
+            .order_by('id')
+            .annotate_statistics()
+            .values_list('id', 'author_id', 'n_agree', 'n_disagree', 'n_skip',
+                         'status_changed')
+    )
+    now = timezone.now()
+    ids, authors, weights = [], [], []
+    for pk, author, agree, disagree, skip, changed in rows:
+        ids.append(pk)
+        authors.append(author)
+        weights.append(weight(agree, disagree, skip, (now - changed).total_seconds()))
+    return WeightTable(ids, authors, weights)
+
+
+def get_table(conversation_id, strategy):
+    """
+    Return the weight table for the conversation and strategy.
+
+    Tables are built on first access. Tables older than
+    CONVERSATION_ROUTING_REFRESH_TIME seconds are rebuilt in a background
+    thread. Threads building tables of different conversations do not block
+    each other.
+    """
+    key = (conversation_id, strategy)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            lock = _loading_locks.setdefault(key, threading.Lock())
+        elif table.refreshing or \
+                time.monotonic() - table.created < config.ROUTING_REFRESH_TIME:
+            return table
+        else:
+            table.refreshing = True
+
+    if table is None:
+        with lock:
+            with _tables_lock:
+                table = _tables.get(key)
+            if table is None:
+                table = build_table(conversation_id, strategy)
+                with _tables_lock:
+                    _tables[key] = table
+                    _loading_locks.pop(key, None)
+        return table
+
+    thread = threading.Thread(target=refresh_table, args=key, daemon=True)
+    thread.start()
+    return table
+
+
+def refresh_table(conversation_id, strategy):
+    key = (conversation_id, strategy)
+    try:
+        table = build_table(conversation_id, strategy)
+        with _tables_lock:
+            _tables[key] = table
+    except Exception:
+        with _tables_lock:
+            if key in _tables:
+                _tables[key].refreshing = False
+        raise
+    finally:
+        connection.close()
+
+
+def clear_tables():
+    """
+    Discard all in-memory weight tables.
+    """
+    with _tables_lock:
+        _tables.clear()
+        _loading_locks.clear()
+
+
+def next_comment(conversation, user, strategy, archived=()):
+    """
+    Draw an approved comment the user did not write nor vote yet, or return
+    None if the weight table has no such comment.
+
+    Drawn comments are checked with a subquery on the votes of the user, so
+    the ids of voted comments are never loaded. Archived is a collection with
+    the ids of comments with archived votes of the user.
+    """
+    from .models import Comment, Vote
+
+    if strategy not in STRATEGIES:
+        raise ValueError(f'invalid routing strategy: {strategy!r}')
+
+    table = get_table(conversation.id, strategy)
+    voted = Vote.objects.filter(author_id=user.id, comment_id=OuterRef('pk'))
+    available = (
+        Comment.objects
+            .filter(status=Comment.STATUS.APPROVED)
+            .annotate(is_voted=Exists(voted))
+            .filter(is_voted=False)
+    )
+    exclude = set(archived)
+    for _ in range(SAMPLE_TRIES):
+        pk = table.sample(user.id, exclude)
+        if pk is None:
+            return None
+        comment = available.filter(id=pk).first()
+        if comment is not None:
+            return comment
+        exclude.add(pk)
+
+    # The user voted most comments the table offers: only load the ids of
+    # the remaining ones.
+    remaining = set(
+        available
+            .filter(conversation_id=conversation.id)
+            .values_list('id', flat=True)
+    )
+    pk = table.sample(user.id, exclude | (set(table.ids) - remaining))
+    if pk is None:
+        return None
+    return available.filter(id=pk).first()
@@ -0,0 +1,121 @@
+"""
+Consensus and divisiveness scores for comments (requires numpy).
+
+Functions receive arrays with the number of agree, disagree and skip votes of
+each comment and return an array of scores, so a whole conversation is
+scored at once.
+"""
+from .models import Comment
+from .routers import on_replica
+from .utils import require_numpy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def vote_counts(conversation, status=Comment.STATUS.APPROVED):
+    """
+    Return a tuple of (ids, agree, disagree, skip) arrays with the vote
+    counts for comments with the given status in conversation.
+
+    Runs a single query.
+    """
+    require_numpy()
+    rows = on_replica(
+        conversation.comments
+            .filter(status=status)
+            .order_by('id')
+            .annotate_statistics()
+            .values_list('id', 'n_agree', 'n_disagree', 'n_skip')
+    )
+    data = np.array(list(rows), dtype=np.int64).reshape(-1, 4)
+    return tuple(data.T)
+
+
+def agreement(agree, disagree, skip):
+    """
+    Fraction of votes that agree with each comment.
+    """
+    total = agree + disagree + skip
+    return np.divide(agree, total, out=np.zeros(len(total)), where=total > 0)
+
+
+def divisiveness(agree, disagree, skip):
+    """
+    Normalized entropy of the agree/disagree/skip distribution of each
+    comment.
+
+    It is 0 for comments with unanimous (or no) votes and 1 if votes are
+    evenly split between the three options.
+    """
+    counts = np.stack([agree, disagree, skip]).astype(float)
+    total = counts.sum(axis=0)
+    p = np.divide(counts, total, out=np.zeros_like(counts), where=total > 0)
+    logp = np.log(p, out=np.zeros_like(p), where=p > 0)
+    return -(p * logp).sum(axis=0) / np.log(3)
+
+
+def confidence(agree, disagree, skip, z=1.96):
+    """
+    Lower bound of the Wilson score interval for the fraction of agree votes.
+
+    Unlike the raw agreement ratio, it favors comments with many votes over
+    comments with a few unanimous ones. The default z corresponds to a 95%
+    confidence level.
+    """
+    n = (agree + disagree + skip).astype(float)
+    p = agreement(agree, disagree, skip)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        center = p + z * z / (2 * n)
+        margin = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+        bound = (center - margin) / (1 + z * z / n)
+    return np.where(n > 0, bound, 0.0)
+
+
+SCORES = {
+    'agreement': agreement,
+    'divisiveness': divisiveness,
+    'confidence': confidence,
+}
+
+
+def get_scores(agree, disagree, skip):
+    """
+    Return a dictionary mapping score names to arrays of scores.
+    """
+    require_numpy()
+    return {name: func(agree, disagree, skip) for name, func in SCORES.items()}
+
+
+def ordering(ids, scores, descending=False):
+    """
+    Return the array of ids sorted by score.
+
+    Ties are broken by id.
+    """
+    scores = -scores if descending else scores
+    return ids[np.lexsort((ids, scores))]
+
+
+def sort_comments(comments, order):
+    """
+    Return a list with comments sorted by a score.
+
+    Comments must be annotated with Comment.objects.annotate_statistics().
+    Order is a score name, optionally prefixed with "-" for descending order.
+    """
+    require_numpy()
+    name = order.lstrip('-')
+    if name not in SCORES:
+        raise ValueError(f'invalid ordering: {order!r}')
+
+    comments = list(comments)
+    data = np.array([(c.id, c.n_agree, c.n_disagree, c.n_skip) for c in comments],
+                    dtype=np.int64).reshape(-1, 4)
+    ids, agree, disagree, skip = data.T
+    scores = SCORES[name](agree, disagree, skip)
+    position = {pk: i for i, pk in enumerate(ids.tolist())}
+    sorted_ids = ordering(ids, scores, descending=order.startswith('-'))
+    return [comments[position[pk]] for pk in sorted_ids.tolist()]
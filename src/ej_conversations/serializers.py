@@ -3,7 +3,7 @@ from django.urls import reverse
 from rest_framework import serializers
 
 from .mixins import HasAuthorSerializer, HasLinksSerializer
-from .models import Category, Conversation, Comment, Vote
+from .models import Category, Conversation, Comment, Stereotype, Vote
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -14,18 +14,33 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
 
 
 class CategorySerializer(HasLinksSerializer):
+    """
+    Reads conversation counts from a "statistics" dictionary mapping category
+    ids to counts in the serializer context, if given.
+    """
+    statistics = serializers.SerializerMethodField()
+
     class Meta:
         model = Category
-        fields = ('links', 'name', 'slug', 'image', 'image_caption')
+        fields = ('links', 'name', 'slug', 'image', 'image_caption', 'statistics')
         extra_kwargs = {'url': {'lookup_field': 'slug'}}
 
+    def get_statistics(self, obj):
+        statistics = self.context.get('statistics')
+        if statistics is None:
+            statistics = Category.objects.cached_statistics()
+        return statistics.get(obj.id, {
+            'conversations': {'total': 0, 'active': 0, 'promoted': 0},
+            'votes': 0,
+        })
+
 
 class ConversationSerializer(HasAuthorSerializer):
     statistics = serializers.SerializerMethodField()
 
     class Meta:
         model = Conversation
-        fields = ('links', 'title', 'slug', 'description', 'author_name',
+        fields = ('links', 'title', 'slug', 'question', 'author_name',
                   'created', 'modified', 'is_promoted', 'category', 'statistics')
         extra_kwargs = {
             'url': {'lookup_field': 'slug'},
@@ -39,10 +54,28 @@ class ConversationSerializer(HasAuthorSerializer):
         try:
             return obj._statistics
         except AttributeError:
-            obj._statistics = statistics = obj.get_statistics()
+            obj._statistics = statistics = obj.get_cached_statistics()
             return statistics
 
 
+class ProgressSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Progress of the current user in a conversation.
+
+    Expects a "progress" dictionary mapping conversation ids to progress
+    data in the serializer context.
+    """
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Conversation
+        fields = ('url', 'title', 'slug', 'progress')
+        extra_kwargs = {'url': {'lookup_field': 'slug'}}
+
+    def get_progress(self, obj):
+        return self.context['progress'][obj.id]
+
+
 class CommentSerializer(HasAuthorSerializer):
     statistics = serializers.SerializerMethodField()
 
@@ -102,3 +135,52 @@ class VoteSerializer(HasLinksSerializer):
     def create(self, data):
         comment = data.pop('comment')
         return comment.vote(**data)
+
+
+class ModerationSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    status = serializers.ChoiceField(choices=Comment.STATUS)
+    reason = serializers.CharField(allow_blank=True, default='')
+
+
+class ClaimSerializer(serializers.Serializer):
+    size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+    conversation = serializers.SlugRelatedField(
+        slug_field='slug', queryset=Conversation.objects.all(), required=False,
+    )
+
+
+class ReleaseSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class StereotypeSerializer(serializers.HyperlinkedModelSerializer):
+    conversations = serializers.SlugRelatedField(
+        slug_field='slug', queryset=Conversation.objects.all(), many=True,
+        required=False,
+    )
+
+    class Meta:
+        model = Stereotype
+        fields = ('url', 'id', 'name', 'description', 'conversations')
+
+
+class StereotypeVoteSerializer(serializers.Serializer):
+    comment = serializers.IntegerField()
+    value = serializers.ChoiceField(choices=Vote.VOTE_CHOICES)
+
+
+class StereotypeVotesSerializer(serializers.Serializer):
+    conversation = serializers.SlugRelatedField(
+        slug_field='slug', queryset=Conversation.objects.all(),
+    )
+    votes = StereotypeVoteSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        comments = set(data['conversation'].comments.values_list('id', flat=True))
+        invalid = sorted({v['comment'] for v in data['votes']} - comments)
+        if invalid:
+            raise serializers.ValidationError(
+                f'comments do not belong to the conversation: {invalid}'
+            )
+        return data
@@ -0,0 +1,270 @@
+import threading
+
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import Signal, receiver
+
+from . import caching
+from . import config
+from . import matrix
+from . import moderation
+from . import similarity
+from . import streams
+from . import trending
+from .models import Category, Comment, Conversation, Vote
+
+# Sent once for each call to Comment.objects.moderate(). Receives a list of
+# (comment_id, conversation_id, previous_status) tuples as "changes" and the
+# new status as "status".
+comments_moderated = Signal()
+
+# Conversation ids of comments being deleted, so receivers of the votes
+# deleted in cascade do not query the comment of each vote.
+_deleting = threading.local()
+
+
+def publish_on_commit(conversation_id, delta):
+    transaction.on_commit(lambda: streams.publish(conversation_id, delta))
+
+
+def vote_conversation_id(vote):
+    """
+    Return the id of the conversation of a vote.
+
+    The comment of the vote is only fetched if it is not loaded nor being
+    deleted, and the result is stored in the vote.
+    """
+    try:
+        return vote._conversation_id
+    except AttributeError:
+        pass
+    if Vote.comment.is_cached(vote):
+        conversation_id = vote.comment.conversation_id
+    else:
+        try:
+            conversation_id = _deleting.comments[vote.comment_id]
+        except (AttributeError, KeyError):
+            conversation_id = (
+                Comment.objects
+                    .filter(id=vote.comment_id)
+                    .values_list('conversation_id', flat=True)
+                    .first()
+            )
+    vote._conversation_id = conversation_id
+    return conversation_id
+
+
+def is_cascade(vote):
+    """
+    Return True if the vote is being deleted together with its comment.
+    """
+    return vote.comment_id in getattr(_deleting, 'comments', {})
+
+
+@receiver(pre_delete, sender=Comment)
+def comment_deleting(sender, instance, **kwargs):
+    if not hasattr(_deleting, 'comments'):
+        _deleting.comments = {}
+    _deleting.comments[instance.id] = instance.conversation_id
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted_cleanup(sender, instance, **kwargs):
+    getattr(_deleting, 'comments', {}).pop(instance.id, None)
+
+
+@receiver(request_finished)
+def deleting_cleanup(sender, **kwargs):
+    # Comments whose deletion failed never reach post_delete.
+    _deleting.comments = {}
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_author_cache(sender, instance, **kwargs):
+    caching.invalidate_user(instance.author_id)
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def invalidate_conversation_cache(sender, instance, **kwargs):
+    caching.invalidate_conversations([instance.slug])
+    caching.invalidate_categories()
+
+
+@receiver(post_save, sender=Category)
+def invalidate_category_conversations_cache(sender, instance, **kwargs):
+    slugs = instance.conversations.values_list('slug', flat=True)
+    caching.invalidate_conversations(list(slugs))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    caching.invalidate_categories(names=True)
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def invalidate_vote_statistics_cache(sender, instance, **kwargs):
+    # Statistics are invalidated once by the comment of votes deleted in
+    # cascade.
+    if not is_cascade(instance):
+        caching.invalidate_statistics(vote_conversation_id(instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_statistics_cache(sender, instance, **kwargs):
+    caching.invalidate_statistics(instance.conversation_id)
+
+
+@receiver(post_save, sender=Vote)
+@receiver(post_delete, sender=Vote)
+def vote_matrix_stale(sender, instance, created=False, **kwargs):
+    # New votes are picked up incrementally, but changed or removed votes
+    # require rebuilding the matrix. Comments mark it stale once for the
+    # votes deleted with them.
+    if not created and not is_cascade(instance):
+        matrix.mark_stale(vote_conversation_id(instance))
+
+
+@receiver(pre_delete, sender=Comment)
+def comment_matrix_stale(sender, instance, **kwargs):
+    # Marks the matrix stale for all votes of the comment, so votes deleted
+    # in cascade do not update it one by one.
+    matrix.mark_stale(instance.conversation_id)
+
+
+@receiver(post_delete, sender=Conversation)
+def conversation_matrix_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: matrix.remove_files(instance.id))
+
+
+@receiver(post_save, sender=Vote)
+def vote_trending(sender, instance, created, **kwargs):
+    if created:
+        trending.record_activity(instance.comment.conversation_id,
+                                 config.TRENDING_VOTE_WEIGHT, instance.created)
+
+
+@receiver(post_save, sender=Comment)
+def comment_trending(sender, instance, created, **kwargs):
+    if created:
+        trending.record_activity(instance.conversation_id,
+                                 config.TRENDING_COMMENT_WEIGHT, instance.created)
+
+
+@receiver(post_save, sender=Vote)
+def vote_saved(sender, instance, created, **kwargs):
+    if not created:
+        return
+    conversation_id = vote_conversation_id(instance)
+    if not streams.has_subscribers(conversation_id):
+        return
+
+    name = Vote.VOTE_NAMES[instance.value]
+    delta = {'votes': {name: 1, 'total': 1}}
+    is_new_participant = not (
+        Vote.objects
+            .filter(author_id=instance.author_id,
+                    comment__conversation_id=conversation_id)
+            .exclude(id=instance.id)
+            .exists()
+    )
+    if is_new_participant:
+        delta['participants'] = 1
+    publish_on_commit(conversation_id, delta)
+
+
+@receiver(post_delete, sender=Vote)
+def vote_deleted(sender, instance, **kwargs):
+    # Votes deleted in cascade are accounted for by refreshing the snapshot
+    # once for their comment.
+    if is_cascade(instance):
+        return
+    conversation_id = vote_conversation_id(instance)
+    if not streams.has_subscribers(conversation_id):
+        return
+
+    name = Vote.VOTE_NAMES[instance.value]
+    delta = {'votes': {name: -1, 'total': -1}}
+    was_last_vote = not (
+        Vote.objects
+            .filter(author_id=instance.author_id,
+                    comment__conversation_id=conversation_id)
+            .exists()
+    )
+    if was_last_vote:
+        delta['participants'] = -1
+    publish_on_commit(conversation_id, delta)
+
+
+@receiver(post_save, sender=Comment)
+def comment_indexed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: similarity.index_comment(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_prioritized(sender, instance, created, **kwargs):
+    if created and instance.status == Comment.STATUS.PENDING:
+        moderation.comment_created(instance)
+    elif not created and instance.tracker.has_changed('status'):
+        moderation.comments_moderated([instance.id])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_unindexed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: similarity.unindex_comment(instance))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    conversation_id = instance.conversation_id
+    if not streams.has_subscribers(conversation_id):
+        return
+
+    status = instance.status.lower()
+    if created:
+        delta = {'comments': {status: 1, 'total': 1}}
+    elif instance.tracker.has_changed('status'):
+        previous = instance.tracker.previous('status').lower()
+        delta = {'comments': {status: 1, previous: -1}}
+    else:
+        return
+    publish_on_commit(conversation_id, delta)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    conversation_id = instance.conversation_id
+    if streams.has_subscribers(conversation_id):
+        status = instance.status.lower()
+        delta = {'comments': {status: -1, 'total': -1}}
+        publish_on_commit(conversation_id, delta)
+        transaction.on_commit(lambda: streams.refresh(conversation_id))
+
+
+def set_comments_status(changes, status):
+    for comment_id, conversation_id, _ in changes:
+        similarity.set_comment_status(conversation_id, comment_id, status)
+
+
+@receiver(comments_moderated)
+def comments_moderated_handler(sender, changes, status, **kwargs):
+    deltas = {}
+    for conversation_id in {change[1] for change in changes}:
+        caching.invalidate_statistics(conversation_id)
+    transaction.on_commit(lambda: set_comments_status(changes, status))
+    for comment_id, conversation_id, previous in changes:
+        if streams.has_subscribers(conversation_id):
+            counts = deltas.setdefault(conversation_id, {})
+            counts[previous.lower()] = counts.get(previous.lower(), 0) - 1
+            counts[status.lower()] = counts.get(status.lower(), 0) + 1
+
+    for conversation_id, counts in deltas.items():
+        publish_on_commit(conversation_id, {'comments': counts})
+    moderation.comments_moderated([change[0] for change in changes])
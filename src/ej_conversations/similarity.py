@@ -0,0 +1,390 @@
+"""
+Near-duplicate detection of comments using MinHash signatures and
+locality-sensitive hashing (LSH).
+
+Each comment stores a MinHash signature of the character shingles of its
+normalized content. Signatures are split into bands and every band is hashed
+into a bucket of an in-memory per-conversation index. Comments that share at
+least one bucket are candidate near-duplicates, so lookups never compare a
+comment against every other comment in the conversation.
+
+Indexes are rebuilt from the database in a background thread every
+CONVERSATION_SIMILARITY_REFRESH_TIME seconds, which picks up comments created,
+moderated or deleted by other processes. The old index is served until the new
+one is ready. Only the CONVERSATION_SIMILARITY_MAX_INDEXES most recently used
+indexes are kept in memory.
+"""
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from random import Random
+
+from django.db import connection
+
+from . import config
+from .utils import normalize_text
+
+SHINGLE_SIZE = 3
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+_random = Random(42)
+PERMUTATIONS = [
+    (_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+del _random
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+_loading_locks = {}
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Return the set of character n-grams of the normalized text.
+    """
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash(text):
+    """
+    Compute the MinHash signature of text as a tuple of 32 bit integers.
+    """
+    hashes = [zlib.crc32(s.encode('utf8')) for s in shingles(text)]
+    return tuple(
+        min((a * x + b) % MERSENNE_PRIME for x in hashes) & MAX_HASH
+        for a, b in PERMUTATIONS
+    )
+
+
+def dump_signature(signature):
+    """
+    Serialize signature to bytes.
+    """
+    return array('I', signature).tobytes()
+
+
+def load_signature(data):
+    """
+    Load signature from the bytes created by dump_signature().
+    """
+    signature = array('I')
+    signature.frombytes(bytes(data))
+    return tuple(signature)
+
+
+def similarity(sig_a, sig_b):
+    """
+    Estimate the Jaccard similarity between two signatures.
+    """
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / NUM_PERMUTATIONS
+
+
+def band_keys(signature):
+    for band in range(NUM_BANDS):
+        start = band * ROWS_PER_BAND
+        yield band, signature[start:start + ROWS_PER_BAND]
+
+
+class LSHIndex:
+    """
+    An in-memory LSH index of comment signatures.
+
+    Each comment is registered with its signature and its moderation status.
+    """
+
+    def __init__(self, threshold=None):
+        self.threshold = config.SIMILARITY_THRESHOLD if threshold is None else threshold
+        self.buckets = {}
+        self.signatures = {}
+        self.status = {}
+        self.created = time.monotonic()
+        self.lock = threading.RLock()
+
+        # Changes made while the index is rebuilt are replayed on the new
+        # index, which also receives changes made after it replaced this one.
+        self.rebuilding = False
+        self.changes = []
+        self.replaced_by = None
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def __contains__(self, comment_id):
+        return comment_id in self.signatures
+
+    def add(self, comment_id, signature, status=None):
+        """
+        Insert or replace a comment in the index.
+        """
+        with self.lock:
+            if comment_id in self.signatures:
+                self.remove(comment_id)
+            self.signatures[comment_id] = signature
+            self.status[comment_id] = status
+            for key in band_keys(signature):
+                self.buckets.setdefault(key, set()).add(comment_id)
+
+    def remove(self, comment_id):
+        """
+        Remove comment from index, if present.
+        """
+        with self.lock:
+            signature = self.signatures.pop(comment_id, None)
+            self.status.pop(comment_id, None)
+            if signature is None:
+                return
+            for key in band_keys(signature):
+                bucket = self.buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(comment_id)
+                    if not bucket:
+                        del self.buckets[key]
+
+    def set_status(self, comment_id, status):
+        with self.lock:
+            if comment_id in self.status:
+                self.status[comment_id] = status
+
+    def record(self, method, *args):
+        """
+        Call one of add(), remove() or set_status() for a change made by the
+        current process.
+
+        Unlike calling the method directly, the change is not lost if the
+        index is being rebuilt or was already replaced.
+        """
+        with self.lock:
+            if self.replaced_by is not None:
+                return self.replaced_by.record(method, *args)
+            getattr(self, method)(*args)
+            if self.rebuilding:
+                self.changes.append((method, args))
+
+    def is_stale(self):
+        return time.monotonic() - self.created > config.SIMILARITY_REFRESH_TIME
+
+    def candidates(self, signature):
+        """
+        Return the set of ids sharing at least one bucket with signature.
+        """
+        result = set()
+        for key in band_keys(signature):
+            result.update(self.buckets.get(key, ()))
+        return result
+
+    def query(self, signature, threshold=None, status=None, exclude=()):
+        """
+        Return a list of (comment_id, similarity) pairs for the comments similar
+        to the given signature, most similar first.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        with self.lock:
+            matches = []
+            for comment_id in self.candidates(signature):
+                if comment_id in exclude:
+                    continue
+                if status is not None and self.status[comment_id] != status:
+                    continue
+                score = similarity(signature, self.signatures[comment_id])
+                if score >= threshold:
+                    matches.append((comment_id, score))
+        matches.sort(key=lambda x: (-x[1], x[0]))
+        return matches
+
+    def clusters(self, status=None, threshold=None):
+        """
+        Group similar comments into clusters.
+
+        Return a list of sets of comment ids, largest clusters first. Only
+        clusters with more than one element are returned.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        parent = {}
+
+        def find(x):
+            while parent.setdefault(x, x) != x:
+                parent[x] = x = parent[parent[x]]
+            return x
+
+        with self.lock:
+            for bucket in self.buckets.values():
+                members = [x for x in bucket
+                           if status is None or self.status[x] == status]
+                if len(members) < 2:
+                    continue
+                head, *tail = members
+                head_signature = self.signatures[head]
+                for comment_id in tail:
+                    score = similarity(head_signature, self.signatures[comment_id])
+                    if score >= threshold:
+                        parent[find(comment_id)] = find(head)
+
+        groups = {}
+        for comment_id in parent:
+            groups.setdefault(find(comment_id), set()).add(comment_id)
+        result = [group for group in groups.values() if len(group) > 1]
+        result.sort(key=lambda x: (-len(x), min(x)))
+        return result
+
+
+def get_index(conversation_id):
+    """
+    Return the similarity index for the given conversation.
+
+    The index is loaded from the database on first access. Indexes older
+    than CONVERSATION_SIMILARITY_REFRESH_TIME seconds are rebuilt in a
+    background thread. Threads loading indexes of different conversations do
+    not block each other.
+    """
+    with _indexes_lock:
+        index = _indexes.get(conversation_id)
+        if index is not None:
+            _indexes.move_to_end(conversation_id)
+        else:
+            lock = _loading_locks.setdefault(conversation_id, threading.Lock())
+
+    if index is None:
+        with lock:
+            with _indexes_lock:
+                index = _indexes.get(conversation_id)
+            if index is None:
+                index = build_index(conversation_id)
+                with _indexes_lock:
+                    install_index(conversation_id, index)
+                    _loading_locks.pop(conversation_id, None)
+        return index
+
+    if index.is_stale() and start_rebuild(index):
+        thread = threading.Thread(target=refresh_index, args=(conversation_id, index),
+                                  daemon=True)
+        thread.start()
+    return index
+
+
+def build_index(conversation_id):
+    """
+    Create a new index with the signatures of all comments of a conversation.
+    """
+    from .models import Comment
+
+    index = LSHIndex()
+    comments = (
+        Comment.objects
+            .filter(conversation_id=conversation_id, minhash__isnull=False)
+            .values_list('id', 'minhash', 'status')
+    )
+    for comment_id, data, status in comments.iterator():
+        signature = load_signature(data) if data else None
+        if signature:
+            index.add(comment_id, signature, status)
+    return index
+
+
+def rebuild_index(conversation_id, index):
+    """
+    Replace index with a new one built from the database and return it.
+
+    Other threads keep using the old index during the rebuild. If another
+    thread is already rebuilding it, the old index is returned.
+    """
+    with index.lock:
+        if index.replaced_by is not None:
+            return index.replaced_by
+    if not start_rebuild(index):
+        return index
+    return replace_index(conversation_id, index)
+
+
+def start_rebuild(index):
+    """
+    Mark index as being rebuilt. Return False if it is already being rebuilt
+    or was replaced.
+    """
+    with index.lock:
+        if index.rebuilding or index.replaced_by is not None:
+            return False
+        index.rebuilding = True
+        index.changes = []
+        return True
+
+
+def replace_index(conversation_id, index):
+    """
+    Build the index that replaces an index marked by start_rebuild().
+    """
+    try:
+        new_index = build_index(conversation_id)
+    except Exception:
+        with index.lock:
+            index.rebuilding = False
+            index.changes = []
+        raise
+
+    with index.lock:
+        for method, args in index.changes:
+            getattr(new_index, method)(*args)
+        index.replaced_by = new_index
+        index.rebuilding = False
+        index.changes = []
+        with _indexes_lock:
+            if _indexes.get(conversation_id) is index:
+                install_index(conversation_id, new_index)
+    return new_index
+
+
+def refresh_index(conversation_id, index):
+    try:
+        replace_index(conversation_id, index)
+    finally:
+        connection.close()
+
+
+def install_index(conversation_id, index):
+    # Must be called with _indexes_lock held
+    _indexes[conversation_id] = index
+    _indexes.move_to_end(conversation_id)
+    while len(_indexes) > config.SIMILARITY_MAX_INDEXES:
+        _indexes.popitem(last=False)
+
+
+def index_comment(comment):
+    """
+    Update the in-memory index of the comment's conversation, if it is loaded.
+    """
+    index = _indexes.get(comment.conversation_id)
+    if index is not None and comment.minhash:
+        index.record('add', comment.id, load_signature(comment.minhash), comment.status)
+
+
+def set_comment_status(conversation_id, comment_id, status):
+    """
+    Update the status of an indexed comment, if its index is loaded.
+    """
+    index = _indexes.get(conversation_id)
+    if index is not None:
+        index.record('set_status', comment_id, status)
+
+
+def unindex_comment(comment):
+    index = _indexes.get(comment.conversation_id)
+    if index is not None:
+        index.record('remove', comment.id)
+
+
+def clear_indexes():
+    """
+    Discard all in-memory indexes.
+    """
+    with _indexes_lock:
+        _indexes.clear()
+        _loading_locks.clear()
@@ -0,0 +1,117 @@
+"""
+Compare stereotypes with real participants (requires numpy).
+
+Votes of a conversation are read from its vote matrix (see
+:mod:`ej_conversations.matrix`), which also holds archived votes. The agreement of every participant with every stereotype is
+then computed with a few matrix products instead of one query per user.
+"""
+from . import matrix
+from .models import Comment, StereotypeVote, Vote
+from .routers import on_replica
+from .utils import require_numpy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+VALUES = (Vote.AGREE, Vote.DISAGREE, Vote.SKIP)
+
+
+def vote_matrix(conversation):
+    """
+    Return a tuple (user_ids, comment_ids, values, voted) with the votes cast
+    in conversation.
+
+    Values is an int8 matrix with one row per user and one column per
+    approved comment. Voted is a boolean matrix of the same shape that tells
+    which entries hold a vote.
+    """
+    require_numpy()
+    comments = on_replica(conversation.comments.filter(status=Comment.STATUS.APPROVED))
+    comment_ids = np.array(
+        list(comments.order_by('id').values_list('id', flat=True)),
+        dtype=np.int64,
+    )
+    user_ids, voted_ids, codes = matrix.get_matrix(conversation)
+    columns = np.searchsorted(voted_ids, comment_ids)
+    found = columns < len(voted_ids)
+    found[found] = voted_ids[columns[found]] == comment_ids[found]
+
+    values = np.zeros((len(user_ids), len(comment_ids)), dtype=np.int8)
+    voted = np.zeros(values.shape, dtype=bool)
+    values[:, found], voted[:, found] = matrix.decode(codes[:, columns[found]])
+
+    # Drop users that only voted on comments that are no longer approved
+    rows = voted.any(axis=1)
+    return user_ids[rows], comment_ids, values[rows], voted[rows]
+
+
+def stereotype_matrix(stereotypes, comment_ids):
+    """
+    Like vote_matrix(), but for the votes of the given stereotypes on the
+    given comments. Rows follow the order of stereotypes.
+    """
+    require_numpy()
+    index = {pk: i for i, pk in enumerate(s.id for s in stereotypes)}
+    values = np.zeros((len(index), len(comment_ids)), dtype=np.int8)
+    voted = np.zeros(values.shape, dtype=bool)
+    votes = (
+        StereotypeVote.objects
+            .filter(stereotype_id__in=list(index))
+            .values_list('stereotype_id', 'comment_id', 'value')
+    )
+    for stereotype_id, comment_id, value in votes:
+        row = index[stereotype_id]
+        column = np.searchsorted(comment_ids, comment_id)
+        if column == len(comment_ids) or comment_ids[column] != comment_id:
+            continue
+        values[row, column] = value
+        voted[row, column] = True
+    return values, voted
+
+
+def agreement(values, voted, ref_values, ref_voted):
+    """
+    Compare each row of (values, voted) with each row of (ref_values,
+    ref_voted).
+
+    Return two matrices with one row per user and one column per reference:
+    the fraction of common comments in which both cast the same vote, and
+    the number of common comments.
+    """
+    require_numpy()
+    matches = np.zeros((len(values), len(ref_values)))
+    for value in VALUES:
+        a = ((values == value) & voted).astype(float)
+        b = ((ref_values == value) & ref_voted).astype(float)
+        matches += a @ b.T
+    common = voted.astype(float) @ ref_voted.T.astype(float)
+    ratio = np.divide(matches, common, out=np.zeros_like(matches), where=common > 0)
+    return ratio, common.astype(np.int64)
+
+
+def rank_participants(conversation, stereotypes, min_common=1):
+    """
+    Rank participants of a conversation by their agreement with each
+    stereotype.
+
+    Return a dictionary mapping stereotype ids to lists of (user_id,
+    agreement, common) tuples, sorted by decreasing agreement and number of
+    comments in common. Participants with less than min_common comments in
+    common with a stereotype are omitted.
+    """
+    stereotypes = list(stereotypes)
+    user_ids, comment_ids, values, voted = vote_matrix(conversation)
+    ref_values, ref_voted = stereotype_matrix(stereotypes, comment_ids)
+    ratio, common = agreement(values, voted, ref_values, ref_voted)
+
+    result = {}
+    for j, stereotype in enumerate(stereotypes):
+        order = np.lexsort((user_ids, -common[:, j], -ratio[:, j]))
+        order = order[common[order, j] >= min_common]
+        result[stereotype.id] = [
+            (int(user_ids[i]), float(ratio[i, j]), int(common[i, j]))
+            for i in order
+        ]
+    return result
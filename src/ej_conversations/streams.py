@@ -0,0 +1,255 @@
+"""
+In-process publish/subscribe of live conversation statistics.
+
+Each conversation with at least one subscriber has a single
+:class:`StatisticsChannel`. The channel computes the statistics snapshot and
+keeps it up to date by applying the deltas published by model signals,
+fanning them out to every subscriber queue. No external broker is involved,
+hence deltas only reflect events produced by the current process. The
+snapshot is recomputed every CONVERSATION_STATISTICS_REFRESH_TIME seconds
+and sent to subscribers, which corrects changes made elsewhere.
+"""
+import json
+import threading
+import time
+from copy import deepcopy
+from queue import Queue, Empty, Full
+
+from rest_framework.renderers import BaseRenderer
+
+from . import config
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+class StatisticsChannel:
+    """
+    Fan out statistics deltas of a single conversation to many subscribers.
+    """
+
+    def __init__(self, conversation_id):
+        self.conversation_id = conversation_id
+        self.subscribers = set()
+        self.snapshot = None
+        self.updated = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    def subscribe(self):
+        """
+        Return a new queue that receives (event, data) pairs.
+        """
+        queue = Queue(maxsize=config.STREAM_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            self.subscribers.discard(queue)
+            if not self.subscribers:
+                self.snapshot = None
+
+    def get_snapshot(self):
+        """
+        Return the current statistics. The database is only hit by the first
+        subscriber of the channel and when the snapshot is refreshed.
+        """
+        self.refresh()
+        with self.lock:
+            return deepcopy(self.snapshot)
+
+    def is_stale(self):
+        refresh_time = config.STATISTICS_REFRESH_TIME
+        if self.snapshot is None:
+            return True
+        return bool(refresh_time) and time.monotonic() - self.updated >= refresh_time
+
+    def seconds_to_refresh(self):
+        """
+        Return the number of seconds until the snapshot must be refreshed, or
+        None if it is never refreshed.
+        """
+        refresh_time = config.STATISTICS_REFRESH_TIME
+        if not refresh_time or self.updated is None:
+            return None
+        return max(0.0, self.updated + refresh_time - time.monotonic())
+
+    def refresh(self, force=False):
+        """
+        Recompute a stale snapshot from the database and send it to
+        subscribers.
+
+        Only one thread recomputes the snapshot at a time, and threads that
+        wait for it do not recompute it again. Return True if the snapshot
+        was recomputed.
+        """
+        from .models import Conversation
+
+        with self.refresh_lock:
+            if not force and not self.is_stale():
+                return False
+            conversation = Conversation.objects.get(id=self.conversation_id)
+            snapshot = conversation.get_statistics()
+            with self.lock:
+                send = self.snapshot is not None
+                self.snapshot = snapshot
+                self.updated = time.monotonic()
+                if send:
+                    for queue in self.subscribers:
+                        send_snapshot(queue, snapshot)
+        return True
+
+    def publish(self, delta):
+        """
+        Apply delta to the statistics snapshot and forward it to subscribers.
+
+        Subscribers that cannot keep up have their queue flushed and receive
+        a full snapshot instead.
+        """
+        with self.lock:
+            if self.snapshot is not None:
+                apply_delta(self.snapshot, delta)
+            for queue in self.subscribers:
+                try:
+                    queue.put_nowait(('delta', delta))
+                except Full:
+                    if self.snapshot is not None:
+                        send_snapshot(queue, self.snapshot)
+                    else:
+                        flush_queue(queue)
+
+
+def subscribe(conversation_id):
+    """
+    Subscribe to the channel of the given conversation, creating it if
+    necessary, and return a (channel, queue) pair.
+
+    The channel is looked up and subscribed to under the same lock used by
+    :func:`release_channel`, so it cannot be discarded in between.
+    """
+    with _channels_lock:
+        try:
+            channel = _channels[conversation_id]
+        except KeyError:
+            channel = _channels[conversation_id] = StatisticsChannel(conversation_id)
+        return channel, channel.subscribe()
+
+
+def release_channel(channel, queue):
+    """
+    Unsubscribe queue and discard the channel if it has no subscribers left.
+    """
+    with _channels_lock:
+        channel.unsubscribe(queue)
+        if not channel.subscribers:
+            _channels.pop(channel.conversation_id, None)
+
+
+def has_subscribers(conversation_id):
+    """
+    Cheap check used by producers to avoid computing unwanted deltas.
+    """
+    return conversation_id in _channels
+
+
+def publish(conversation_id, delta):
+    """
+    Publish a statistics delta for the given conversation.
+
+    This is a no-op if nobody is listening.
+    """
+    channel = _channels.get(conversation_id)
+    if channel is not None and delta:
+        channel.publish(delta)
+
+
+def refresh(conversation_id):
+    """
+    Recompute the snapshot of a conversation after changes that do not
+    publish deltas, such as bulk imports.
+
+    This is a no-op if nobody is listening.
+    """
+    channel = _channels.get(conversation_id)
+    if channel is not None:
+        channel.refresh(force=True)
+
+
+def apply_delta(statistics, delta):
+    """
+    Recursively add the values of delta to the statistics dictionary.
+    """
+    for key, value in delta.items():
+        if isinstance(value, dict):
+            apply_delta(statistics.setdefault(key, {}), value)
+        else:
+            statistics[key] = statistics.get(key, 0) + value
+    return statistics
+
+
+def send_snapshot(queue, snapshot):
+    """
+    Replace all pending events of queue with a full snapshot.
+    """
+    flush_queue(queue)
+    queue.put_nowait(('statistics', deepcopy(snapshot)))
+
+
+def flush_queue(queue):
+    try:
+        while True:
+            queue.get_nowait()
+    except Empty:
+        pass
+
+
+def format_event(event, data):
+    """
+    Format a server-sent event.
+    """
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def event_stream(conversation_id, keepalive=None):
+    """
+    Iterate over server-sent events for the given conversation.
+
+    The first event is a full "statistics" snapshot, followed by "delta"
+    events as votes and comments arrive, and a new "statistics" snapshot
+    whenever it is refreshed.
+    """
+    keepalive = config.STREAM_KEEPALIVE if keepalive is None else keepalive
+    channel, queue = subscribe(conversation_id)
+    try:
+        yield format_event('statistics', channel.get_snapshot())
+        while True:
+            # Refreshed snapshots are delivered through the queue
+            channel.refresh()
+            timeout = channel.seconds_to_refresh()
+            if timeout is None or timeout >= keepalive:
+                timeout = keepalive
+            try:
+                event, data = queue.get(timeout=timeout)
+            except Empty:
+                if timeout == keepalive:
+                    yield ': keepalive\n\n'
+            else:
+                yield format_event(event, data)
+    finally:
+        release_channel(channel, queue)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Allow DRF content negotiation to accept "text/event-stream" requests.
+
+    Views are expected to return a StreamingHttpResponse directly.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data)
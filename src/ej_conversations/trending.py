@@ -0,0 +1,113 @@
+"""
+Trending scores of conversations.
+
+The trending score of a conversation is the sum of the weights of its votes
+and comments, each decaying exponentially with the time since it happened.
+Scores are stored with forward decay: each event adds its weight multiplied
+by exp(rate * (time - EPOCH)), so old scores never need to be updated, and
+the order of conversations by stored score is the same as the order by their
+decayed score at any moment. Scores are kept in the log domain to avoid
+overflows.
+
+Each new vote or comment updates the score of its conversation with a single
+UPDATE statement, and the feed is sorted by an indexed column.
+"""
+import datetime
+import math
+
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from . import config
+
+EPOCH = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Stored score of conversations without any activity
+NO_SCORE = 0.0
+
+
+def decay_rate():
+    return math.log(2) / config.TRENDING_HALF_LIFE
+
+
+def event_score(weight, time):
+    """
+    Return the log-domain contribution of an event with the given weight
+    that happened at the given time.
+    """
+    return math.log(weight) + (time - EPOCH).total_seconds() * decay_rate()
+
+
+def add_scores(a, b):
+    """
+    Return log(exp(a) + exp(b)) without overflows.
+
+    NO_SCORE is treated as the score of no events.
+    """
+    if a == NO_SCORE:
+        return b
+    if b == NO_SCORE:
+        return a
+    return max(a, b) + math.log1p(math.exp(-abs(a - b)))
+
+
+def decayed_score(score, now=None):
+    """
+    Convert a stored score into the sum of decayed event weights at the
+    given time.
+    """
+    if score == NO_SCORE:
+        return 0.0
+    now = now or timezone.now()
+    return math.exp(score - (now - EPOCH).total_seconds() * decay_rate())
+
+
+def record_activity(conversation_id, weight, time=None):
+    """
+    Add an event with the given weight to the trending score of a
+    conversation.
+
+    The score is updated by the database, so concurrent events are never
+    lost.
+    """
+    from .models import Conversation
+
+    if weight <= 0:
+        return
+    value = Value(event_score(weight, time or timezone.now()), output_field=FloatField())
+    score = F('trending_score')
+    Conversation.objects.filter(id=conversation_id).update(
+        trending_score=Case(
+            When(trending_score=NO_SCORE, then=value),
+            default=Greatest(score, value) + Ln(1 + Exp(-Abs(score - value))),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def recompute_scores(conversations):
+    """
+    Recompute the trending scores of the given conversations from all their
+    votes and comments.
+
+    Scores must be recomputed after changing CONVERSATION_TRENDING_HALF_LIFE
+    or the weights of events.
+    """
+    from .models import Comment, Conversation, Vote
+
+    for conversation in conversations:
+        events = [
+            (config.TRENDING_VOTE_WEIGHT,
+             Vote.objects.filter(comment__conversation_id=conversation.id)),
+            (config.TRENDING_COMMENT_WEIGHT,
+             Comment.objects.filter(conversation_id=conversation.id)),
+        ]
+        score = NO_SCORE
+        for weight, queryset in events:
+            if weight <= 0:
+                continue
+            for created in queryset.values_list('created', flat=True).iterator():
+                score = add_scores(score, event_score(weight, created))
+        conversation.trending_score = score
+        Conversation.objects.filter(id=conversation.id).update(trending_score=score)
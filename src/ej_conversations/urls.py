@@ -0,0 +1,10 @@
+try:
+    from django.urls import re_path as url
+except ImportError:
+    from django.conf.urls import url
+
+from . import instrumentation
+
+urlpatterns = [
+    url(r'^metrics/$', instrumentation.metrics_view, name='conversation-metrics'),
+]
@@ -1,13 +1,56 @@
+import hashlib
+import re
+import unicodedata
 from enum import Enum
 
 from autoslug.settings import slugify as default_slugify
 from django.utils.translation import ugettext_lazy as _
 
 
+WHITESPACE_RE = re.compile(r'\s+')
+
+
 def custom_slugify(value):
     return default_slugify(value).lower()
 
 
+def normalize_text(text):
+    """
+    Normalize text for comparison: strip accents, fold case and collapse
+    whitespace.
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return WHITESPACE_RE.sub(' ', text.casefold()).strip()
+
+
+def content_hash(text):
+    """
+    Return a hex digest of the normalized text.
+
+    Texts that differ only by accents, case or whitespace share the same hash.
+    """
+    return hashlib.sha1(normalize_text(text).encode('utf8')).hexdigest()
+
+
+def ratio(part, total):
+    """
+    Return part / total, or 0 if total is zero.
+    """
+    return part / total if total else 0
+
+
+def require_numpy():
+    """
+    Raise ImportError if numpy, used by the vote analysis modules, is not
+    installed.
+    """
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        raise ImportError('numpy must be installed to analyze votes') from None
+
+
 class CommentLimitStatus(Enum):
     """
     Track the nudge status of a user in a conversation.
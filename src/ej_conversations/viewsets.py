@@ -1,33 +1,60 @@
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
+from django.http import StreamingHttpResponse
 from django.utils.translation import ugettext as _
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
+from . import caching
+from . import config
+from . import exports
+from . import moderation
+from . import routers
+from . import scores
 from . import serializers
+from . import stereotypes
+from . import streams
 from .forms import VoteForm
 from .mixins import validation_error
-from .models import Category, Conversation, Comment, Vote
+from .models import Category, Conversation, Comment, Stereotype, StereotypeVote, Vote
 from .permissions import IsAdminOrReadOnly
 
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+class ReplicaListMixin:
+    """
+    Serve list requests from the read replica, if one is configured.
+    """
+
+    def list(self, request, *args, **kwargs):
+        with routers.replica():
+            return super().list(request, *args, **kwargs)
+
+
+class UserViewSet(ReplicaListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = serializers.UserSerializer
     queryset = get_user_model().objects.all()
     lookup_field = 'username'
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaListMixin, viewsets.ModelViewSet):
     serializer_class = serializers.CategorySerializer
     queryset = Category.objects.all()
     lookup_field = 'slug'
     permission_classes = [IsAdminOrReadOnly]
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == 'GET':
+            context['statistics'] = Category.objects.cached_statistics()
+        return context
+
 
-class ConversationViewSet(viewsets.ModelViewSet):
+class ConversationViewSet(ReplicaListMixin, viewsets.ModelViewSet):
     serializer_class = serializers.ConversationSerializer
     queryset = Conversation.objects.all()
     filter_backends = [DjangoFilterBackend]
@@ -36,11 +63,40 @@ class ConversationViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]
 
     def get_queryset(self):
-        return Conversation.objects.select_related('author', 'category')
+        queryset = Conversation.objects.select_related('author', 'category')
+        if self.action == 'list':
+            order = self.request.query_params.get('ordering')
+            # Unknown orderings are ignored, like DRF's OrderingFilter does
+            if order == 'trending':
+                queryset = queryset.order_by('-trending_score', '-id')
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Assemble the response from the cached representation of the
+        conversation and its cached statistics.
+
+        Representations contain absolute links, so they are cached for each
+        host that serves the API.
+        """
+        key = caching.conversation_key(kwargs[self.lookup_field])
+        url_prefix = f'{request.scheme}://{request.get_host()}'
+        conversation_id, representations = cache.get(key) or (None, {})
+        data = representations.get(url_prefix)
+
+        if data is None:
+            conversation = self.get_object()
+            data = dict(self.get_serializer(conversation).data)
+            statistics = data.pop('statistics')
+            representations[url_prefix] = data
+            cache.set(key, (conversation.id, representations), config.DETAIL_CACHE_TIME)
+        else:
+            statistics = Conversation(id=conversation_id).get_cached_statistics()
+        return Response(dict(data, statistics=statistics))
+
     @action(detail=True)
     def user_data(self, request, slug):
         conversation = self.get_object()
@@ -57,7 +113,17 @@ class ConversationViewSet(viewsets.ModelViewSet):
     @action(detail=True)
     def approved_comments(self, request, slug):
         conversation = self.get_object()
-        comments = conversation.get_comments()
+        comments = (
+            conversation.get_comments()
+                .select_related('author', 'conversation')
+                .annotate_statistics()
+        )
+        order = request.query_params.get('ordering')
+        if order:
+            try:
+                comments = scores.sort_comments(comments, order)
+            except (ValueError, ImportError) as ex:
+                return Response({'message': str(ex), 'error': True}, status=400)
         serializer = serializers.CommentSerializer(
             comments, many=True,
             context={'request': request}
@@ -74,10 +140,52 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 "message": str(msg),
                 "error": True,
             })
+        comment.conversation = conversation
         ctx = {'request': request}
         serializer = serializers.CommentSerializer(comment, context=ctx)
         return Response(serializer.data)
 
+    @action(detail=True, renderer_classes=[streams.EventStreamRenderer])
+    def stream(self, request, slug):
+        conversation = self.get_object()
+        events = streams.event_stream(conversation.id)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=True, permission_classes=[IsAdminUser])
+    def export(self, request, slug):
+        conversation = self.get_object()
+        kind = request.query_params.get('kind', 'votes')
+        format = request.query_params.get('output', 'csv')
+        try:
+            chunks = exports.export(conversation, kind, format)
+        except (ValueError, ImportError) as ex:
+            return Response({'message': str(ex), 'error': True}, status=400)
+
+        content_type = exports.CONTENT_TYPES[format]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        filename = f'{conversation.slug}-{kind}.{format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def progress(self, request):
+        user = request.user
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        progress = Conversation.objects.cached_progress(user)
+        missing = [conversation.id for conversation in page
+                   if conversation.id not in progress]
+        if missing:
+            progress = dict(progress)
+            progress.update(Conversation.objects.filter(id__in=missing).progress(user))
+        serializer = serializers.ProgressSerializer(
+            page, many=True,
+            context={'request': request, 'progress': progress},
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False)
     def random(self, request):
         try:
@@ -92,12 +200,16 @@ class ConversationViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(ReplicaListMixin, viewsets.ModelViewSet):
     serializer_class = serializers.CommentSerializer
     filter_backends = [DjangoFilterBackend]
     filter_fields = ['status', 'conversation__slug']
     permission_classes = [IsAdminOrReadOnly]
-    queryset = Comment.objects.select_related('author', 'conversation')
+    queryset = (
+        Comment.objects
+            .select_related('author', 'conversation')
+            .annotate_statistics()
+    )
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -108,6 +220,42 @@ class CommentViewSet(viewsets.ModelViewSet):
         except PermissionError as err:
             return Response(err.args[0])
 
+    @action(detail=False, methods=['POST'])
+    def moderate(self, request):
+        serializer = serializers.ModerationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        data = serializer.validated_data
+        updated = Comment.objects.moderate(data['ids'], data['status'],
+                                           data['reason'])
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['POST'])
+    def claim(self, request):
+        serializer = serializers.ClaimSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        data = serializer.validated_data
+        comments = moderation.claim(request.user, data['size'],
+                                    data.get('conversation'))
+        serializer = serializers.CommentSerializer(
+            comments, many=True,
+            context={'request': request},
+        )
+        return Response({
+            'claimed_until': comments[0].claimed_until if comments else None,
+            'comments': serializer.data,
+        })
+
+    @action(detail=False, methods=['POST'])
+    def release(self, request):
+        serializer = serializers.ReleaseSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        released = moderation.release(request.user,
+                                      serializer.validated_data.get('ids'))
+        return Response({'released': released})
+
     @action(detail=True, methods=['POST'])
     def vote(self, request, pk):
         form = VoteForm(request.POST)
@@ -149,3 +297,57 @@ class VoteViewSet(viewsets.ModelViewSet):
             })
         except ValidationError as ex:
             return Response(validation_error(ex))
+
+
+class StereotypeViewSet(viewsets.ModelViewSet):
+    serializer_class = serializers.StereotypeSerializer
+    queryset = Stereotype.objects.prefetch_related('conversations')
+    permission_classes = [IsAdminOrReadOnly]
+
+    @action(detail=True, methods=['GET', 'POST'])
+    def votes(self, request, pk):
+        stereotype = self.get_object()
+        if request.method == 'POST':
+            serializer = serializers.StereotypeVotesSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=400)
+            data = serializer.validated_data
+            values = {vote['comment']: vote['value'] for vote in data['votes']}
+            created, updated = StereotypeVote.objects.upsert(stereotype, values)
+            stereotype.conversations.add(data['conversation'])
+            return Response({'created': created, 'updated': updated})
+
+        votes = stereotype.stereotype_votes.order_by('comment_id')
+        slug = request.query_params.get('conversation')
+        if slug:
+            votes = votes.filter(comment__conversation__slug=slug)
+        return Response([
+            {'comment': comment, 'value': value}
+            for comment, value in votes.values_list('comment_id', 'value')
+        ])
+
+    @action(detail=True, permission_classes=[IsAdminUser])
+    def ranking(self, request, pk):
+        stereotype = self.get_object()
+        try:
+            conversation = Conversation.objects.get(
+                slug=request.query_params.get('conversation'))
+            limit = int(request.query_params.get('limit', 20))
+            with routers.replica():
+                ranking = stereotypes.rank_participants(conversation, [stereotype])
+        except Conversation.DoesNotExist:
+            return Response({'message': _('invalid conversation'), 'error': True},
+                            status=400)
+        except (ValueError, ImportError) as ex:
+            return Response({'message': str(ex), 'error': True}, status=400)
+
+        ranking = ranking[stereotype.id][:limit]
+        usernames = dict(
+            get_user_model().objects
+                .filter(id__in=[user_id for user_id, *_ in ranking])
+                .values_list('id', 'username')
+        )
+        return Response([
+            {'username': usernames[user_id], 'agreement': ratio, 'common': common}
+            for user_id, ratio, common in ranking
+        ])
@@ -0,0 +1,164 @@
+"""
+Benchmark harness for the conversation hot paths.
+
+Benchmarks are marked as slow and only run on demand::
+
+    pytest -m slow tests/benchmarks
+
+Environment variables:
+
+BENCHMARK_SCALE:
+    Multiplies the size of the synthetic dataset (default: 1).
+BENCHMARK_BASELINE:
+    JSON file with reference query counts (default:
+    tests/benchmarks/baseline.json). Query counts do not depend on the
+    machine, so the default baseline is kept in the repository.
+BENCHMARK_TIMINGS:
+    JSON file with reference wall times. Timings are only meaningful on the
+    machine that recorded them, so they are not checked unless this is set.
+BENCHMARK_SAVE:
+    If set, store the results of this run as the new baseline and, if
+    BENCHMARK_TIMINGS is set, as the new reference timings.
+BENCHMARK_THRESHOLD:
+    Maximum allowed relative slowdown compared to the reference timings
+    (default: 0.25). Query counts are never allowed to grow.
+
+Each benchmark starts with empty caches and records the largest number of
+queries over its runs, which is the count of the cold run, and the shortest
+wall time, which is usually a warm run.
+
+The synthetic dataset is created once for the benchmark package inside a
+transaction that is rolled back when the last benchmark finishes, so it never
+leaks into other tests.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ej_conversations.examples import make_synthetic_data
+
+SCALE = float(os.environ.get('BENCHMARK_SCALE', 1))
+THRESHOLD = float(os.environ.get('BENCHMARK_THRESHOLD', 0.25))
+BASELINE = Path(os.environ.get('BENCHMARK_BASELINE',
+                               Path(__file__).parent / 'baseline.json'))
+TIMINGS = os.environ.get('BENCHMARK_TIMINGS')
+TIMINGS = TIMINGS and Path(TIMINGS)
+SAVE = bool(os.environ.get('BENCHMARK_SAVE'))
+
+RESULTS = {}
+
+
+class Benchmark:
+    """
+    Measure wall time and number of queries of a callable.
+    """
+
+    def __init__(self, baseline, timings):
+        self.baseline = baseline
+        self.timings = timings
+
+    def __call__(self, name, func, *args, repeat=5, **kwargs):
+        times = []
+        counts = []
+        cache.clear()
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                func(*args, **kwargs)
+                times.append(time.perf_counter() - start)
+            counts.append(len(queries))
+
+        result = {'time': min(times), 'queries': max(counts)}
+        RESULTS[name] = result
+        self.check(name, result)
+        return result
+
+    def check(self, name, result):
+        if SAVE:
+            return
+        queries = self.baseline.get(name)
+        if queries is not None:
+            assert result['queries'] <= queries, (
+                f'{name}: {result["queries"]} queries, baseline is {queries}'
+            )
+        reference = self.timings.get(name)
+        if reference is not None:
+            assert result['time'] <= reference * (1 + THRESHOLD), (
+                f'{name}: {result["time"] * 1000:.2f}ms, '
+                f'reference is {reference * 1000:.2f}ms'
+            )
+
+
+@pytest.fixture(scope='package')
+def benchmark_data(django_db_setup, django_db_blocker):
+    # Each test runs in a savepoint of this transaction, and rolling it back
+    # removes the dataset.
+    atomic = transaction.atomic()
+    with django_db_blocker.unblock():
+        atomic.__enter__()
+        try:
+            conversations = make_synthetic_data(
+                conversations=max(int(5 * SCALE), 1),
+                comments=max(int(200 * SCALE), 1),
+                users=max(int(500 * SCALE), 1),
+                density=0.5,
+                seed=0,
+                signatures=False,
+            )
+        except BaseException:
+            transaction.set_rollback(True)
+            atomic.__exit__(None, None, None)
+            raise
+    yield conversations
+
+    with django_db_blocker.unblock():
+        transaction.set_rollback(True)
+        atomic.__exit__(None, None, None)
+
+
+@pytest.fixture
+def conversation(benchmark_data):
+    return benchmark_data[0]
+
+
+@pytest.fixture
+def participant(conversation):
+    return conversation.votes.select_related('author').first().author
+
+
+def read_json(path):
+    return json.loads(path.read_text()) if path and path.exists() else {}
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.fixture(scope='session')
+def bench():
+    baseline = read_json(BASELINE)
+    timings = read_json(TIMINGS)
+    yield Benchmark(baseline, timings)
+
+    if SAVE:
+        baseline.update((name, result['queries']) for name, result in RESULTS.items())
+        write_json(BASELINE, baseline)
+        if TIMINGS:
+            timings.update((name, result['time']) for name, result in RESULTS.items())
+            write_json(TIMINGS, timings)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    width = max(map(len, RESULTS))
+    terminalreporter.write_sep('=', 'benchmark results')
+    for name, result in sorted(RESULTS.items()):
+        terminalreporter.write_line(f'{name:<{width}}  {result["time"] * 1000:9.3f}ms  '
+                                    f'{result["queries"]:4d} queries')
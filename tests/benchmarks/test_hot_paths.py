@@ -0,0 +1,82 @@
+import pytest
+from django.db import transaction
+
+from ej_conversations.models import Comment, Limits, Vote
+
+pytestmark = [pytest.mark.slow, pytest.mark.django_db]
+
+
+class TestModelBenchmarks:
+    def test_get_statistics(self, bench, conversation):
+        bench('conversation.get_statistics', conversation.get_statistics)
+
+    def test_get_next_comment(self, bench, conversation, participant):
+        bench('conversation.get_next_comment', conversation.get_next_comment,
+              participant, default=None)
+
+    def test_get_participation_ratio(self, bench, conversation, participant):
+        bench('conversation.get_participation_ratio',
+              conversation.get_participation_ratio, participant)
+
+    def test_limits_get_comment_status(self, bench, conversation, participant):
+        limits = Limits()
+        bench('limits.get_comment_status', limits.get_comment_status,
+              participant, conversation)
+
+    def test_comment_get_statistics(self, bench, conversation):
+        comment = conversation.comments.first()
+        bench('comment.get_statistics', comment.get_statistics)
+
+    def test_comment_vote(self, bench, conversation, participant):
+        voted = participant.votes.values_list('comment_id', flat=True)
+        comment = (
+            conversation.comments
+                .filter(status=Comment.STATUS.APPROVED)
+                .exclude(author=participant)
+                .exclude(id__in=voted)
+                .first()
+        )
+
+        def vote():
+            with transaction.atomic():
+                comment.vote(participant, Vote.AGREE)
+                transaction.set_rollback(True)
+
+        bench('comment.vote', vote)
+
+
+class TestEndpointBenchmarks:
+    @pytest.fixture
+    def api(self, client, participant):
+        client.force_login(participant)
+
+        def get(url):
+            response = client.get(url)
+            assert response.status_code == 200, response.content
+            return response
+
+        return get
+
+    @pytest.mark.parametrize('url', [
+        '/categories/',
+        '/categories/synthetic/',
+        '/conversations/',
+        '/conversations/{slug}/',
+        '/conversations/{slug}/user_data/',
+        '/conversations/{slug}/votes/',
+        '/conversations/{slug}/approved_comments/',
+        '/conversations/{slug}/random_comment/',
+        '/comments/?limit=20',
+        '/comments/{comment}/',
+        '/votes/?limit=20',
+        '/votes/{vote}/',
+        '/users/',
+    ])
+    def test_endpoint(self, bench, api, url, conversation, participant):
+        vote = participant.votes.filter(comment__conversation=conversation).first()
+        url = url.format(slug=conversation.slug, comment=vote.comment_id,
+                         vote=vote.id)
+        bench('GET ' + url.split('?')[0].replace(conversation.slug, '{slug}')
+              .replace(f'/{vote.comment_id}/', '/{id}/')
+              .replace(f'/{vote.id}/', '/{id}/'),
+              api, url, repeat=3)
@@ -1,3 +1,6 @@
+from django.core.cache import cache
+
+from ej_conversations import routing, similarity
 from ej_conversations.mommy_recipes import *
 
 
@@ -21,3 +24,11 @@ class ApiClient:
 @pytest.fixture
 def api(client):
     return ApiClient(client)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    similarity.clear_indexes()
+    routing.clear_tables()
+    cache.clear()
@@ -0,0 +1,75 @@
+from io import StringIO
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from ej_conversations import analysis, config
+from ej_conversations.models import Comment, Conversation, Vote
+
+pytestmark = pytest.mark.django_db
+pytest.importorskip('numpy')
+
+
+@pytest.fixture(autouse=True)
+def matrix_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'MATRIX_DIR', str(tmp_path / 'matrices'))
+
+
+@pytest.fixture
+def conversations(conversation_db):
+    voter = get_user_model().objects.create(username='voter')
+    author = conversation_db.author
+    result = [conversation_db]
+    for i in range(2):
+        result.append(Conversation.objects.create(
+            author=author, category=conversation_db.category, title=f'other {i}',
+            question=f'question {i}?'))
+    for conversation in result:
+        comment = conversation.create_comment(author, 'comment', check_limits=False,
+                                              status=Comment.STATUS.APPROVED)
+        comment.vote(voter, Vote.AGREE)
+    return result
+
+
+class TestAnalysis:
+    def test_analyze(self, conversation_db, conversations):
+        assert analysis.get_analysis(conversation_db) is None
+        assert analysis.analyze(conversation_db) == 1
+        data = analysis.get_analysis(conversation_db)
+        assert data['statistics']['votes']['agree'] == 1
+        comment = conversation_db.comments.get()
+        assert data['scores']['agreement'] == {comment.id: 1.0}
+
+    def test_batches(self):
+        assert list(analysis.batches([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+
+    def test_errors_do_not_abort_batch(self, conversations, monkeypatch):
+        def compute_analysis(conversation):
+            if conversation.id == conversations[0].id:
+                raise ValueError('broken')
+            return 1, {}
+
+        monkeypatch.setattr(analysis, 'compute_analysis', compute_analysis)
+        results = analysis.analyze_batch([c.id for c in conversations])
+        assert [r.error is None for r in results] == [False, True, True]
+
+    def test_workers_do_not_write_to_the_cache(self, conversations):
+        results = analysis.analyze_batch([c.id for c in conversations])
+        assert analysis.get_analysis(conversations[0]) is None
+        analysis.store_results(results)
+        assert analysis.get_analysis(conversations[0]) == results[0].data
+
+    def test_command_resumes_from_checkpoint(self, conversations, tmp_path):
+        checkpoint = str(tmp_path / 'checkpoint')
+        analysis.write_checkpoint(checkpoint, [conversations[0].id])
+
+        out, err = StringIO(), StringIO()
+        call_command('analyzeconversations', workers=0, batch_size=1,
+                     checkpoint=checkpoint, stdout=out, stderr=err)
+        assert 'cache is local to this process' in err.getvalue()
+        assert 'skipping 1 analyzed conversations' in out.getvalue()
+        assert 'votes/s' in out.getvalue()
+        assert analysis.read_checkpoint(checkpoint) == {c.id for c in conversations}
+        assert analysis.get_analysis(conversations[0]) is None
+        assert analysis.get_analysis(conversations[1]) is not None
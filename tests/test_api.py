@@ -1,3 +1,6 @@
+from ej_conversations.models import Comment, Vote
+
+
 class TestRoutes:
     def test_categories_endpoint(self, category_db, api):
         assert api.get('/categories/category/') == {
@@ -6,6 +9,10 @@ class TestRoutes:
             'slug': 'category',
             'image': None,
             'image_caption': '',
+            'statistics': {
+                'conversations': {'total': 0, 'active': 0, 'promoted': 0},
+                'votes': 0,
+            },
         }
         assert api.get('/categories/bad-category/', raw=True).status_code == 404
 
@@ -31,10 +38,10 @@ class TestRoutes:
                 'votes': 'http://testserver/conversations/conversation/votes',
             },
             'author_name': 'user',
-            'category': None,
+            'category': 'http://testserver/categories/category/',
             'title': 'Conversation',
             'slug': 'conversation',
-            'description': 'description',
+            'question': 'question',
             'is_promoted': False,
             'statistics': {
                 'comments': {
@@ -55,3 +62,133 @@ class TestRoutes:
 
         # Random conversations
         assert api.get('/conversations/random/', raw=True).status_code == 200
+
+    def test_comment_bulk_moderation(self, conversation_db, admin_client):
+        comment = conversation_db.create_comment(conversation_db.author, 'Hello',
+                                                 check_limits=False)
+        data = {'ids': [comment.id], 'status': 'REJECTED', 'reason': 'off-topic'}
+        response = admin_client.post('/comments/moderate/', data,
+                                     content_type='application/json')
+        assert response.data == {'updated': 1}
+        comment.refresh_from_db()
+        assert comment.status == 'REJECTED'
+        assert comment.rejection_reason == 'off-topic'
+
+        response = admin_client.post('/comments/moderate/', {'ids': [comment.id], 'status': 'BAD'},
+                                     content_type='application/json')
+        assert response.status_code == 400
+
+    def test_progress_endpoint(self, conversation_db, client):
+        author = conversation_db.author
+        comment = conversation_db.create_comment(author, 'Hello', check_limits=False,
+                                                 status='APPROVED')
+        conversation_db.create_comment(author, 'World', check_limits=False,
+                                       status='APPROVED')
+        User = type(author)
+        user = User.objects.create(username='participant')
+        client.force_login(user)
+        assert client.get('/conversations/progress/').data['results'] == [{
+            'url': 'http://testserver/conversations/conversation/',
+            'title': 'Conversation',
+            'slug': 'conversation',
+            'progress': {
+                'votes': 0,
+                'remaining_comments': 2,
+                'participation_ratio': 0,
+                'limit_status': 'ok',
+            },
+        }]
+
+        comment.vote(user, 1)
+        progress = client.get('/conversations/progress/').data['results'][0]['progress']
+        assert progress['votes'] == 1
+        assert progress['remaining_comments'] == 1
+        assert progress['participation_ratio'] == 0.5
+
+        client.logout()
+        assert client.get('/conversations/progress/').status_code in (401, 403)
+
+
+class TestConversationDetailCache:
+    url = '/conversations/conversation/'
+
+    def test_warm_cache_does_not_hit_database(self, conversation_db, client,
+                                               django_assert_num_queries):
+        first = client.get(self.url).data
+        with django_assert_num_queries(0):
+            assert client.get(self.url).data == first
+        assert client.get('/conversations/bad-conversation/').status_code == 404
+
+    def test_votes_and_comments_invalidate_statistics(self, conversation_db, client,
+                                                      django_assert_num_queries):
+        client.get(self.url)
+        author = conversation_db.author
+        comment = conversation_db.create_comment(author, 'Hello', check_limits=False,
+                                                 status='APPROVED')
+        comment.vote(type(author).objects.create(username='voter'), 1)
+
+        # Only statistics are recomputed
+        with django_assert_num_queries(4):
+            data = client.get(self.url).data
+        assert data['statistics']['comments']['approved'] == 1
+        assert data['statistics']['votes']['agree'] == 1
+
+        vote = Vote.objects.get()
+        vote.delete()
+        assert client.get(self.url).data['statistics']['votes']['total'] == 0
+        Comment.objects.get(id=vote.comment_id).delete()
+        assert client.get(self.url).data['statistics']['comments']['total'] == 0
+
+    def test_conversation_and_category_invalidate_representation(self, conversation_db,
+                                                                 client):
+        client.get(self.url)
+        conversation_db.title = 'New title'
+        conversation_db.save()
+        assert client.get(self.url).data['title'] == 'New title'
+
+        category = conversation_db.category
+        client.get(self.url)
+        category.slug = 'new-category'
+        category.save()
+        assert client.get(self.url).data['category'] == \
+            'http://testserver/categories/new-category/'
+
+
+class TestCategoryStatistics:
+    def test_counts(self, conversation_db, client, django_assert_num_queries):
+        author = conversation_db.author
+        category = conversation_db.category
+        category.new_conversation('Other?', 'Other', author, is_promoted=True)
+        comment = conversation_db.create_comment(author, 'Hello', check_limits=False,
+                                                 status='APPROVED')
+        comment.vote(type(author).objects.create(username='voter'), 1)
+
+        with django_assert_num_queries(3):
+            data = client.get('/categories/').data['results']
+        assert data[0]['statistics'] == {
+            'conversations': {'total': 2, 'active': 2, 'promoted': 1},
+            'votes': 1,
+        }
+
+        # Counts are cached
+        with django_assert_num_queries(2):
+            client.get('/categories/')
+
+        conversation_db.delete()
+        assert client.get('/categories/').data['results'][0]['statistics'] == {
+            'conversations': {'total': 1, 'active': 1, 'promoted': 1},
+            'votes': 0,
+        }
+
+    def test_cached_category_name(self, conversation_db, django_assert_num_queries):
+        conversation = type(conversation_db).objects.get(id=conversation_db.id)
+        assert conversation.category_name == 'Category'
+        conversation = type(conversation_db).objects.get(id=conversation_db.id)
+        with django_assert_num_queries(0):
+            assert conversation.category_name == 'Category'
+
+        category = conversation.category
+        category.name = 'Renamed'
+        category.save()
+        conversation = type(conversation_db).objects.get(id=conversation_db.id)
+        assert conversation.category_name == 'Renamed'
@@ -0,0 +1,162 @@
+import datetime
+import struct
+import zlib
+
+import pytest
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+
+from ej_conversations import archive, exports
+from ej_conversations.importers import insert_votes
+from ej_conversations.models import ArchivedParticipant, Category, Comment, Conversation
+from ej_conversations.models import Vote, VoteArchive
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def voted_conversation(conversation_db):
+    author = conversation_db.author
+    comments = [conversation_db.create_comment(author, f'comment {i}', check_limits=False,
+                                               status=Comment.STATUS.APPROVED)
+                for i in range(2)]
+    User = get_user_model()
+    values = [Vote.AGREE, Vote.DISAGREE, Vote.SKIP]
+    for i, value in enumerate(values):
+        user = User.objects.create(username=f'voter{i}')
+        for comment in comments:
+            comment.vote(user, value)
+    return conversation_db
+
+
+def test_encode_roundtrip():
+    created = datetime.datetime(2018, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    rows = [(1, 10, 100, 1, created), (2, 11, 100, -1, created)]
+    assert archive.decode(archive.encode(rows)) == rows
+    assert archive.decode(archive.encode([])) == []
+
+
+def test_decode_is_incremental(monkeypatch):
+    monkeypatch.setattr(archive, 'BLOCK_SIZE', 3)
+    monkeypatch.setattr(archive, 'CHUNK_SIZE', 7)
+    created = datetime.datetime(2018, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    rows = [(i, i % 4, 100 + i % 3, i % 3 - 1, created) for i in range(10)]
+    data = archive.encode(rows)
+    assert list(archive.iter_decode(data)) == rows
+    with pytest.raises(ValueError):
+        list(archive.iter_decode(data[:-8]))
+
+
+def test_decode_legacy_archives():
+    created = datetime.datetime(2018, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+    columns = [struct.pack('<2q', 1, 2), struct.pack('<2q', 10, 11),
+               struct.pack('<2q', 100, 100), struct.pack('<2b', 1, -1),
+               struct.pack('<2d', created.timestamp(), created.timestamp())]
+    data = zlib.compress(struct.pack('<4sI', b'EJV1', 2) + b''.join(columns))
+    assert archive.decode(data) == [(1, 10, 100, 1, created), (2, 11, 100, -1, created)]
+
+
+class TestArchive:
+    def test_statistics_and_exports_include_archived_votes(self, voted_conversation):
+        stats = voted_conversation.get_statistics()
+        comment_stats = [c.get_statistics() for c in
+                         Comment.objects.annotate_statistics().order_by('id')]
+        votes = sorted(exports.vote_rows(voted_conversation))
+
+        assert archive.archive_conversation(voted_conversation) == 6
+        assert Vote.objects.count() == 0
+        assert VoteArchive.objects.get().participants == 3
+        assert ArchivedParticipant.objects.count() == 3
+
+        assert voted_conversation.get_statistics() == stats
+        assert [c.get_statistics() for c in
+                Comment.objects.annotate_statistics().order_by('id')] == comment_stats
+        assert [c.get_statistics() for c in Comment.objects.order_by('id')] == comment_stats
+        assert sorted(exports.vote_rows(voted_conversation)) == votes
+
+    def test_category_statistics(self, voted_conversation):
+        category_id = voted_conversation.category_id
+        archive.archive_conversation(voted_conversation)
+        assert Category.objects.statistics()[category_id] == {
+            'conversations': {'total': 1, 'active': 0, 'promoted': 0},
+            'votes': 6,
+        }
+
+    def test_votes_for_new_comments_are_not_archived(self, voted_conversation):
+        archive.archive_conversation(voted_conversation)
+        comment = voted_conversation.create_comment(
+            voted_conversation.author, 'new comment', check_limits=False,
+            status=Comment.STATUS.APPROVED,
+        )
+        late = get_user_model().objects.create(username='late')
+        voter = get_user_model().objects.get(username='voter0')
+        comment.vote(late, Vote.AGREE)
+        comment.vote(voter, Vote.AGREE)
+
+        assert Vote.objects.count() == 2
+        assert VoteArchive.objects.get().total == 6
+        stats = voted_conversation.get_statistics()
+        assert stats['votes']['total'] == 8
+        assert stats['participants'] == 4
+
+    def test_votes_for_archived_comments_restore_the_archive(self, voted_conversation):
+        archive.archive_conversation(voted_conversation)
+        user = get_user_model().objects.create(username='late')
+        comment = voted_conversation.comments.first()
+        comment.vote(user, Vote.AGREE)
+
+        assert not VoteArchive.objects.exists()
+        assert not ArchivedParticipant.objects.exists()
+        assert Vote.objects.count() == 7
+        assert comment.get_statistics()['agree'] == 2
+
+    def test_bulk_inserts_restore_the_archive(self, voted_conversation):
+        comment = voted_conversation.comments.first()
+        archive.archive_conversation(voted_conversation)
+        user = get_user_model().objects.create(username='late')
+        now = datetime.datetime.now(datetime.timezone.utc)
+        insert_votes([(user.id, comment.id, Vote.AGREE, now)], voted_conversation.id)
+        assert not VoteArchive.objects.exists()
+        assert Vote.objects.count() == 7
+
+    def test_user_votes_include_archived_votes(self, voted_conversation):
+        voter = get_user_model().objects.get(username='voter0')
+        other = get_user_model().objects.get(username='voter1')
+        archive.archive_conversation(voted_conversation)
+        assert archive.archived_votes(voter).keys() == {voted_conversation.id}
+
+        assert len(voted_conversation.get_votes()) == 6
+        votes = voted_conversation.get_votes(voter)
+        assert [vote.value for vote in votes] == [Vote.AGREE, Vote.AGREE]
+        assert {vote.comment.content for vote in votes} == {'comment 0', 'comment 1'}
+
+        assert voted_conversation.get_participation_ratio(voter) == 1.0
+        assert voted_conversation.participation_ratios([voter, other]) == {
+            voter.id: 1.0, other.id: 1.0,
+        }
+        progress = Conversation.objects.progress(voter)[voted_conversation.id]
+        assert progress['votes'] == 2
+        assert progress['remaining_comments'] == 0
+        assert voted_conversation.get_next_comment(voter, None) is None
+        assert voted_conversation.get_next_comment(voter, None, strategy='fewest_votes') is None
+
+    def test_restore(self, voted_conversation):
+        stats = voted_conversation.get_statistics()
+        archive.archive_conversation(voted_conversation)
+        assert archive.restore_conversation(voted_conversation) == 6
+        assert Vote.objects.count() == 6
+        assert not VoteArchive.objects.exists()
+        assert voted_conversation.get_statistics() == stats
+
+    def test_command_archives_inactive_conversations(self, voted_conversation):
+        call_command('archivevotes', days=1)
+        assert not VoteArchive.objects.exists()
+
+        old = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+        Vote.objects.update(created=old)
+        Comment.objects.update(created=old)
+        call_command('archivevotes', days=1)
+        assert VoteArchive.objects.get().total == 6
+
+        call_command('archivevotes', voted_conversation.slug, restore=True)
+        assert Vote.objects.count() == 6
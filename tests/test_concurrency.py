@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+from django.db import connection, connections, router
+
+from ej_conversations import concurrency, config, routers
+from ej_conversations.models import Comment, Vote
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    monkeypatch.setattr(config, 'QUERY_WORKERS', 2)
+    monkeypatch.setitem(connection.settings_dict, 'CONN_MAX_AGE', None)
+    yield
+    concurrency.shutdown()
+
+
+def database_connection():
+    connection.ensure_connection()
+    return connection.connection
+
+
+def current_thread():
+    return threading.current_thread().name
+
+
+class TestRunConcurrently:
+    def test_sequential_by_default(self):
+        assert concurrency.run_concurrently(current_thread, current_thread) == \
+            [current_thread()] * 2
+
+    def test_runs_in_worker_threads(self, workers):
+        names = concurrency.run_concurrently(current_thread, current_thread)
+        assert all(name.startswith('ej-conversations-query') for name in names)
+
+    @pytest.mark.django_db
+    def test_sequential_inside_transactions(self, workers):
+        assert concurrency.run_concurrently(current_thread, current_thread) == \
+            [current_thread()] * 2
+
+    def test_sequential_without_persistent_connections(self, workers, monkeypatch):
+        monkeypatch.setitem(connection.settings_dict, 'CONN_MAX_AGE', 0)
+        assert concurrency.run_concurrently(current_thread, current_thread) == \
+            [current_thread()] * 2
+
+    def test_checks_the_routed_database(self, workers, monkeypatch):
+        replica = connections['replica']
+        monkeypatch.setitem(replica.settings_dict, 'CONN_MAX_AGE', 0)
+        monkeypatch.setattr(config, 'REPLICA_DATABASE', 'replica')
+        using = router.db_for_read(Vote, replica=True)
+        assert using == 'replica'
+        assert concurrency.run_concurrently(current_thread, current_thread,
+                                            using=using) == [current_thread()] * 2
+        with routers.primary():
+            using = router.db_for_read(Vote, replica=True)
+        assert concurrency.is_enabled(using)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_workers_reuse_connections(self, workers, monkeypatch):
+        monkeypatch.setattr(config, 'QUERY_WORKERS', 1)
+        first = concurrency.run_concurrently(database_connection, database_connection)
+        second = concurrency.run_concurrently(database_connection, database_connection)
+        assert all(conn is first[0] for conn in first + second)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_statistics(conversation_db, workers):
+    author = conversation_db.author
+    comment = conversation_db.create_comment(author, 'comment', check_limits=False,
+                                             status=Comment.STATUS.APPROVED)
+    conversation_db.create_comment(author, 'other', check_limits=False)
+    comment.vote(author, Vote.AGREE)
+    assert conversation_db.get_statistics() == {
+        'votes': {'agree': 1, 'disagree': 0, 'skip': 0, 'total': 1},
+        'comments': {'approved': 1, 'rejected': 0, 'pending': 1, 'total': 2},
+        'participants': 1,
+    }
@@ -0,0 +1,31 @@
+import pytest
+
+from ej_conversations.examples import make_synthetic_data
+from ej_conversations.models import Vote
+
+pytestmark = pytest.mark.django_db
+
+
+class TestSyntheticData:
+    def test_dataset_size(self):
+        conversations = make_synthetic_data(conversations=2, comments=10, users=20,
+                                            density=1.0, seed=1)
+        assert len(conversations) == 2
+        assert all(c.comments.count() == 10 for c in conversations)
+        votes = Vote.objects.filter(comment__conversation=conversations[0])
+        own_comments = conversations[0].comments.filter(author__username__startswith='synthetic')
+        assert votes.count() == 10 * 20 - own_comments.count()
+
+    def test_generation_is_deterministic(self):
+        def snapshot(conversation):
+            comments = conversation.comments.order_by('id')
+            votes = Vote.objects.filter(comment__conversation=conversation)
+            return (
+                [c.content for c in comments],
+                sorted((v.author.username, v.comment.content, v.value) for v in votes),
+            )
+
+        first, = make_synthetic_data(conversations=1, comments=5, users=10, seed=7)
+        second, = make_synthetic_data(conversations=1, comments=5, users=10, seed=7)
+        assert first.id != second.id
+        assert snapshot(first) == snapshot(second)
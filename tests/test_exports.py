@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from ej_conversations import exports
+from ej_conversations.models import Comment
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def voted_conversation(conversation_db):
+    comment = conversation_db.create_comment(conversation_db.author, 'Hello',
+                                             check_limits=False)
+    Comment.objects.moderate([comment.id], Comment.STATUS.APPROVED)
+    comment.refresh_from_db()
+    for i in range(5):
+        user = get_user_model().objects.create(username=f'voter{i}')
+        comment.vote(user, 1)
+    return conversation_db
+
+
+class TestExports:
+    def test_csv_export(self, voted_conversation):
+        data = ''.join(exports.export(voted_conversation, 'votes', 'csv', chunk_size=2))
+        rows = list(csv.reader(io.StringIO(data)))
+        assert rows[0] == list(exports.VOTE_FIELDS)
+        assert len(rows) == 6
+
+    def test_jsonl_export(self, voted_conversation):
+        chunks = list(exports.export(voted_conversation, 'comments', 'jsonl'))
+        row = json.loads(chunks[0])
+        assert row['content'] == 'Hello'
+        assert row['status'] == 'APPROVED'
+
+    def test_parquet_export(self, voted_conversation):
+        parquet = pytest.importorskip('pyarrow.parquet')
+        data = b''.join(exports.export(voted_conversation, 'votes', 'parquet', chunk_size=2))
+        table = parquet.read_table(io.BytesIO(data))
+        assert table.num_rows == 5
+        assert table.column('value').to_pylist() == [1] * 5
+
+    def test_export_endpoint_requires_staff(self, voted_conversation, client, admin_client):
+        url = '/conversations/conversation/export/?kind=votes&output=csv'
+        assert client.get(url).status_code in (401, 403)
+        response = admin_client.get(url)
+        assert response['Content-Type'] == 'text/csv'
+        assert b''.join(response.streaming_content).count(b'\n') == 6
+
+    def test_command_writes_to_stdout(self, voted_conversation):
+        stdout = io.StringIO()
+        call_command('exportconversation', voted_conversation.slug, stdout=stdout)
+        data = stdout.getvalue()
+        assert data == ''.join(exports.export(voted_conversation, 'votes', 'csv'))
+        assert data.count('\r\n') == 6
+
+    def test_command_keeps_csv_line_endings(self, voted_conversation, tmp_path):
+        path = tmp_path / 'votes.csv'
+        call_command('exportconversation', voted_conversation.slug, output=str(path))
+        assert path.read_bytes().count(b'\r\n') == 6
+        assert b'\r\r\n' not in path.read_bytes()
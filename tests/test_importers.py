@@ -0,0 +1,71 @@
+import pytest
+
+from ej_conversations.importers import Importer
+from ej_conversations.models import Comment, Vote
+
+pytestmark = pytest.mark.django_db
+
+COMMENTS = [
+    {'comment-id': '10', 'author-id': '1', 'comment-body': 'Parks are nice', 'moderated': '1'},
+    {'comment-id': '11', 'author-id': '2', 'comment-body': 'parks are NICE', 'moderated': '1'},
+    {'comment-id': '12', 'author-id': '2', 'comment-body': '', 'moderated': '1'},
+]
+VOTES = [
+    {'voter-id': '3', 'comment-id': '10', 'vote': '-1', 'timestamp': '1500000000'},
+    {'voter-id': '4', 'comment-id': '11', 'vote': '1', 'timestamp': '1500000000000'},
+    {'voter-id': '4', 'comment-id': '99', 'vote': '1'},
+    {'voter-id': '5', 'comment-id': '10', 'vote': '2'},
+]
+
+
+class TestImporter:
+    def test_import_polis_data(self, conversation_db):
+        importer = Importer(conversation_db, batch_size=2, user_prefix='polis-',
+                            invert_votes=True)
+        importer.import_comments(COMMENTS)
+        importer.import_votes(VOTES)
+
+        assert [line for line, _ in importer.errors] == [3, 3, 4]
+        comment = Comment.objects.get()
+        assert comment.status == Comment.STATUS.APPROVED
+        assert comment.content_hash and comment.minhash
+
+        votes = Vote.objects.order_by('author__username')
+        assert [(v.author.username, v.value) for v in votes] == [
+            ('polis-3', Vote.AGREE), ('polis-4', Vote.DISAGREE)]
+        assert votes[0].created.year == 2017
+
+    def test_dry_run_does_not_write(self, conversation_db):
+        importer = Importer(conversation_db, dry_run=True)
+        importer.import_comments(COMMENTS)
+        importer.import_votes(VOTES)
+        assert importer.created == {'users': 4, 'comments': 2, 'votes': 2}
+        assert not Comment.objects.exists()
+
+    def test_votes_on_unapproved_comments_are_rejected(self, conversation_db):
+        comments = [dict(COMMENTS[0], moderated='0'),
+                    dict(COMMENTS[1], **{'comment-body': 'Trees are nice'})]
+        votes = VOTES[:2]
+        for dry_run in (True, False):
+            importer = Importer(conversation_db, dry_run=dry_run)
+            importer.import_comments(comments)
+            importer.import_votes(votes)
+            assert importer.errors == [
+                (1, 'comment must be approved to receive votes: 10')]
+        assert Vote.objects.count() == 1
+
+    def test_existing_unapproved_comments_are_unknown(self, conversation_db):
+        comment = conversation_db.create_comment(conversation_db.author, 'pending',
+                                                 check_limits=False)
+        importer = Importer(conversation_db)
+        importer.import_votes([{'voter-id': '3', 'comment-id': comment.id, 'vote': '1'}])
+        assert importer.errors == [(1, f'unknown comment: {comment.id}')]
+
+    def test_import_updates_signal_caches(self, conversation_db):
+        conversation_db.get_cached_statistics()
+        importer = Importer(conversation_db)
+        importer.import_comments(COMMENTS[:1])
+        importer.import_votes(VOTES[:1])
+        conversation_db.refresh_from_db()
+        assert conversation_db.trending_score > 0
+        assert conversation_db.get_cached_statistics()['votes']['total'] == 1
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+
+from ej_conversations import concurrency, config, instrumentation
+from ej_conversations.models import Conversation
+from ej_conversations.viewsets import ConversationViewSet
+
+
+@pytest.fixture
+def sink():
+    yield instrumentation.install('memory')
+    instrumentation.uninstall()
+
+
+class TestInstrumentation:
+    def test_disabled_by_default(self):
+        assert instrumentation.get_sink() is None
+        assert not hasattr(Conversation.get_statistics, 'instrumented')
+
+    def test_install_and_uninstall(self, sink):
+        assert Conversation.get_statistics.instrumented
+        assert ConversationViewSet.user_data.instrumented
+        assert ConversationViewSet.user_data.mapping == {'get': 'user_data'}
+        instrumentation.uninstall()
+        assert not hasattr(Conversation.get_statistics, 'instrumented')
+        assert not hasattr(ConversationViewSet.user_data, 'instrumented')
+
+    @pytest.mark.django_db
+    def test_records_model_method_queries(self, sink, conversation_db):
+        conversation_db.get_statistics()
+        [measurement] = sink.records('Conversation.get_statistics')
+        assert measurement.queries > 0
+        assert measurement.wall_time >= measurement.db_time >= 0
+
+    @pytest.mark.django_db
+    def test_records_viewset_actions(self, sink, conversation_db, client):
+        response = client.get(f'/conversations/{conversation_db.slug}/votes/')
+        assert response.status_code == 200
+        assert sink.records('ConversationViewSet.votes')
+
+    def test_memory_sink_is_a_ring_buffer(self):
+        sink = instrumentation.MemorySink(size=2)
+        for i in range(3):
+            sink.record(instrumentation.Measurement(f'm{i}', 0.0, 0.0, 0))
+        assert [m.name for m in sink.records()] == ['m1', 'm2']
+
+    def test_prometheus_metrics(self, rf):
+        sink = instrumentation.PrometheusSink()
+        sink.record(instrumentation.Measurement('Comment.vote', 0.5, 0.25, 3))
+        sink.record(instrumentation.Measurement('Comment.vote', 0.5, 0.25, 2))
+        text = sink.render()
+        assert 'ej_conversations_calls_total{method="Comment.vote"} 2' in text
+        assert 'ej_conversations_queries_total{method="Comment.vote"} 5' in text
+
+        request = rf.get('/metrics/')
+        request.user = AnonymousUser()
+        assert instrumentation.metrics_view(request).status_code == 403
+
+    def test_metrics_view_requires_staff(self, rf, monkeypatch, admin_user):
+        request = rf.get('/metrics/')
+        request.user = admin_user
+        assert instrumentation.metrics_view(request).status_code == 404
+
+        monkeypatch.setattr(instrumentation, '_sink', instrumentation.PrometheusSink())
+        assert instrumentation.metrics_view(request).status_code == 200
+        request.user = AnonymousUser()
+        assert instrumentation.metrics_view(request).status_code == 403
+        monkeypatch.setattr(config, 'INSTRUMENTATION_PUBLIC_METRICS', True)
+        assert instrumentation.metrics_view(request).status_code == 200
+
+    @pytest.mark.django_db
+    def test_metrics_route(self, admin_client, monkeypatch):
+        monkeypatch.setattr(instrumentation, '_sink', instrumentation.PrometheusSink())
+        response = admin_client.get('/metrics/')
+        assert response.status_code == 200
+        assert response['Content-Type'].startswith('text/plain')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_tracks_queries_of_worker_threads(self, monkeypatch):
+        monkeypatch.setattr(config, 'QUERY_WORKERS', 2)
+        monkeypatch.setitem(connections['default'].settings_dict, 'CONN_MAX_AGE', None)
+        tracker = instrumentation.QueryTracker()
+
+        def query():
+            with connections['default'].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return threading.current_thread().name
+
+        try:
+            with instrumentation.track_queries(tracker):
+                names = concurrency.run_concurrently(query, query)
+        finally:
+            concurrency.shutdown()
+        assert all(name.startswith('ej-conversations-query') for name in names)
+        assert tracker.queries == 2
+        assert instrumentation.get_trackers() == ()
+
+    @pytest.mark.django_db(databases=['default', 'replica'])
+    def test_tracks_queries_of_all_databases(self):
+        tracker = instrumentation.QueryTracker()
+        with instrumentation.track_queries(tracker):
+            for alias in ['default', 'replica']:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SELECT 1')
+        assert tracker.queries == 2
@@ -0,0 +1,212 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ej_conversations import archive, config, matrix
+from ej_conversations.models import Comment, Vote, VoteMatrix
+
+pytestmark = pytest.mark.django_db
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def comments(conversation_db):
+    author = conversation_db.author
+    return [conversation_db.create_comment(author, f'comment {i}', check_limits=False,
+                                           status=Comment.STATUS.APPROVED)
+            for i in range(3)]
+
+
+@pytest.fixture
+def voters():
+    User = get_user_model()
+    return [User.objects.create(username=f'voter{i}')
+            for i in range(3)]
+
+
+def as_dict(conversation):
+    user_ids, comment_ids, codes = matrix.get_matrix(conversation)
+    values, voted = matrix.decode(codes)
+    return {(int(user_ids[i]), int(comment_ids[j])): int(values[i, j])
+            for i, j in zip(*np.nonzero(voted))}
+
+
+class TestVoteMatrix:
+    def test_build_and_sync_incrementally(self, conversation_db, comments, voters,
+                                          django_assert_num_queries):
+        comments[0].vote(voters[0], Vote.AGREE)
+        comments[1].vote(voters[1], Vote.DISAGREE)
+        assert as_dict(conversation_db) == {
+            (voters[0].id, comments[0].id): Vote.AGREE,
+            (voters[1].id, comments[1].id): Vote.DISAGREE,
+        }
+
+        comments[2].vote(voters[2], Vote.SKIP)
+        comments[2].vote(voters[0], Vote.DISAGREE)
+        stored = VoteMatrix.objects.get(conversation=conversation_db)
+        assert stored.last_vote_id < Vote.objects.latest('id').id
+        assert as_dict(conversation_db) == {
+            (voters[0].id, comments[0].id): Vote.AGREE,
+            (voters[1].id, comments[1].id): Vote.DISAGREE,
+            (voters[2].id, comments[2].id): Vote.SKIP,
+            (voters[0].id, comments[2].id): Vote.DISAGREE,
+        }
+
+        user_ids, comment_ids, codes = matrix.get_matrix(conversation_db)
+        assert codes.shape == (3, 3) and codes.dtype == np.int8
+        assert not codes.flags.writeable
+        assert list(user_ids) == sorted(v.id for v in voters)
+
+        with django_assert_num_queries(5):
+            matrix.get_matrix(conversation_db)
+
+    def test_votes_committed_out_of_order(self, conversation_db, comments, voters):
+        Vote.objects.create(id=100, author=voters[0], comment=comments[0], value=Vote.AGREE)
+        matrix.sync_matrix(conversation_db)
+
+        # A transaction that started earlier commits a vote with a lower id
+        Vote.objects.create(id=50, author=voters[1], comment=comments[1], value=Vote.SKIP)
+        assert as_dict(conversation_db) == {
+            (voters[0].id, comments[0].id): Vote.AGREE,
+            (voters[1].id, comments[1].id): Vote.SKIP,
+        }
+        assert VoteMatrix.objects.get(conversation=conversation_db).synced_votes == 2
+
+    def test_changed_votes_rebuild_matrix(self, conversation_db, comments, voters):
+        vote = comments[0].vote(voters[0], Vote.AGREE)
+        comments[1].vote(voters[1], Vote.AGREE)
+        matrix.sync_matrix(conversation_db)
+
+        vote.value = Vote.DISAGREE
+        vote.save()
+        assert VoteMatrix.objects.get(conversation=conversation_db).is_stale
+        assert as_dict(conversation_db)[voters[0].id, comments[0].id] == Vote.DISAGREE
+
+        vote.delete()
+        assert as_dict(conversation_db) == {(voters[1].id, comments[1].id): Vote.AGREE}
+
+    def test_deleting_comments_marks_matrix_stale_once(self, conversation_db, comments,
+                                                       voters):
+        for voter in voters:
+            comments[0].vote(voter, Vote.AGREE)
+        comments[1].vote(voters[0], Vote.AGREE)
+        matrix.sync_matrix(conversation_db)
+
+        queries = []
+        for comment in comments[:2]:
+            with CaptureQueriesContext(connection) as context:
+                comment.delete()
+            queries.append(len(context))
+        assert queries[0] == queries[1]
+        assert VoteMatrix.objects.get(conversation=conversation_db).is_stale
+        assert as_dict(conversation_db) == {}
+
+    def test_rebuild_includes_archived_votes(self, conversation_db, comments, voters):
+        comments[0].vote(voters[0], Vote.AGREE)
+        comments[1].vote(voters[1], Vote.SKIP)
+        archive.archive_conversation(conversation_db)
+        assert as_dict(conversation_db) == {
+            (voters[0].id, comments[0].id): Vote.AGREE,
+            (voters[1].id, comments[1].id): Vote.SKIP,
+        }
+
+    def test_matches_vote_table(self, conversation_db, comments, voters):
+        for i, voter in enumerate(voters):
+            for j, comment in enumerate(comments[i:]):
+                comment.vote(voter, [Vote.AGREE, Vote.DISAGREE, Vote.SKIP][j])
+        expected = {(v.author_id, v.comment_id): v.value for v in Vote.objects.all()}
+        assert as_dict(conversation_db) == expected
+
+    def test_new_votes_are_appended(self, conversation_db, comments, voters, monkeypatch):
+        comments[0].vote(voters[0], Vote.AGREE)
+        data = matrix.sync_matrix(conversation_db).data
+        comments[1].vote(voters[1], Vote.SKIP)
+        comments[2].vote(voters[1], Vote.DISAGREE)
+        stored = matrix.sync_matrix(conversation_db)
+        assert stored.data == data
+        assert len(stored.delta) == 2 * 3 * 8
+        assert as_dict(conversation_db) == {
+            (voters[0].id, comments[0].id): Vote.AGREE,
+            (voters[1].id, comments[1].id): Vote.SKIP,
+            (voters[1].id, comments[2].id): Vote.DISAGREE,
+        }
+
+        monkeypatch.setattr(matrix, 'MIN_MERGE_SIZE', 0)
+        comments[2].vote(voters[2], Vote.AGREE)
+        stored = matrix.sync_matrix(conversation_db)
+        assert stored.delta == b''
+        assert len(stored.data) == 3  # 3 x 3 cells, four per byte
+        assert as_dict(conversation_db)[voters[2].id, comments[2].id] == Vote.AGREE
+
+    def test_pack_and_unpack(self):
+        codes = np.array([[0, 1, 2], [3, 2, 1], [1, 0, 3]], dtype=np.int8)
+        data = matrix.pack(codes)
+        assert len(data) == 3
+        assert np.array_equal(matrix.unpack(data, codes.shape), codes)
+
+
+class TestMatrixFiles:
+    @pytest.fixture(autouse=True)
+    def matrix_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config, 'MATRIX_DIR', str(tmp_path))
+        return tmp_path
+
+    def test_write_and_map_versions(self, conversation_db, comments, voters, matrix_dir):
+        comments[0].vote(voters[0], Vote.AGREE)
+        user_ids, comment_ids, codes = matrix.get_shared_matrix(conversation_db)
+        assert isinstance(codes, np.memmap)
+        assert list(user_ids) == [voters[0].id]
+        assert list(comment_ids) == [comments[0].id]
+        first = matrix.file_versions(conversation_db.id)
+        assert len(first) == 1
+
+        # Same version is reused while there are no new votes
+        matrix.get_shared_matrix(conversation_db)
+        assert matrix.file_versions(conversation_db.id) == first
+
+        comments[1].vote(voters[1], Vote.DISAGREE)
+        user_ids, comment_ids, codes = matrix.get_shared_matrix(conversation_db)
+        versions = matrix.file_versions(conversation_db.id)
+        assert len(versions) == 1 and versions[0] > first[0]
+        assert codes.shape == (2, 2)
+        for a, b in zip((user_ids, comment_ids, codes),
+                        matrix.get_matrix(conversation_db, sync=False)):
+            assert np.array_equal(a, b)
+        assert not list(matrix_dir.glob('*.tmp'))
+
+    def test_read_without_sync(self, conversation_db, comments, voters):
+        assert matrix.get_shared_matrix(conversation_db, sync=False) is None
+        comments[0].vote(voters[0], Vote.AGREE)
+        matrix.get_shared_matrix(conversation_db)
+        comments[1].vote(voters[0], Vote.AGREE)
+        _, _, codes = matrix.get_shared_matrix(conversation_db, sync=False)
+        assert codes.shape == (1, 1)
+
+    def test_read_without_sync_retries_removed_files(self, conversation_db, comments,
+                                                      voters, monkeypatch):
+        comments[0].vote(voters[0], Vote.AGREE)
+        matrix.get_shared_matrix(conversation_db)
+        file_versions = matrix.file_versions
+
+        def racing_file_versions(conversation_id):
+            # A newer version is written after the files were listed
+            versions = file_versions(conversation_id)
+            monkeypatch.setattr(matrix, 'file_versions', file_versions)
+            comments[1].vote(voters[0], Vote.AGREE)
+            matrix.get_shared_matrix(conversation_db)
+            return versions
+
+        monkeypatch.setattr(matrix, 'file_versions', racing_file_versions)
+        _, _, codes = matrix.get_shared_matrix(conversation_db, sync=False)
+        assert codes.shape == (1, 2)
+
+    def test_mapped_arrays_survive_file_removal(self, conversation_db, comments, voters):
+        comments[0].vote(voters[0], Vote.AGREE)
+        _, _, codes = matrix.get_shared_matrix(conversation_db)
+        matrix.remove_files(conversation_db.id)
+        assert codes.tolist() == [[Vote.AGREE + matrix.OFFSET]]
+
+    def test_empty_matrix(self, conversation_db):
+        user_ids, comment_ids, codes = matrix.get_shared_matrix(conversation_db)
+        assert codes.shape == (0, 0) and len(user_ids) == len(comment_ids) == 0
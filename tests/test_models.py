@@ -0,0 +1,168 @@
+import pytest
+from django.contrib.auth import get_user_model
+
+from ej_conversations.models import Comment, Conversation, Limits, Vote
+from ej_conversations.utils import CommentLimitStatus
+
+pytestmark = pytest.mark.django_db
+
+
+class TestComment:
+    def test_create_comment_reuses_normalized_duplicates(self, conversation_db):
+        user = conversation_db.author
+        comment = conversation_db.create_comment(user, 'Should we vote?')
+        duplicate = conversation_db.create_comment(user, '  should  we VÓTE? ')
+        assert duplicate.pk == comment.pk
+        assert Comment.objects.count() == 1
+
+    def test_different_comments_are_created(self, conversation_db):
+        user = conversation_db.author
+        conversation_db.create_comment(user, 'Should we vote?')
+        conversation_db.create_comment(user, 'Should we talk?')
+        assert Comment.objects.count() == 2
+
+    def test_content_hash_follows_content(self, conversation_db):
+        user = conversation_db.author
+        comment = conversation_db.create_comment(user, 'First')
+        old_hash = comment.content_hash
+        comment.content = 'Second'
+        comment.save()
+        assert comment.content_hash != old_hash
+        assert Comment.objects.duplicates(conversation_db, 'second').get() == comment
+
+    # The similarity index is updated when transactions are committed
+    @pytest.mark.django_db(transaction=True)
+    def test_create_comment_reports_near_duplicates(self, conversation_db):
+        user = conversation_db.author
+        comment = conversation_db.create_comment(
+            user, 'We need more bike lanes in the city center', check_limits=False)
+        other = conversation_db.create_comment(
+            user, 'We need more bike lanes in the city center!!', check_limits=False)
+        unrelated = conversation_db.create_comment(
+            user, 'Public schools should open on weekends', check_limits=False)
+
+        assert other.near_duplicates == [comment.id]
+        assert unrelated.near_duplicates == []
+        assert conversation_db.get_similar_comment_clusters() == [{comment.id, other.id}]
+
+    def test_bulk_moderation(self, conversation_db):
+        user = conversation_db.author
+        comments = [conversation_db.create_comment(user, f'comment {i}', check_limits=False)
+                    for i in range(3)]
+        ids = [c.id for c in comments]
+
+        assert Comment.objects.moderate(ids[:2], Comment.STATUS.REJECTED, 'spam') == 2
+        assert Comment.objects.moderate(ids, Comment.STATUS.REJECTED, 'spam') == 1
+        assert Comment.objects.moderate(ids[:1], Comment.STATUS.APPROVED) == 1
+
+        approved, *rejected = Comment.objects.filter(id__in=ids).order_by('id')
+        assert (approved.status, approved.rejection_reason) == ('APPROVED', '')
+        assert all(c.rejection_reason == 'spam' for c in rejected)
+        assert approved.status_changed > comments[0].status_changed
+
+
+class TestParticipationRatio:
+    @pytest.fixture
+    def users(self, db):
+        User = get_user_model()
+        return [User.objects.create(username=f'participant{i}') for i in range(3)]
+
+    @pytest.fixture
+    def comments(self, conversation_db, users):
+        comments = [
+            conversation_db.create_comment(user, f'comment {i}', check_limits=False,
+                                           status=Comment.STATUS.APPROVED)
+            for i, user in enumerate(users)
+        ]
+        comments[0].vote(users[1], Vote.AGREE)
+        comments[2].vote(users[1], Vote.DISAGREE)
+        comments[1].vote(users[0], Vote.SKIP)
+        return comments
+
+    def test_ratios_of_many_users(self, conversation_db, users, comments):
+        ratios = conversation_db.participation_ratios(users)
+        assert ratios == {users[0].id: 0.5, users[1].id: 1.0, users[2].id: 0}
+        assert conversation_db.participation_ratios(
+            get_user_model().objects.filter(id=users[1].id)) == {users[1].id: 1.0}
+
+    def test_ratios_of_many_conversations(self, conversation_db, users, comments):
+        empty = Conversation.objects.create(
+            title='Empty', question='?', author=conversation_db.author,
+            category=conversation_db.category)
+        ratios = Conversation.objects.participation_ratios(users[0])
+        assert ratios == {conversation_db.id: 0.5, empty.id: 0}
+        assert conversation_db.get_participation_ratio(users[1]) == 1.0
+
+    def test_user_data_reads_a_single_conversation(self, conversation_db, users, comments,
+                                                   django_assert_num_queries):
+        Conversation.objects.create(title='Other', question='?',
+                                    author=conversation_db.author,
+                                    category=conversation_db.category)
+        with django_assert_num_queries(1):
+            data = conversation_db.get_user_data(users[0])
+        assert data == {'participation_ratio': 0.5}
+
+    def test_single_query(self, conversation_db, users, comments,
+                          django_assert_num_queries):
+        with django_assert_num_queries(1):
+            conversation_db.participation_ratios(users)
+        with django_assert_num_queries(1):
+            Conversation.objects.participation_ratios(users[0])
+
+    def test_cached_ratios_are_invalidated_on_vote(self, conversation_db, users,
+                                                   comments):
+        user = users[2]
+        assert Conversation.objects.cached_participation_ratios(user) == {
+            conversation_db.id: 0}
+        comments[0].vote(user, Vote.AGREE)
+        assert Conversation.objects.cached_participation_ratios(user) == {
+            conversation_db.id: 0.5}
+
+
+class TestProgress:
+    def test_limit_status_from_counts(self):
+        limits = Limits(max_comments_per_conversation=5, max_comments_in_interval=3)
+        assert limits.comment_status(0, 0) == CommentLimitStatus.OK
+        assert limits.comment_status(2, 2) == CommentLimitStatus.ALERT
+        assert limits.comment_status(3, 3) == CommentLimitStatus.TEMPORARILY_BLOCKED
+        assert limits.comment_status(5, 0) == CommentLimitStatus.BLOCKED
+
+    def test_progress_matches_per_conversation_methods(self, conversation_db,
+                                                       django_assert_num_queries):
+        user = conversation_db.author
+        for i in range(3):
+            conversation_db.create_comment(user, f'comment {i}', check_limits=False)
+
+        with django_assert_num_queries(2):
+            progress = Conversation.objects.progress(user)
+        assert progress == {conversation_db.id: {
+            'votes': 0,
+            'remaining_comments': 0,
+            'participation_ratio': 0,
+            'limit_status': conversation_db.get_limit_status(user).value,
+        }}
+        assert progress[conversation_db.id]['limit_status'] == 'temporarily_blocked'
+
+
+class TestCommentStatistics:
+    @pytest.fixture
+    def comment(self, conversation_db):
+        comment = conversation_db.create_comment(
+            conversation_db.author, 'comment', check_limits=False,
+            status=Comment.STATUS.APPROVED)
+        User = get_user_model()
+        values = [Vote.AGREE, Vote.AGREE, Vote.DISAGREE, Vote.SKIP]
+        for i, value in enumerate(values):
+            comment.vote(User.objects.create(username=f'voter{i}'), value)
+        return comment
+
+    def test_get_statistics(self, comment, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            stats = comment.get_statistics()
+        assert stats == {'agree': 2, 'disagree': 1, 'skip': 1, 'total': 4}
+
+    def test_annotated_statistics(self, comment, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            [annotated] = Comment.objects.annotate_statistics()
+            stats = annotated.get_statistics()
+        assert stats == {'agree': 2, 'disagree': 1, 'skip': 1, 'total': 4}
@@ -0,0 +1,61 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from ej_conversations import moderation
+from ej_conversations.models import Comment
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def moderators(db):
+    User = get_user_model()
+    return [User.objects.create(username=f'mod{i}', is_staff=True) for i in range(2)]
+
+
+@pytest.fixture
+def pending(conversation_db):
+    user = conversation_db.author
+    return [conversation_db.create_comment(user, f'pending comment {i}', check_limits=False)
+            for i in range(5)]
+
+
+class TestModerationQueue:
+    def test_moderators_receive_disjoint_batches(self, pending, moderators):
+        first = moderation.claim(moderators[0], size=3)
+        second = moderation.claim(moderators[1], size=3)
+        assert len(first) == 3
+        assert len(second) == 2
+        assert not {c.id for c in first} & {c.id for c in second}
+        assert moderation.claim(moderators[1], size=3) == []
+
+    def test_expired_leases_are_available_again(self, pending, moderators):
+        moderation.claim(moderators[0], size=5, lease_time=-1)
+        assert len(moderation.claim(moderators[1], size=5)) == 5
+
+    def test_release_and_moderate_clear_leases(self, pending, moderators):
+        batch = moderation.claim(moderators[0], size=5)
+        assert moderation.release(moderators[0], [batch[0].id]) == 1
+        Comment.objects.moderate([batch[1].id], Comment.STATUS.APPROVED)
+        assert Comment.objects.filter(claimed_by__isnull=False).count() == 3
+        assert [c.id for c in moderation.claim(moderators[1])] == [batch[0].id]
+
+    def test_pending_index_survives_migrations(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Comment._meta.db_table)
+        assert constraints['ej_comment_pending']['columns'] == ['moderation_priority', 'created']
+
+    def test_priority_is_ranked_over_the_whole_queue(self, conversation_db, moderators):
+        User = get_user_model()
+        trusted = User.objects.create(username='trusted')
+        approved = conversation_db.create_comment(trusted, 'an approved comment',
+                                                  check_limits=False)
+        Comment.objects.moderate([approved.id], Comment.STATUS.APPROVED)
+        words = 'alpha bravo charlie delta echo foxtrot golf hotel india juliet'.split()
+        for word in words:
+            conversation_db.create_comment(conversation_db.author, f'{word} ' * 5,
+                                           check_limits=False)
+        comment = conversation_db.create_comment(trusted, 'a newer comment',
+                                                 check_limits=False)
+        assert [c.id for c in moderation.claim(moderators[0], size=1)] == [comment.id]
@@ -0,0 +1,55 @@
+import pytest
+from django.core.signals import request_started
+
+from ej_conversations import config, routers
+from ej_conversations.models import Comment, Conversation
+
+pytestmark = pytest.mark.django_db(databases=['default', 'replica'])
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    monkeypatch.setattr(config, 'REPLICA_DATABASE', 'replica')
+    routers.unpin()
+    yield
+    routers.unpin()
+
+
+class TestReplicaRouter:
+    def test_reads_use_primary_by_default(self, conversation_db, replica):
+        routers.unpin()
+        assert Conversation.objects.count() == 1
+        with routers.replica():
+            assert Conversation.objects.count() == 0
+        assert routers.on_replica(Conversation.objects.all()).count() == 0
+
+    def test_writes_pin_the_thread_to_primary(self, conversation_db, replica):
+        with routers.replica():
+            conversation_db.create_comment(conversation_db.author, 'hello',
+                                           check_limits=False)
+            assert routers.is_pinned()
+            assert Comment.objects.count() == 1
+            assert routers.on_replica(Comment.objects.all()).count() == 1
+
+        request_started.send(sender=None)
+        assert not routers.is_pinned()
+        assert routers.on_replica(Comment.objects.all()).count() == 0
+
+    def test_primary_block(self, conversation_db, replica):
+        routers.unpin()
+        with routers.replica(), routers.primary():
+            assert Conversation.objects.count() == 1
+        assert not routers.is_pinned()
+
+    def test_statistics_read_from_replica(self, conversation_db, replica):
+        conversation_db.create_comment(conversation_db.author, 'hello',
+                                       check_limits=False)
+        routers.unpin()
+        assert conversation_db.get_statistics()['comments']['total'] == 0
+        with routers.primary():
+            assert conversation_db.get_statistics()['comments']['total'] == 1
+
+    def test_inactive_without_replica_alias(self, conversation_db):
+        with routers.replica():
+            assert Conversation.objects.count() == 1
+        assert routers.on_replica(Conversation.objects.all()).count() == 1
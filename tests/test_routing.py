@@ -0,0 +1,84 @@
+from random import Random
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from ej_conversations import routing
+from ej_conversations.models import Comment, Vote
+
+
+class TestStrategies:
+    def test_fewest_votes_prefers_new_comments(self):
+        assert routing.fewest_votes(0, 0, 0, 0) > routing.fewest_votes(5, 5, 0, 0)
+
+    def test_divisiveness(self):
+        assert routing.divisiveness(1, 1, 1, 0) == pytest.approx(1.0)
+        assert routing.divisiveness(10, 0, 0, 0) == 0
+
+    def test_recency(self):
+        assert routing.recency(0, 0, 0, 0) == 1
+        assert routing.recency(0, 0, 0, 2 * 24 * 60 * 60) == pytest.approx(0.25)
+
+
+class TestWeightTable:
+    def test_sample_follows_weights(self):
+        table = routing.WeightTable([1, 2], [10, 10], [1, 3])
+        random = Random(0)
+        draws = [table.sample(None, random=random) for _ in range(4000)]
+        assert 0.7 < draws.count(2) / len(draws) < 0.8
+
+    def test_sample_excludes_voted_and_own_comments(self):
+        table = routing.WeightTable([1, 2, 3], [10, 20, 30], [100, 100, 0])
+        assert table.sample(20, exclude={1}) == 3
+        assert table.sample(30, exclude={1, 2}) is None
+        assert routing.WeightTable([], [], []).sample(1) is None
+
+
+@pytest.mark.django_db
+class TestNextComment:
+    @pytest.fixture
+    def comments(self, conversation_db):
+        author = conversation_db.author
+        return [conversation_db.create_comment(author, f'comment {i}',
+                                               check_limits=False,
+                                               status=Comment.STATUS.APPROVED)
+                for i in range(3)]
+
+    @pytest.mark.parametrize('strategy', sorted(routing.STRATEGIES))
+    def test_strategies_return_unvoted_comments(self, conversation_db, comments,
+                                                strategy):
+        user = get_user_model().objects.create(username='participant')
+        comments[0].vote(user, Vote.AGREE)
+        comments[1].vote(user, Vote.SKIP)
+        for _ in range(5):
+            assert conversation_db.get_next_comment(user, strategy=strategy) == comments[2]
+        comments[2].vote(user, Vote.AGREE)
+        assert conversation_db.get_next_comment(user, None, strategy=strategy) is None
+
+    def test_comments_missing_from_table_are_still_reachable(self, conversation_db,
+                                                             comments):
+        user = get_user_model().objects.create(username='participant')
+        routing.get_table(conversation_db.id, 'fewest_votes')
+        new = conversation_db.create_comment(conversation_db.author, 'new',
+                                             check_limits=False,
+                                             status=Comment.STATUS.APPROVED)
+        for comment in comments:
+            comment.vote(user, Vote.AGREE)
+        assert conversation_db.get_next_comment(user, strategy='fewest_votes') == new
+
+    def test_tables_are_built_outside_the_global_lock(self, conversation_db,
+                                                      comments, monkeypatch):
+        build_table = routing.build_table
+
+        def checked_build_table(*args):
+            assert not routing._tables_lock.locked()
+            return build_table(*args)
+
+        monkeypatch.setattr(routing, 'build_table', checked_build_table)
+        table = routing.get_table(conversation_db.id, 'uniform')
+        assert routing.get_table(conversation_db.id, 'uniform') is table
+        assert not routing._loading_locks
+
+    def test_invalid_strategy(self, conversation_db, comments):
+        with pytest.raises(ValueError):
+            conversation_db.get_next_comment(conversation_db.author, strategy='bad')
@@ -0,0 +1,71 @@
+import pytest
+from django.contrib.auth import get_user_model
+
+from ej_conversations import scores
+from ej_conversations.models import Vote
+
+np = pytest.importorskip('numpy')
+
+
+class TestScores:
+    agree = np.array([10, 0, 5, 1, 0])
+    disagree = np.array([0, 10, 5, 0, 0])
+    skip = np.array([0, 0, 0, 0, 0])
+
+    def test_agreement(self):
+        result = scores.agreement(self.agree, self.disagree, self.skip)
+        assert result.tolist() == [1.0, 0.0, 0.5, 1.0, 0.0]
+
+    def test_divisiveness(self):
+        result = scores.divisiveness(np.array([1, 3, 0]), np.array([1, 0, 0]),
+                                     np.array([1, 0, 0]))
+        assert result.tolist() == pytest.approx([1.0, 0.0, 0.0])
+
+    def test_confidence_favors_more_votes(self):
+        result = scores.confidence(self.agree, self.disagree, self.skip)
+        assert result[0] > result[3] > 0
+        assert result[4] == 0
+        assert (result <= scores.agreement(self.agree, self.disagree, self.skip)).all()
+
+    def test_ordering_breaks_ties_by_id(self):
+        ids = np.array([5, 3, 4])
+        assert scores.ordering(ids, np.array([1.0, 2.0, 1.0])).tolist() == [4, 5, 3]
+        assert scores.ordering(ids, np.array([1.0, 2.0, 1.0]),
+                               descending=True).tolist() == [3, 4, 5]
+
+
+@pytest.mark.django_db
+class TestCommentOrdering:
+    @pytest.fixture
+    def comments(self, conversation_db):
+        author = conversation_db.author
+        User = get_user_model()
+        users = [User.objects.create(username=f'voter{i}') for i in range(4)]
+        votes = {
+            'consensus': [Vote.AGREE] * 4,
+            'divisive': [Vote.AGREE, Vote.DISAGREE, Vote.SKIP, Vote.AGREE],
+            'rejected': [Vote.DISAGREE] * 2,
+        }
+        comments = {}
+        for content, values in votes.items():
+            comment = conversation_db.create_comment(
+                author, content, check_limits=False, status='APPROVED')
+            for user, value in zip(users, values):
+                comment.vote(user, value)
+            comments[content] = comment
+        return comments
+
+    def test_vote_counts(self, conversation_db, comments):
+        ids, agree, disagree, skip = scores.vote_counts(conversation_db)
+        assert ids.tolist() == sorted(c.id for c in comments.values())
+        assert agree.sum() == 6 and disagree.sum() == 3 and skip.sum() == 1
+
+    def test_approved_comments_ordering(self, conversation_db, comments, client):
+        url = f'/conversations/{conversation_db.slug}/approved_comments/'
+        response = client.get(url + '?ordering=-divisiveness')
+        assert [c['content'] for c in response.data] == \
+            ['divisive', 'consensus', 'rejected']
+        response = client.get(url + '?ordering=-confidence')
+        assert [c['content'] for c in response.data] == \
+            ['consensus', 'divisive', 'rejected']
+        assert client.get(url + '?ordering=bad').status_code == 400
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+from django.db import connection, transaction
+
+from ej_conversations import config, similarity
+from ej_conversations.models import Comment
+
+pytestmark = pytest.mark.django_db
+
+TEXT = 'We need more bike lanes in the city center'
+
+
+@pytest.fixture
+def comments(conversation_db):
+    author = conversation_db.author
+    return [conversation_db.create_comment(author, f'{TEXT} {i}', check_limits=False)
+            for i in range(3)]
+
+
+def other_process_insert(conversation, **kwargs):
+    """
+    Insert a comment without sending signals, like another process would.
+    """
+    kwargs.setdefault('content', TEXT + '!')
+    comment = Comment(conversation=conversation, author=conversation.author, **kwargs)
+    comment.minhash = similarity.dump_signature(similarity.minhash(comment.content))
+    Comment.objects.bulk_create([comment])
+    return Comment.objects.get(content=comment.content)
+
+
+def wait_for_rebuild(index, timeout=5):
+    deadline = time.monotonic() + timeout
+    while index.replaced_by is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return index.replaced_by
+
+
+class TestIndexRefresh:
+    # The index is rebuilt by a thread with its own database connection
+    @pytest.mark.django_db(transaction=True)
+    def test_rebuild_sees_changes_of_other_processes(self, conversation_db, comments,
+                                                     monkeypatch):
+        conversation_id = conversation_db.id
+        index = similarity.get_index(conversation_id)
+        assert set(index.signatures) == {c.id for c in comments}
+
+        # Comments with lower ids may be committed by other processes after
+        # comments created locally.
+        Comment.objects.filter(id=comments[0].id).update(id=10_000)
+        other = other_process_insert(conversation_db, id=comments[0].id)
+        Comment.objects.filter(id=comments[1].id).update(status=Comment.STATUS.REJECTED)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM ej_conversations_comment WHERE id = %s',
+                           [comments[2].id])
+        assert similarity.get_index(conversation_id) is index
+
+        monkeypatch.setattr(config, 'SIMILARITY_REFRESH_TIME', -1)
+        assert similarity.get_index(conversation_id) is index
+        index = wait_for_rebuild(index)
+        assert set(index.signatures) == {other.id, comments[1].id, 10_000}
+        assert index.status[comments[1].id] == Comment.STATUS.REJECTED
+
+    def test_local_changes_during_rebuild_are_kept(self, conversation_db, comments,
+                                                   monkeypatch):
+        conversation_id = conversation_db.id
+        old_index = similarity.get_index(conversation_id)
+        build_index = similarity.build_index
+
+        def slow_build(conversation_id):
+            new_index = build_index(conversation_id)
+            similarity.unindex_comment(comments[0])
+            return new_index
+
+        monkeypatch.setattr(similarity, 'build_index', slow_build)
+        new_index = similarity.rebuild_index(conversation_id, old_index)
+        assert comments[0].id not in new_index
+        assert similarity.get_index(conversation_id) is new_index
+
+        # Changes sent to the replaced index are forwarded
+        old_index.record('remove', comments[1].id)
+        assert comments[1].id not in new_index
+
+    @pytest.mark.django_db(transaction=True)
+    def test_rolled_back_comments_are_not_indexed(self, conversation_db, comments):
+        index = similarity.get_index(conversation_db.id)
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                rolled_back = conversation_db.create_comment(
+                    conversation_db.author, f'{TEXT} rolled back', check_limits=False)
+                raise RuntimeError
+        assert rolled_back.id not in index
+
+        comment = conversation_db.create_comment(
+            conversation_db.author, f'{TEXT} committed', check_limits=False)
+        assert comment.id in index
+
+    def test_number_of_indexes_is_bounded(self, monkeypatch):
+        monkeypatch.setattr(config, 'SIMILARITY_MAX_INDEXES', 2)
+        for conversation_id in [1, 2, 1, 3]:
+            similarity.get_index(conversation_id)
+        assert list(similarity._indexes) == [1, 3]
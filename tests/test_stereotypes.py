@@ -0,0 +1,93 @@
+import pytest
+from django.contrib.auth import get_user_model
+
+from ej_conversations import stereotypes
+from ej_conversations.models import Comment, Stereotype, StereotypeVote, Vote
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def comments(conversation_db):
+    author = conversation_db.author
+    return [conversation_db.create_comment(author, f'comment {i}', check_limits=False,
+                                           status=Comment.STATUS.APPROVED)
+            for i in range(3)]
+
+
+@pytest.fixture
+def stereotype():
+    return Stereotype.objects.create(name='optimist')
+
+
+class TestStereotypeVotes:
+    def test_upsert(self, comments, stereotype, django_assert_max_num_queries):
+        values = {comments[0].id: Vote.AGREE, comments[1].id: Vote.DISAGREE}
+        assert StereotypeVote.objects.upsert(stereotype, values) == (2, 0)
+
+        values = {comments[1].id: Vote.AGREE, comments[2].id: Vote.SKIP}
+        with django_assert_max_num_queries(5):
+            assert StereotypeVote.objects.upsert(stereotype, values) == (1, 1)
+        assert dict(stereotype.stereotype_votes.values_list('comment_id', 'value')) == {
+            comments[0].id: Vote.AGREE,
+            comments[1].id: Vote.AGREE,
+            comments[2].id: Vote.SKIP,
+        }
+
+    def test_votes_endpoint(self, conversation_db, comments, stereotype, admin_client):
+        url = f'/stereotypes/{stereotype.id}/votes/'
+        data = {
+            'conversation': conversation_db.slug,
+            'votes': [{'comment': c.id, 'value': Vote.AGREE} for c in comments],
+        }
+        response = admin_client.post(url, data, content_type='application/json')
+        assert response.data == {'created': 3, 'updated': 0}
+        assert list(stereotype.conversations.all()) == [conversation_db]
+        assert admin_client.get(url).data == [
+            {'comment': c.id, 'value': Vote.AGREE} for c in comments
+        ]
+
+        data['votes'] = [{'comment': 0, 'value': Vote.AGREE}]
+        response = admin_client.post(url, data, content_type='application/json')
+        assert response.status_code == 400
+
+
+class TestRanking:
+    @pytest.fixture
+    def voters(self, comments):
+        pytest.importorskip('numpy')
+        User = get_user_model()
+        votes = {
+            'ally': [Vote.AGREE, Vote.AGREE, Vote.DISAGREE],
+            'opponent': [Vote.DISAGREE, Vote.DISAGREE, Vote.AGREE],
+            'partial': [Vote.AGREE, None, Vote.AGREE],
+        }
+        users = {}
+        for name, values in votes.items():
+            user = users[name] = User.objects.create(username=name)
+            for comment, value in zip(comments, values):
+                if value is not None:
+                    comment.vote(user, value)
+        return users
+
+    def test_rank_participants(self, conversation_db, comments, stereotype, voters):
+        values = [Vote.AGREE, Vote.AGREE, Vote.DISAGREE]
+        StereotypeVote.objects.upsert(
+            stereotype, {c.id: v for c, v in zip(comments, values)})
+
+        ranking = stereotypes.rank_participants(conversation_db, [stereotype])
+        assert ranking[stereotype.id] == [
+            (voters['ally'].id, 1.0, 3),
+            (voters['partial'].id, 0.5, 2),
+            (voters['opponent'].id, 0.0, 3),
+        ]
+
+    def test_ranking_endpoint(self, conversation_db, comments, stereotype, voters,
+                              admin_client):
+        StereotypeVote.objects.upsert(stereotype, {comments[0].id: Vote.AGREE})
+        url = f'/stereotypes/{stereotype.id}/ranking/?conversation={conversation_db.slug}'
+        response = admin_client.get(url + '&limit=2')
+        assert response.data == [
+            {'username': 'ally', 'agreement': 1.0, 'common': 1},
+            {'username': 'partial', 'agreement': 1.0, 'common': 1},
+        ]
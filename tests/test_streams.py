@@ -0,0 +1,136 @@
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from ej_conversations import config, signals, streams
+from ej_conversations.models import Comment, Vote
+
+
+class TestStatisticsChannel:
+    def test_apply_delta_merges_nested_counts(self):
+        stats = {'votes': {'agree': 1, 'total': 1}, 'participants': 1}
+        streams.apply_delta(stats, {'votes': {'skip': 1, 'total': 1},
+                                    'participants': 1})
+        assert stats == {'votes': {'agree': 1, 'skip': 1, 'total': 2},
+                         'participants': 2}
+
+    def test_publish_fans_out_to_all_subscribers(self):
+        channel = streams.StatisticsChannel(conversation_id=1)
+        channel.snapshot = {'votes': {'agree': 0, 'total': 0}}
+        queues = [channel.subscribe() for _ in range(3)]
+        channel.publish({'votes': {'agree': 1, 'total': 1}})
+
+        assert channel.snapshot == {'votes': {'agree': 1, 'total': 1}}
+        for queue in queues:
+            assert queue.get_nowait() == ('delta', {'votes': {'agree': 1, 'total': 1}})
+
+    def test_slow_subscriber_receives_snapshot(self):
+        channel = streams.StatisticsChannel(conversation_id=1)
+        channel.snapshot = {'participants': 0}
+        queue = channel.subscribe()
+        for _ in range(queue.maxsize + 1):
+            channel.publish({'participants': 1})
+
+        event, data = queue.get_nowait()
+        assert event == 'statistics'
+        assert data == {'participants': queue.maxsize + 1}
+
+    def test_publish_without_subscribers_is_noop(self):
+        assert not streams.has_subscribers(42)
+        streams.publish(42, {'participants': 1})
+        assert not streams.has_subscribers(42)
+
+    def test_refresh_replaces_drifted_snapshot(self, conversation_db, monkeypatch):
+        monkeypatch.setattr(config, 'STATISTICS_REFRESH_TIME', 60)
+        channel = streams.StatisticsChannel(conversation_db.id)
+        queue = channel.subscribe()
+        expected = channel.get_snapshot()
+        assert not channel.refresh()
+
+        channel.snapshot['participants'] = 42
+        channel.updated -= 60
+        assert channel.seconds_to_refresh() == 0
+        assert channel.refresh()
+        assert queue.get_nowait() == ('statistics', expected)
+        assert channel.get_snapshot() == expected
+
+
+@pytest.fixture
+def subscription(conversation_db, monkeypatch):
+    # Tests run inside a transaction that is never committed
+    monkeypatch.setattr(signals, 'publish_on_commit', streams.publish)
+    channel, queue = streams.subscribe(conversation_db.id)
+    channel.get_snapshot()
+    yield queue
+    streams.release_channel(channel, queue)
+
+
+def events(queue):
+    result = []
+    while not queue.empty():
+        result.append(queue.get_nowait())
+    return result
+
+
+class TestChannels:
+    def test_subscribe_and_release(self):
+        channel, queue = streams.subscribe(42)
+        assert streams.has_subscribers(42)
+        other_channel, other_queue = streams.subscribe(42)
+        assert other_channel is channel
+
+        streams.release_channel(channel, queue)
+        assert streams.has_subscribers(42)
+        streams.release_channel(channel, other_queue)
+        assert not streams.has_subscribers(42)
+
+
+class TestSignals:
+    def test_votes_publish_deltas(self, conversation_db, subscription):
+        author = conversation_db.author
+        comment = conversation_db.create_comment(author, 'Hello', check_limits=False,
+                                                 status=Comment.STATUS.APPROVED)
+        user = get_user_model().objects.create(username='voter')
+        vote = comment.vote(user, Vote.AGREE)
+        assert events(subscription)[-1] == \
+            ('delta', {'votes': {'agree': 1, 'total': 1}, 'participants': 1})
+
+        other = conversation_db.create_comment(author, 'Bye', check_limits=False,
+                                               status=Comment.STATUS.APPROVED)
+        other.vote(user, Vote.SKIP)
+        events(subscription)
+        Vote.objects.get(id=vote.id).delete()
+        assert events(subscription) == [('delta', {'votes': {'agree': -1, 'total': -1}})]
+
+        Vote.objects.get(comment=other, author=user).delete()
+        assert events(subscription) == \
+            [('delta', {'votes': {'skip': -1, 'total': -1}, 'participants': -1})]
+
+    def test_moderation_publishes_deltas(self, conversation_db, subscription):
+        author = conversation_db.author
+        comment = conversation_db.create_comment(author, 'Hello', check_limits=False)
+        assert events(subscription) == [('delta', {'comments': {'pending': 1, 'total': 1}})]
+
+        Comment.objects.moderate([comment.id], Comment.STATUS.APPROVED)
+        assert events(subscription) == [('delta', {'comments': {'pending': -1, 'approved': 1}})]
+
+
+class TestStreamEndpoint:
+    def test_stream_starts_with_snapshot(self, conversation_db, client):
+        response = client.get('/conversations/conversation/stream/')
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/event-stream'
+
+        content = iter(response.streaming_content)
+        event = next(content).decode()
+        assert event.startswith('event: statistics\n')
+        snapshot = json.loads(event.split('data: ', 1)[1])
+        assert snapshot == conversation_db.get_statistics()
+        assert streams.has_subscribers(conversation_db.id)
+
+        response.close()
+        assert not streams.has_subscribers(conversation_db.id)
+
+    def test_missing_conversation(self, db, client):
+        assert client.get('/conversations/missing/stream/').status_code == 404
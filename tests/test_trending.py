@@ -0,0 +1,75 @@
+import datetime
+import math
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from ej_conversations import config, trending
+from ej_conversations.models import Comment, Conversation, Vote
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def conversations(conversation_db):
+    author = conversation_db.author
+    other = conversation_db.category.new_conversation('Other?', 'Other', author)
+    return conversation_db, other
+
+
+def vote(conversation, n):
+    author = conversation.author
+    comment = conversation.create_comment(author, f'comment {n}', check_limits=False,
+                                          status=Comment.STATUS.APPROVED)
+    User = get_user_model()
+    for i in range(n):
+        user, _ = User.objects.get_or_create(username=f'voter{i}')
+        comment.vote(user, Vote.AGREE)
+
+
+def score(conversation):
+    conversation.refresh_from_db()
+    return conversation.trending_score
+
+
+class TestTrending:
+    def test_scores_decay(self):
+        now = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+        half_life = datetime.timedelta(seconds=config.TRENDING_HALF_LIFE)
+        a = trending.event_score(2.0, now)
+        b = trending.event_score(1.0, now + half_life)
+        assert trending.decayed_score(a, now) == pytest.approx(2.0)
+        assert trending.decayed_score(a, now + half_life) == pytest.approx(1.0)
+        total = trending.add_scores(a, b)
+        assert trending.decayed_score(total, now + half_life) == pytest.approx(2.0)
+        assert trending.add_scores(trending.NO_SCORE, a) == a
+
+    def test_activity_updates_scores(self, conversations):
+        first, second = conversations
+        assert score(first) == score(second) == trending.NO_SCORE
+
+        vote(first, 1)
+        vote(second, 3)
+        assert score(second) > score(first) > trending.NO_SCORE
+        expected = config.TRENDING_COMMENT_WEIGHT + 3 * config.TRENDING_VOTE_WEIGHT
+        assert trending.decayed_score(score(second)) == pytest.approx(expected, rel=1e-3)
+
+        incremental = [score(first), score(second)]
+        call_command('recomputetrending')
+        assert [score(first), score(second)] == pytest.approx(incremental)
+
+    def test_record_activity_uses_event_time(self, conversation_db):
+        now = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+        trending.record_activity(conversation_db.id, 1.0, now)
+        trending.record_activity(conversation_db.id, 1.0, now)
+        assert score(conversation_db) == pytest.approx(
+            trending.event_score(1.0, now) + math.log(2))
+
+    def test_trending_ordering(self, conversations, client):
+        first, second = conversations
+        vote(second, 2)
+        data = client.get('/conversations/?ordering=trending').data['results']
+        assert [c['slug'] for c in data] == [second.slug, first.slug]
+        assert client.get('/conversations/?ordering=bad').status_code == 200
+        assert Conversation.objects.order_by('-trending_score').first() == second
@@ -13,5 +13,6 @@ router = register_routes(DefaultRouter(), register_user=True)
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^', include(router.urls)),
+    url(r'^', include('ej_conversations.urls')),
     url(r'^__debug__/', include(debug_toolbar.urls)),
 ]